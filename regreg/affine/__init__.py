@@ -34,7 +34,33 @@ class AffineError(Exception):
     pass
 
 
+def float_dtype(obj):
+    """ Floating point type to carry out computations with `obj` in
+
+    Parameters
+    ----------
+    obj : object
+        An ndarray, sparse matrix, transform or anything else
+        with a `dtype` attribute, or a dtype itself.
+
+    Returns
+    -------
+    dtype : np.dtype
+        float32 if `obj` holds single (or lower) precision floats,
+        else float64.
+    """
+    if not isinstance(obj, np.dtype):
+        obj = getattr(obj, 'dtype', None)
+        if obj is None:
+            return np.dtype(np.float64)
+    if obj in [np.float16, np.float32]:
+        return np.dtype(np.float32)
+    return np.dtype(np.float64)
+
+
 class affine_transform(object):
+
+    dtype = np.dtype(np.float64)
     
     def __init__(self, linear_operator, affine_offset, diag=False, input_shape=None):
         """ Create affine transform
@@ -44,6 +70,8 @@ class affine_transform(object):
         linear_operator : None or ndarray or sparse array or affine_transform
             Linear part of affine transform implemented as array or as
             affine_transform.  None results in no linear component.
+            Single precision arrays are kept in single precision, see
+            `float_dtype`.
         affine_offset : None or ndarray
             offset component of affine.  Only one of `linear_operator` and
             `affine_offset` can be None, because we need an input array to
@@ -67,6 +95,10 @@ class affine_transform(object):
         else:
             self.affine_offset = affine_offset
         self.linear_operator = linear_operator
+        if linear_operator is None:
+            self.dtype = float_dtype(self.affine_offset)
+        else:
+            self.dtype = float_dtype(linear_operator)
 
         if linear_operator is None:
             self.noneD = True
@@ -407,6 +439,7 @@ class normalize(object):
         self.value = value
         self.output_shape = (n,)
         self.input_shape = (p,)
+        self.dtype = float_dtype(M)
 
         self.sparseM = sparse.isspmatrix(M)
         self.intercept_column = intercept_column
@@ -427,11 +460,12 @@ class normalize(object):
             if self.inplace and self.sparseM:
                 raise ValueError('resulting matrix will not be sparse if centering performed inplace')
 
+            # column summaries are accumulated in float64
             if not self.sparseM:
-                col_means = M.mean(0)
+                col_means = M.mean(0, dtype=np.float64)
             else:
                 tmp = M.copy()
-                col_means = np.asarray(tmp.mean(0)).reshape(-1)
+                col_means = np.asarray(tmp.mean(0, dtype=np.float64)).reshape(-1)
                 tmp.data **= 2
 
             if self.intercept_column is not None:
@@ -439,9 +473,9 @@ class normalize(object):
 
             if self.scale:
                 if not self.sparseM:
-                    self.col_stds = np.sqrt((np.sum(M**2,0) - n * col_means**2) / n) / np.sqrt(self.value)
+                    self.col_stds = np.sqrt((np.sum(M**2,0,dtype=np.float64) - n * col_means**2) / n) / np.sqrt(self.value)
                 else:
-                    self.col_stds = np.sqrt((np.asarray(tmp.sum(0)).reshape(-1) - n * col_means**2) / n) / np.sqrt(self.value)
+                    self.col_stds = np.sqrt((np.asarray(tmp.sum(0,dtype=np.float64)).reshape(-1) - n * col_means**2) / n) / np.sqrt(self.value)
                 if self.intercept_column is not None:
                     self.col_stds[self.intercept_column] = 1. / np.sqrt(self.value)
 
@@ -455,11 +489,11 @@ class normalize(object):
                     self.scale = False
         elif self.scale:
             if not self.sparseM:
-                self.col_stds = np.sqrt(np.sum(M**2,0) / n) / np.sqrt(self.value)
+                self.col_stds = np.sqrt(np.sum(M**2,0,dtype=np.float64) / n) / np.sqrt(self.value)
             else:
                 tmp = M.copy()
                 tmp.data **= 2
-                self.col_stds = np.sqrt((tmp.sum(0)) / n) / np.sqrt(self.value)
+                self.col_stds = np.sqrt(np.asarray(tmp.sum(0,dtype=np.float64)).reshape(-1) / n) / np.sqrt(self.value)
             if self.intercept_column is not None:
                 self.col_stds[self.intercept_column] = 1. / np.sqrt(self.value)
             if self.inplace:
@@ -468,6 +502,9 @@ class normalize(object):
                 # no need to do it again
                 self.col_stds = None
                 self.scale = False
+        if self.scale:
+            # applied in the precision of M
+            self.col_stds = self.col_stds.astype(self.dtype)
         self.affine_offset = None
         
     def linear_map(self, x):
@@ -531,7 +568,10 @@ class normalize(object):
         else:
             v = np.dot(u.T, self.M).T
         if self.scale:
-            v /= self.col_stds
+            if v.ndim == 1:
+                v /= self.col_stds
+            else:
+                v /= self.col_stds[:,np.newaxis]
         if self.intercept_column is not None:
             v[self.intercept_column] = u_mean * u.shape[0]
         return v
@@ -587,14 +627,15 @@ class normalize(object):
         
         new_obj = normalize.__new__(normalize)
         new_obj.sparseM = self.sparseM
+        new_obj.dtype = self.dtype
 
         # explicitly assumes there is no intercept column
         new_obj.intercept_column = None
         new_obj.value = self.value
-        try:
+        if self.sparseM:
+            new_obj.M = self._csc()[:,index_obj]
+        else:
             new_obj.M = self.M[:,index_obj]
-        except TypeError: # sparse matrix is of wrong format
-            new_obj.M = self.M.tolil()[:,index_obj].tocsc()
 
         new_obj.input_shape = (new_obj.M.shape[1],)
         new_obj.output_shape = (self.M.shape[0],)
@@ -611,6 +652,268 @@ class normalize(object):
         else:
             raise ValueError('only possible to extract matrix if normalization was done inplace')
 
+    def select_rows(self, rows, statistics=None):
+        """
+        The normalize transform of the rows of M given by rows, sharing
+        M with self instead of copying the rows. 
+
+        Parameters
+        ----------
+
+        rows : ndarray
+            Indices (or a boolean mask) of the rows to keep.
+
+        statistics : normalize_rows
+            If not None, the column means and stds are taken from 
+            statistics, as for a held-out set normalized as a training set.
+            Otherwise they are computed from the column sums of M 
+            (computed once and shared by all the transforms selected
+            from self) minus the sums over the other rows.
+
+        Returns
+        -------
+
+        n : normalize_rows
+
+        """
+        return normalize_rows(self, rows, statistics=statistics)
+
+    def _column_sums(self):
+        """
+        The sums and sums of squares of the columns of M
+        in float64, computed once.
+        """
+        if not hasattr(self, '_col_sums'):
+            self._col_sums = _column_sums(self.M)
+        return self._col_sums
+
+    def _csc(self):
+        """
+        A sparse M in CSC format, computed once, so that 
+        slicing columns is proportional to the number of nonzero
+        entries in the columns rather than in M.
+        """
+        if not hasattr(self, '_csc_M'):
+            self._csc_M = self.M.tocsc()
+        return self._csc_M
+
+    def _csr(self):
+        """
+        A sparse M in CSR format, computed once, so that 
+        slicing rows is proportional to the number of nonzero
+        entries in the rows rather than in M.
+        """
+        if not hasattr(self, '_csr_M'):
+            self._csr_M = self.M.tocsr()
+        return self._csr_M
+
+def _column_sums(M):
+    if sparse.isspmatrix(M):
+        sums = np.asarray(M.sum(0, dtype=np.float64)).reshape(-1)
+        sumsq = np.asarray(M.multiply(M).sum(0, dtype=np.float64)).reshape(-1)
+    else:
+        sums = np.sum(M, 0, dtype=np.float64)
+        sumsq = np.sum(M**2, 0, dtype=np.float64)
+    return sums, sumsq
+
+def _row_column_sums(M, rows, chunk=1024):
+    """
+    The sums and sums of squares in float64 of the columns of M 
+    over rows, accumulated over the runs of consecutive rows without 
+    copying them. A sparse M should be in CSR format.
+    """
+    p = M.shape[1]
+    sums, sumsq = np.zeros(p), np.zeros(p)
+    rows = np.sort(rows)
+    if rows.shape[0] == 0:
+        return sums, sumsq
+    breaks = np.nonzero(np.diff(rows) != 1)[0] + 1
+    starts = rows[np.hstack([0, breaks])]
+    ends = rows[np.hstack([breaks - 1, rows.shape[0] - 1])] + 1
+    for start, end in zip(starts, ends):
+        if sparse.isspmatrix(M):
+            lo, hi = M.indptr[start], M.indptr[end]
+            data = np.asarray(M.data[lo:hi], np.float64)
+            sums += np.bincount(M.indices[lo:hi], weights=data, minlength=p)
+            sumsq += np.bincount(M.indices[lo:hi], weights=data**2, minlength=p)
+        else:
+            for lo in range(start, end, chunk):
+                block = M[lo:min(lo + chunk, end)]
+                sums += block.sum(0, dtype=np.float64)
+                sumsq += np.einsum('ij,ij->j', block, block, dtype=np.float64)
+    return sums, sumsq
+
+class normalize_rows(normalize):
+
+    '''
+    Normalize the columns of a subset of the rows of a matrix,
+    sharing the matrix with the normalize it was selected from
+    (see `normalize.select_rows`). A sparse matrix is kept in CSR format.
+
+    Products with a run of consecutive rows use a view of it. 
+    Products with at most half of the rows use a copy of them that 
+    is not kept, so they cost time proportional to the number of rows 
+    selected. Otherwise, products use all of the rows of the 
+    matrix and keep those selected.
+    '''
+
+    def __init__(self, parent, rows, statistics=None):
+        if parent.inplace:
+            raise ValueError('rows can not be selected after normalizing in place')
+        M = parent.M
+        n = M.shape[0]
+        rows = np.asarray(rows)
+        if rows.dtype == np.bool:
+            rows = np.nonzero(rows)[0]
+        self.rows = rows
+        self.M = M
+        if parent.sparseM:
+            # the folds of a design share its CSC and CSR copies
+            self._csc_M = parent._csc()
+            self.M = parent._csr()
+        self._row_slice = None
+        if rows.shape[0] and np.all(np.diff(rows) == 1):
+            self._row_slice = slice(rows[0], rows[-1] + 1)
+        self.sparseM = parent.sparseM
+        self.dtype = parent.dtype
+        self.value = parent.value
+        self.center = parent.center
+        self.scale = parent.scale
+        self.inplace = False
+        self.intercept_column = parent.intercept_column
+        self.output_shape = (rows.shape[0],)
+        self.input_shape = parent.input_shape
+        self.affine_offset = None
+
+        # sums over the selected rows, from the smaller of the
+        # selected and the other rows
+        if 2 * rows.shape[0] <= n:
+            sums, sumsq = _row_column_sums(self.M, rows)
+        else:
+            other = np.ones(n, np.bool)
+            other[rows] = False
+            total_sums, total_sumsq = parent._column_sums()
+            other_sums, other_sumsq = _row_column_sums(self.M, np.nonzero(other)[0])
+            sums, sumsq = total_sums - other_sums, total_sumsq - other_sumsq
+        self._row_sums = sums, sumsq
+
+        if statistics is not None:
+            self.col_means = statistics.col_means
+            if self.scale:
+                self.col_stds = statistics.col_stds
+            return
+
+        nrow = rows.shape[0]
+        col_means = sums / nrow
+        if self.center:
+            self.col_means = col_means
+        else:
+            self.col_means = np.zeros_like(col_means)
+        if self.scale:
+            if self.center:
+                col_vars = np.maximum(sumsq / nrow - col_means**2, 0)
+            else:
+                col_vars = sumsq / nrow
+            self.col_stds = np.sqrt(col_vars) / np.sqrt(self.value)
+            if self.intercept_column is not None:
+                self.col_stds[self.intercept_column] = 1. / np.sqrt(self.value)
+            # applied in the precision of M
+            self.col_stds = self.col_stds.astype(self.dtype)
+
+    def linear_map(self, x):
+        if self.intercept_column is not None:
+            if self.scale and self.value != 1:
+                x_intercept = x[self.intercept_column] * np.sqrt(self.value)
+            else:
+                x_intercept = x[self.intercept_column]
+        if self.scale:
+            if x.ndim == 1:
+                x = x / self.col_stds
+            elif x.ndim == 2:
+                x = x / self.col_stds[:,np.newaxis]
+            else:
+                raise ValueError('normalize only implemented for 1D and 2D inputs')
+        block = self._row_block()
+        if block is None:
+            if self.sparseM:
+                v = (self.M * x)[self.rows]
+            else:
+                v = np.dot(self.M, x)[self.rows]
+        elif self.sparseM:
+            v = block * x
+        else:
+            v = np.dot(block, x)
+        if self.center:
+            v -= np.dot(self.col_means, x)
+            if self.intercept_column is not None:
+                v += x_intercept
+        return v
+
+    def adjoint_map(self, u):
+        u_sum = u.sum(0)
+        block = self._row_block()
+        if block is None:
+            block = self.M
+            full_u = np.zeros((self.M.shape[0],) + u.shape[1:], u.dtype)
+            full_u[self.rows] = u
+            u = full_u
+        if self.sparseM:
+            v = (u.T * block).T
+        else:
+            v = np.dot(u.T, block).T
+        if self.center:
+            v -= np.multiply.outer(self.col_means, u_sum)
+        if self.scale:
+            if v.ndim == 1:
+                v /= self.col_stds
+            else:
+                v /= self.col_stds[:,np.newaxis]
+        if self.intercept_column is not None and self.center:
+            v[self.intercept_column] = u_sum
+        return v
+
+    def _row_block(self):
+        """
+        The selected rows of M, or None if products with them
+        should use all of M (see the class docstring).
+        """
+        if self._row_slice is not None:
+            return self.M[self._row_slice]
+        if 2 * self.rows.shape[0] <= self.M.shape[0]:
+            if self.sparseM:
+                return self.M[self.rows]
+            return np.take(self.M, self.rows, axis=0)
+        return None
+
+    def slice_columns(self, index_obj):
+        """
+        The transform with the columns in index_obj, still 
+        sharing the rows of M. As for `normalize.slice_columns`,
+        intercept_column is set to None.
+        """
+        if type(index_obj) not in [type(slice(0,4)), type([])]:
+            if index_obj.dtype == np.bool:
+                index_obj = np.nonzero(index_obj)[0]
+
+        new_obj = normalize_rows.__new__(normalize_rows)
+        new_obj.__dict__.update(self.__dict__)
+        new_obj.intercept_column = None
+        if self.sparseM:
+            new_obj.M = self._csc()[:,index_obj].tocsr()
+        else:
+            new_obj.M = self.M[:,index_obj]
+        new_obj.__dict__.pop('_csc_M', None)
+        new_obj.__dict__.pop('_csr_M', None)
+        new_obj.input_shape = (new_obj.M.shape[1],)
+        new_obj.col_means = self.col_means[index_obj]
+        if self.scale:
+            new_obj.col_stds = self.col_stds[index_obj]
+        sums, sumsq = self._row_sums
+        new_obj._row_sums = sums[index_obj], sumsq[index_obj]
+        if hasattr(self, '_col_sums'):
+            del(new_obj._col_sums)
+        return new_obj
+
 class identity(object):
 
     def __init__(self, input_shape):
@@ -798,6 +1101,70 @@ def power_L(transform, max_its=500,tol=1e-8, debug=False):
         itercount += 1
     return norm
 
+def column_norms2(transform, nprobe=20):
+    """
+    The squared norms of the columns of the linear part of a
+    transform, i.e. the diagonal of :math:`D^TD`.
+
+    These are computed exactly for ndarrays, scipy.sparse matrices,
+    affine_transforms of these and normalize. For other transforms, 
+    they are estimated from nprobe products with :math:`D^TD` of
+    random sign vectors (Hutchinson's estimator of the diagonal).
+    """
+    if isinstance(transform, normalize_rows):
+        n = transform.output_shape[0]
+        sums, sumsq = transform._row_sums
+        if transform.center:
+            means = transform.col_means
+            norms2 = sumsq - 2 * means * sums + n * means**2
+            if transform.intercept_column is not None:
+                norms2[transform.intercept_column] = n
+        else:
+            norms2 = sumsq
+        if transform.scale:
+            norms2 = norms2 / transform.col_stds**2
+            if transform.intercept_column is not None:
+                norms2[transform.intercept_column] = n * transform.value
+        return norms2
+
+    if isinstance(transform, normalize):
+        n = transform.output_shape[0]
+        if transform.scale:
+            # scaled columns all have squared norm n * value
+            return n * transform.value * np.ones(transform.input_shape)
+        M = transform.M
+        if transform.sparseM:
+            norms2 = np.asarray(M.multiply(M).sum(0, dtype=np.float64)).reshape(-1)
+        else:
+            norms2 = np.sum(M**2, 0, dtype=np.float64)
+        if transform.center:
+            means = np.asarray(M.mean(0, dtype=np.float64)).reshape(-1)
+            norms2 = norms2 - n * means**2
+            if transform.intercept_column is not None:
+                norms2[transform.intercept_column] = n
+        return norms2
+
+    transform = astransform(transform)
+    if transform.noneD:
+        return np.ones(transform.input_shape)
+    elif transform.diagD:
+        return np.asarray(transform.linear_operator, np.float64)**2
+    elif transform.sparseD:
+        X = transform.linear_operator
+        return np.asarray(X.multiply(X).sum(0, dtype=np.float64)).reshape(-1)
+    elif not transform.affineD:
+        return np.sum(transform.linear_operator**2, 0, dtype=np.float64)
+    elif isinstance(transform.linear_operator, (normalize, affine_transform)):
+        return column_norms2(transform.linear_operator, nprobe=nprobe)
+
+    # a fixed seed so the estimate is reproducible
+    rng = np.random.RandomState(0)
+    estimate = np.zeros(transform.input_shape)
+    for _ in range(nprobe):
+        z = 2. * rng.binomial(1, 0.5, transform.input_shape) - 1
+        estimate += z * transform.adjoint_map(transform.linear_map(z))
+    return np.fabs(estimate) / nprobe
+
 def astransform(X):
     """
     If X is an affine_transform, return X,
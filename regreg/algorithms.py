@@ -1,7 +1,264 @@
 import numpy as np
 import warnings
+import time
 
 from .identity_quadratic import identity_quadratic as sq
+from .affine import astransform, float_dtype, column_norms2
+
+class workspace(object):
+
+    """
+    Preallocated arrays used by FISTA.fit when called with
+    workspace=True. The arrays are reused across calls to fit
+    as long as the shape and dtype of the composite's coefficients do
+    not change and max_its does not grow.
+    """
+
+    def __init__(self, shape, max_its, dtype=np.float64):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.r = np.zeros(shape, dtype)
+        self.diff = np.zeros(shape, dtype)
+        self.objective_hist = np.zeros(max_its)
+
+    def fits(self, shape, max_its, dtype=np.float64):
+        """
+        Can this workspace be used for coefficients of a given
+        shape and dtype and a history of length max_its?
+        """
+        return (self.shape == shape and self.dtype == dtype and
+                self.objective_hist.shape[0] >= max_its)
+
+class fit_record(object):
+
+    """
+    Timings and counts collected by FISTA.fit when called with
+    instrument=True.
+
+    The times are wall clock times in seconds. The time spent in
+    backtracking includes the calls to the smooth objective
+    and proximal map made while backtracking, so the
+    times do not add up to total_time.
+
+    map_calls has an entry for each affine transform the smooth
+    part of the composite depends on, counting calls to its
+    linear_map, affine_map and adjoint_map.
+    """
+
+    _maps = ['linear_map', 'affine_map', 'adjoint_map']
+
+    def __init__(self):
+        self.total_time = 0.
+        self.smooth_time = 0.
+        self.prox_time = 0.
+        self.backtrack_time = 0.
+        self.iterations = 0
+        self.func_evals = 0
+        self.grad_evals = 0
+        self.prox_calls = 0
+        self.backtracks = 0
+        self.restarts = 0
+        self.badsteps = 0
+        self.extrapolations = 0
+        self.map_calls = {}
+        self._watched = []
+
+    def __repr__(self):
+        return ('fit_record(iterations=%d, total_time=%.3g, smooth_time=%.3g, prox_time=%.3g, backtrack_time=%.3g, func_evals=%d, grad_evals=%d, prox_calls=%d, backtracks=%d, restarts=%d, badsteps=%d, extrapolations=%d)' % 
+                (self.iterations, self.total_time, self.smooth_time, 
+                 self.prox_time, self.backtrack_time, self.func_evals, 
+                 self.grad_evals, self.prox_calls, self.backtracks, 
+                 self.restarts, self.badsteps, self.extrapolations))
+
+    def matvecs(self):
+        """
+        Total number of calls to the maps of the watched transforms.
+        """
+        return sum([sum(counts.values()) for counts in self.map_calls.values()])
+
+    def watch(self, composite):
+        """
+        Count the calls to the maps of the affine transforms
+        found in composite, until `unwatch` is called.
+        """
+        for transform in _affine_transforms(composite):
+            counts = dict([(name, 0) for name in self._maps])
+            self.map_calls[transform] = counts
+            # the attributes of the transform replaced by counters, 
+            # None if the method came from its class
+            saved = {}
+            for name in self._maps:
+                if hasattr(transform, name):
+                    saved[name] = transform.__dict__.get(name)
+                    setattr(transform, name, 
+                            _counted(getattr(transform, name), counts, name))
+            self._watched.append((transform, saved))
+
+    def unwatch(self):
+        """
+        Restore the maps replaced by `watch`, so that a
+        transform watched by nested fits keeps the counters of
+        the outer ones.
+        """
+        while self._watched:
+            transform, saved = self._watched.pop()
+            for name, method in saved.items():
+                if method is None:
+                    delattr(transform, name)
+                else:
+                    setattr(transform, name, method)
+
+def _counted(method, counts, name):
+    def wrapper(*args, **kws):
+        counts[name] += 1
+        return method(*args, **kws)
+    return wrapper
+
+def _affine_transforms(composite):
+    """
+    Find the affine transforms that the smooth part of a composite
+    depends on.
+    """
+    found, ids = [], set([])
+    stack = [composite]
+    while stack:
+        obj = stack.pop()
+        transform = getattr(obj, 'affine_transform', None)
+        if transform is not None and id(transform) not in ids:
+            found.append(transform)
+            ids.add(id(transform))
+        for name in ['smooth_atom', 'sm_atom']:
+            if hasattr(obj, name):
+                stack.append(getattr(obj, name))
+        for name in ['atoms', 'smooth_atoms']:
+            if hasattr(obj, name):
+                stack.extend(getattr(obj, name))
+    return found
+
+class fista_state(object):
+
+    """
+    The state of FISTA.fit at the end of an iteration, enough to resume
+    the fit with the same trajectory. States can be pickled, or
+    saved to and loaded from a compressed .npz file.
+    """
+
+    _arrays = ['coefs', 'r', 'coefs_grad', 'eta_coefs', 'eta_r', 
+               'objective_hist', 'last_point', 'last_grad']
+    _scalars = ['t_old', 'current_obj', 'coefs_f', 'inv_step', 
+                'itercount', 'badstep', 'r_is_coefs', 'attempt_decrease',
+                'last_curvature']
+
+    def __init__(self, coefs, r, t_old, current_obj, coefs_f, coefs_grad, 
+                 inv_step, itercount, badstep, r_is_coefs, attempt_decrease,
+                 objective_hist, eta_coefs=None, eta_r=None,
+                 last_point=None, last_grad=None, last_curvature=None):
+        self.coefs = np.array(coefs, copy=True)
+        # the Nesterov point is only stored if it differs from coefs
+        if r_is_coefs:
+            self.r = None
+            self.eta_r = None
+        else:
+            self.r = np.array(r, copy=True)
+            if eta_r is not None:
+                self.eta_r = np.array(eta_r, copy=True)
+            else:
+                self.eta_r = None
+        self.t_old = t_old
+        self.current_obj = current_obj
+        self.coefs_f = coefs_f
+        if coefs_grad is not None:
+            coefs_grad = np.array(coefs_grad, copy=True)
+        self.coefs_grad = coefs_grad
+        self.inv_step = inv_step
+        self.itercount = itercount
+        self.badstep = badstep
+        self.r_is_coefs = r_is_coefs
+        self.attempt_decrease = attempt_decrease
+        self.objective_hist = np.array(objective_hist, copy=True)
+        if eta_coefs is not None:
+            eta_coefs = np.array(eta_coefs, copy=True)
+        self.eta_coefs = eta_coefs
+        # used by the adaptive step policies
+        self.last_point, self.last_grad = last_point, last_grad
+        self.last_curvature = last_curvature
+
+    def __repr__(self):
+        return 'fista_state(itercount=%d, current_obj=%s, inv_step=%s)' % (self.itercount, self.current_obj, self.inv_step)
+
+    def save(self, filename):
+        """
+        Save the state to a compressed .npz file.
+        """
+        values = {}
+        for name in self._arrays + self._scalars:
+            value = getattr(self, name)
+            if value is not None:
+                values[name] = value
+        np.savez_compressed(filename, **values)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a state saved by `save`.
+        """
+        f = np.load(filename)
+        values = dict([(name, None) for name in cls._arrays + cls._scalars])
+        for name in f.files:
+            values[name] = f[name]
+        for name in cls._scalars:
+            if values[name] is not None:
+                values[name] = values[name].item()
+        values['r_is_coefs'] = bool(values['r_is_coefs'])
+        values['attempt_decrease'] = bool(values['attempt_decrease'])
+        if values['r_is_coefs']:
+            values['r'] = values['coefs']
+        return cls(**values)
+
+class fit_budget(object):
+
+    """
+    A limit on the wall clock time, the number of smooth evaluations
+    (function or gradient) and the number of calls to the maps of
+    affine transforms used by fits. The same budget can be
+    passed to several fits, which then share it.
+    """
+
+    def __init__(self, seconds=None, deadline=None, evals=None, matvecs=None):
+        """
+        Parameters
+        ----------
+
+        seconds : float
+            Time allowed, starting now.
+
+        deadline : float
+            Time, as returned by time.time(), by which fitting must stop.
+
+        evals : int
+            Number of smooth evaluations allowed.
+
+        matvecs : int
+            Number of calls to linear_map, affine_map or adjoint_map allowed.
+        """
+        if seconds is not None:
+            end = time.time() + seconds
+            if deadline is None or end < deadline:
+                deadline = end
+        self.deadline = deadline
+        self.max_evals = evals
+        self.max_matvecs = matvecs
+        self.evals = 0
+        self.matvecs = 0
+
+    def __repr__(self):
+        return 'fit_budget(deadline=%s, evals=%s, matvecs=%s)' % (self.deadline, self.max_evals, self.max_matvecs)
+
+    @property
+    def exhausted(self):
+        return ((self.deadline is not None and time.time() >= self.deadline) or
+                (self.max_evals is not None and self.evals >= self.max_evals) or
+                (self.max_matvecs is not None and self.matvecs >= self.max_matvecs))
 
 class algorithm(object):
 
@@ -9,6 +266,19 @@ class algorithm(object):
         self.composite = composite
         self.debug = False
         self.inv_step = None
+        self._workspace = None
+        self.record = None
+        self.state = None
+
+    def get_workspace(self, max_its):
+        """
+        Return a workspace of arrays sized to self.composite.coefs,
+        reusing the one from the last fit if possible.
+        """
+        shape, dtype = self.composite.coefs.shape, self.composite.coefs.dtype
+        if self._workspace is None or not self._workspace.fits(shape, max_its, dtype):
+            self._workspace = workspace(shape, max_its, dtype)
+        return self._workspace
 
     @property
     def output(self):
@@ -30,6 +300,8 @@ class FISTA(algorithm):
     The FISTA generalized gradient algorithm
     """
 
+    metric = None
+
     def fit(self,
             max_its=10000,
             min_its=5,
@@ -44,7 +316,24 @@ class FISTA(algorithm):
             monotonicity_restart=True,
             debug = None,
             prox_control=None,
-            attempt_decrease = False):
+            attempt_decrease = False,
+            workspace=False,
+            track_image=False,
+            image_refresh=100,
+            gap_tol=None,
+            gap_rel_tol=None,
+            gap_every=10,
+            instrument=False,
+            callback=None,
+            budget=None,
+            state=None,
+            checkpoint=None,
+            checkpoint_every=100,
+            step_policy='backtrack',
+            restart_policy='objective',
+            step_range=10.,
+            anderson=0,
+            metric=None):
 
         """
         Use the FISTA (or ISTA) algorithm to fit the problem
@@ -79,84 +368,414 @@ class FISTA(algorithm):
               A dictionary of arguments for fit(), used when the composite.proximal_step itself is a FISTA problem
         attempt_decrease : bool
               If True, attempt to decrease inv_step on the first iteration
+        workspace : bool
+              If True, iterates are stored in preallocated arrays owned
+              by the solver (see `get_workspace`) and
+              self.composite.coefs is updated in place rather than
+              replaced. The arrays are reused by subsequent calls to fit.
+              The proximal map and smooth gradient still return
+              new arrays at each step.
+        track_image : bool
+              If True, the affine images of the iterates (see
+              composite.affine_image) are carried along with the
+              coefficients and the image of each Nesterov point is formed
+              from those of the last two iterates. Each iteration then
+              costs one forward and one adjoint product.
+        image_refresh : int
+              When tracking images, recompute them from the coefficients
+              every image_refresh iterations.
+        gap_tol : float
+              If not None, stop when the duality gap (see
+              composite.duality_gap) is below gap_tol instead of
+              using the change in objective or coefficients.
+        gap_rel_tol : float
+              If not None, stop when the duality gap is below gap_rel_tol
+              times the objective value.
+        gap_every : int
+              When stopping on the duality gap, compute it every
+              gap_every iterations.
+        instrument : bool
+              If True, timings and counts of function evaluations,
+              prox calls, backtracks and restarts, as well as calls to
+              the maps of affine transforms are collected in self.record,
+              a fit_record.
+        callback : callable
+              If not None, called as callback(self, itercount) at the end
+              of each iteration. If instrument is True, self.record
+              is up to date.
+        budget : fit_budget
+              If not None, stop when the budget is exhausted, which is checked
+              at the start of each iteration. The budget is charged for
+              the smooth evaluations and matvecs of this fit, which is
+              instrumented. The best iterate found is kept
+              in self.composite.coefs and self.truncated is set to True.
+        state : fista_state
+              If not None, resume the fit from this state, as
+              found in self.state after a fit or saved by a checkpoint.
+              The other arguments should be the same as for the 
+              original fit and max_its counts the iterations 
+              of the original fit.
+        checkpoint : str or callable
+              If not None, every checkpoint_every iterations the current
+              state is stored as self.state and either saved to the
+              file checkpoint or passed to checkpoint(state).
+        checkpoint_every : int
+              How often to checkpoint.
+        step_policy : str
+              One of ['backtrack', 'bb', 'local']. With 'backtrack', 
+              inv_step is only increased by backtracking and an attempt
+              to decrease it is made every 100 iterations. With 'bb',
+              each iteration starts from the Barzilai-Borwein estimate
+              :math:`s^Ty/s^Ts` of the curvature from the last two gradients.
+              With 'local', each iteration starts from the curvature of the 
+              smooth objective along the last accepted step. Estimates are
+              kept within a factor step_range of the previous inv_step. 
+              Backtracking is still used as a safeguard, jumping to the
+              curvature along a rejected step.
+        restart_policy : str
+              One of ['objective', 'gradient']. With 'objective', Nesterov
+              weights are restarted when the objective increases 
+              (if monotonicity_restart is True). With 'gradient', they are
+              restarted when the step makes an obtuse angle with the
+              momentum (O'Donoghue and Candes) and all steps are accepted.
+        step_range : float
+              See step_policy.
+        anderson : int
+              If positive, Nesterov weights are not used. Instead, the
+              centers of the proximal steps, 
+              :math:`y=\\beta-\\nabla f(\\beta)/L`, are extrapolated 
+              by Anderson (type-II) acceleration of the ISTA fixed point
+              iteration, with a memory of anderson steps. An extrapolated
+              step is taken without backtracking if it does not increase
+              the objective. Otherwise, the history is cleared and 
+              a plain step is taken. The history is not stored in 
+              self.state, so a resumed fit starts a new history.
+        metric : None, 'columns' or ndarray
+              If not None, the proximal gradient steps are taken in the
+              diagonal metric :math:`\\sum_i d_i \\beta_i^2`, so that each
+              coordinate has its own step size 1/(d_i * inv_step). With 
+              'columns', d is the squared norms of the columns of the 
+              affine transform of the smooth part (see `column_norms2`),
+              otherwise it is given by metric. It is stored, scaled to
+              have mean 1, as self.metric. This needs backtracking and
+              a composite with a diagonal_proximal method, such as a 
+              simple_problem with an l1norm, weighted l1norm or a 
+              supnorm or weighted supnorm in bound form.
     
         Returns
         -------
 
         objective_hist : ndarray
               A vector of objective values. Only return if return_objective_hist is True.
+              If workspace is True, this is a view of the workspace's
+              history and will be overwritten by the next call to fit.
 
         """
 
         if debug is not None:
             self.debug = debug
-        set_prox_control = prox_control is not None
+        self.converged = self.truncated = False
+        if budget is not None:
+            instrument = True
+        if instrument:
+            record = self.record = fit_record()
+            record.watch(self.composite)
+        else:
+            record = self.record = None
+        # the transforms of the composite are watched until the fit ends,
+        # even if it raises
+        try:
+            return self._fit(max_its=max_its,
+                             min_its=min_its,
+                             tol=tol,
+                             backtrack=backtrack,
+                             FISTA=FISTA,
+                             alpha=alpha,
+                             start_inv_step=start_inv_step,
+                             restart=restart,
+                             coef_stop=coef_stop,
+                             return_objective_hist=return_objective_hist,
+                             monotonicity_restart=monotonicity_restart,
+                             prox_control=prox_control,
+                             attempt_decrease=attempt_decrease,
+                             workspace=workspace,
+                             track_image=track_image,
+                             image_refresh=image_refresh,
+                             gap_tol=gap_tol,
+                             gap_rel_tol=gap_rel_tol,
+                             gap_every=gap_every,
+                             callback=callback,
+                             budget=budget,
+                             state=state,
+                             checkpoint=checkpoint,
+                             checkpoint_every=checkpoint_every,
+                             step_policy=step_policy,
+                             restart_policy=restart_policy,
+                             step_range=step_range,
+                             anderson=anderson,
+                             metric=metric)
+        finally:
+            if record is not None:
+                record.unwatch()
+
+    def _fit(self, max_its, min_its, tol, backtrack, FISTA, alpha,
+             start_inv_step, restart, coef_stop, return_objective_hist,
+             monotonicity_restart, prox_control, attempt_decrease,
+             workspace, track_image, image_refresh, gap_tol, gap_rel_tol,
+             gap_every, callback, budget, state, checkpoint, 
+             checkpoint_every, step_policy, restart_policy, step_range, 
+             anderson, metric):
+        """
+        The iterations of `fit`, with the same arguments
+        except debug and instrument.
+        """
+        if step_policy not in ['backtrack', 'bb', 'local']:
+            raise ValueError("step_policy should be one of ['backtrack', 'bb', 'local']")
+        if restart_policy not in ['objective', 'gradient']:
+            raise ValueError("restart_policy should be one of ['objective', 'gradient']")
+        if restart_policy == 'gradient':
+            monotonicity_restart = False
+        self.metric = None
+        metric_diag, metric_flat = 1., None
+        if metric is not None:
+            self.metric = self._diagonal_metric(metric, backtrack)
+            metric_diag, metric_flat = self.metric, self.metric.reshape(-1)
+        if anderson:
+            FISTA = False
+            self._anderson_reset()
+            if not backtrack:
+                self.inv_step = self.composite.lipschitz
+        gradient_restart = restart_policy == 'gradient' and FISTA
+        # changes in the objective below f_rtol are within rounding
+        # error for single precision coefficients
+        f_rtol = max(1e-10, 10 * np.finfo(float_dtype(self.composite.coefs)).eps)
+
+        record = self.record
+        if record is not None:
+            start_time = time.time()
+        if budget is not None:
+            budget_evals, budget_matvecs = budget.evals, budget.matvecs
+
+        gap_stop = gap_tol is not None or gap_rel_tol is not None
+        if gap_stop:
+            gap_tol = gap_tol or 0
+            gap_rel_tol = gap_rel_tol or 0
+            self.gap, self.dual_point = self.composite.duality_gap(self.composite.coefs)
 
-        objective_hist = np.zeros(max_its)
-        
         if backtrack and self.inv_step is None:
             #If inv_step is not available from last fit use start_inv_step
             self.inv_step = start_inv_step
 
-        r = self.composite.coefs
+        if state is not None:
+            self._accept(state.coefs.copy(), workspace)
+
+        if workspace:
+            ws = self.get_workspace(max_its)
+            objective_hist = ws.objective_hist
+            r, diff = ws.r, ws.diff
+            r[:] = self.composite.coefs
+        else:
+            objective_hist = np.zeros(max_its)
+            r = self.composite.coefs
         t_old = 1.
 
-        beta = self.composite.coefs
-        current_f = self.composite.smooth_objective(r,mode='func')
-        current_obj = current_f + self.composite.nonsmooth_objective(self.composite.coefs, check_feasibility=True)
+        if state is not None:
+            # resume from the state, no evaluations are needed 
+            itercount, badstep = state.itercount, state.badstep
+            t_old, current_obj = state.t_old, state.current_obj
+            coefs_f, coefs_grad = state.coefs_f, state.coefs_grad
+            self.inv_step = state.inv_step
+            attempt_decrease = state.attempt_decrease
+            last_point, last_grad = state.last_point, state.last_grad
+            last_curvature = state.last_curvature
+            r_is_coefs = state.r_is_coefs
+            if not r_is_coefs:
+                if workspace:
+                    r[:] = state.r
+                else:
+                    r = state.r.copy()
+            objective_hist[:itercount] = state.objective_hist[:itercount]
+            eta_coefs = eta_r = eta_beta = None
+            if track_image:
+                eta_coefs = state.eta_coefs
+                if eta_coefs is None:
+                    eta_coefs = self.composite.affine_image(self.composite.coefs)
+                if r_is_coefs:
+                    eta_r = eta_coefs
+                else:
+                    eta_r = state.eta_r
+                    if eta_r is None:
+                        eta_r = self.composite.affine_image(r)
+        else:
+            if track_image:
+                eta_coefs = self.composite.affine_image(self.composite.coefs)
+                eta_r = eta_coefs
+            else:
+                eta_coefs = eta_r = eta_beta = None
+            current_f = self._smooth_objective(r, eta_r, 'func')
+            current_obj = current_f + self.composite.nonsmooth_objective(self.composite.coefs, check_feasibility=True)
+
+            # Smooth objective and gradient at self.composite.coefs, if known.
+            # Whenever r is the current value of coefs (ISTA steps, restarts)
+            # these are used instead of evaluating the smooth objective again.
+            coefs_f, coefs_grad = current_f, None
+            r_is_coefs = True
+            itercount = 0
+            badstep = 0
+            last_point = last_grad = last_curvature = None
+
+        def snapshot():
+            return fista_state(self.composite.coefs, r, t_old, current_obj,
+                               coefs_f, coefs_grad, self.inv_step, 
+                               itercount, badstep, r_is_coefs, 
+                               attempt_decrease, 
+                               objective_hist[:itercount],
+                               eta_coefs=eta_coefs, eta_r=eta_r,
+                               last_point=last_point, last_grad=last_grad,
+                               last_curvature=last_curvature)
         
-        itercount = 0
-        badstep = 0
+        # Without monotonicity restarts the objective can increase, 
+        # so a truncated fit has to keep the best iterate
+        keep_best = budget is not None and not monotonicity_restart
+        if keep_best:
+            best_obj, best_coefs = current_obj, self.composite.coefs.copy()
+
+        obj_rel_change = coef_rel_change = np.inf
         while itercount < max_its:
 
+            if budget is not None:
+                budget.evals = budget_evals + record.func_evals + record.grad_evals
+                budget.matvecs = budget_matvecs + record.matvecs()
+                if budget.exhausted:
+                    self.truncated = True
+                    if self.debug:
+                        print 'Optimization stopped because budget was exhausted'
+                    break
+
             #Restart every 'restart' iterations
             if np.mod(itercount+1,restart)==0:
                 if self.debug:
                     print "\tRestarting weights"
-                r = self.composite.coefs
+                if record is not None:
+                    record.restarts += 1
+                if workspace:
+                    r[:] = self.composite.coefs
+                else:
+                    r = self.composite.coefs
+                r_is_coefs = True
+                eta_r = eta_coefs
                 t_old = 1.
 
+            #Bound the drift of the tracked images
+            if track_image and np.mod(itercount+1,image_refresh)==0:
+                eta_coefs = self.composite.affine_image(self.composite.coefs)
+                if r_is_coefs:
+                    eta_r = eta_coefs
+                else:
+                    eta_r = self.composite.affine_image(r)
+
             objective_hist[itercount] = current_obj
 
+            aa_step = None
+            if anderson:
+                if coefs_grad is None:
+                    coefs_grad = self._smooth_objective(self.composite.coefs, eta_coefs, 'grad')
+                aa_step = self._anderson_extrapolate(coefs_grad, current_obj, 
+                                                     anderson, metric_diag,
+                                                     track_image, prox_control)
+
+            if aa_step is not None:
+                # the extrapolated step did not increase the objective
+                beta, eta_beta, trial_f = aa_step
+                trial_grad = None
+
             # Backtracking loop
-            if backtrack:
-                if np.mod(itercount+1,100)==0 or attempt_decrease:
+            elif backtrack:
+                if step_policy == 'backtrack' and (np.mod(itercount+1,100)==0 or attempt_decrease):
                     self.inv_step *= 1/alpha
                     attempt_decrease = True
-                current_f, grad = self.composite.smooth_objective(r,mode='both')
+                if r_is_coefs:
+                    current_f = coefs_f
+                    if coefs_grad is None:
+                        coefs_grad = self._smooth_objective(r, eta_r, 'grad')
+                    grad = coefs_grad
+                else:
+                    current_f, grad = self._smooth_objective(r, eta_r, 'both')
+                if step_policy != 'backtrack':
+                    self.inv_step = self._policy_inv_step(step_policy, r, grad,
+                                                          last_point, last_grad,
+                                                          last_curvature, 
+                                                          step_range)
+                    if step_policy == 'bb':
+                        last_point, last_grad = r.copy(), grad.copy()
+                if record is not None:
+                    backtrack_start = time.time()
                 stop = False
                 while not stop:
-                    if set_prox_control:
-                        beta = self.composite.proximal_step(sq(self.inv_step, r, grad, 0), prox_control=prox_control)
-                    else:
-                        beta = self.composite.proximal_step(sq(self.inv_step, r, grad, 0))
+                    trial_grad = None
+                    beta = self._proximal_step(sq(self.inv_step, r, grad, 0), prox_control)
 
-                    trial_f = self.composite.smooth_objective(beta,mode='func')
+                    if track_image:
+                        eta_beta = self.composite.affine_image(beta)
+                    trial_f = self._smooth_objective(beta, eta_beta, 'func')
 
+                    if workspace and np.isfinite(trial_f):
+                        np.subtract(beta, r, diff)
+                        step = diff.reshape(-1)
+                        step_norm2 = np.dot(step, step)
+                    elif np.isfinite(trial_f):
+                        step = (beta-r).reshape(-1)
+                        step_norm2 = np.linalg.norm(step)**2
+                    if metric_flat is not None and np.isfinite(trial_f):
+                        # the squared norm of the step in the metric
+                        step_norm2 = np.dot(metric_flat * step, step)
+
+                    curvature = None
                     if not np.isfinite(trial_f):
                         stop = False
-                    elif np.fabs(trial_f - current_f)/np.max([1.,trial_f]) > 1e-10:
-                        stop = trial_f <= current_f + np.dot((beta-r).reshape(-1),grad.reshape(-1)) + 0.5*self.inv_step*np.linalg.norm(beta-r)**2
+                    elif np.fabs(trial_f - current_f)/np.max([1.,trial_f]) > f_rtol:
+                        stop = trial_f <= current_f + np.dot(step,grad.reshape(-1)) + 0.5*self.inv_step*step_norm2
+                        if step_policy != 'backtrack' and step_norm2 > 0:
+                            curvature = 2 * (trial_f - current_f - np.dot(step,grad.reshape(-1))) / step_norm2
                     else:
-                        trial_grad = self.composite.smooth_objective(beta,mode='grad')
-                        stop = np.fabs(np.dot((beta-r).reshape(-1),(grad-trial_grad).reshape(-1))) <= 0.5*self.inv_step*np.linalg.norm(beta-r)**2
+                        trial_grad = self._smooth_objective(beta, eta_beta, 'grad')
+                        stop = np.fabs(np.dot(step,(grad-trial_grad).reshape(-1))) <= 0.5*self.inv_step*step_norm2
+                        if step_policy != 'backtrack' and step_norm2 > 0:
+                            curvature = 2 * np.fabs(np.dot(step,(grad-trial_grad).reshape(-1))) / step_norm2
                     if not stop:
+                        if record is not None:
+                            record.backtracks += 1
                         attempt_decrease = False
                         self.inv_step *= alpha
+                        # jump to the curvature along the rejected step
+                        if curvature is not None and curvature > self.inv_step:
+                            self.inv_step = curvature
                         if not np.isfinite(self.inv_step):
                             raise ValueError("inv_step overflowed")
                         if self.debug:
                             print "%i    Increasing inv_step to" % itercount, self.inv_step
+                if record is not None:
+                    record.backtrack_time += time.time() - backtrack_start
+                if curvature is not None:
+                    last_curvature = curvature
                      
             else:
                 #Use specified Lipschitz constant
-                grad = self.composite.smooth_objective(r,mode='grad')
-                self.inv_step = self.composite.lipschitz
-                if set_prox_control:
-                    beta = self.composite.proximal_step(sq(self.inv_step, r, grad, 0), prox_control=prox_control)
+                if r_is_coefs:
+                    if coefs_grad is None:
+                        coefs_grad = self._smooth_objective(r, eta_r, 'grad')
+                    grad = coefs_grad
                 else:
-                    beta = self.composite.proximal_step(sq(self.inv_step, r, grad, 0))
-                trial_f = self.composite.smooth_objective(beta,mode='func')
+                    grad = self._smooth_objective(r, eta_r, 'grad')
+                trial_grad = None
+                self.inv_step = self.composite.lipschitz
+                beta = self._proximal_step(sq(self.inv_step, r, grad, 0), prox_control)
+                if track_image:
+                    eta_beta = self.composite.affine_image(beta)
+                trial_f = self._smooth_objective(beta, eta_beta, 'func')
+
+            if anderson and aa_step is None:
+                self._anderson_center(r - grad / (self.inv_step * metric_diag))
                 
             trial_obj = trial_f + self.composite.nonsmooth_objective(beta)
 
@@ -164,7 +783,11 @@ class FISTA(algorithm):
             #obj_rel_change = obj_change/np.fabs(max(min(current_obj, trial_obj),0))
             obj_rel_change = obj_change/np.max([np.fabs(current_obj),1.])
             if coef_stop:
-                coef_rel_change = np.linalg.norm(self.composite.coefs - beta) / np.max([1.,np.linalg.norm(beta)])
+                if workspace:
+                    np.subtract(self.composite.coefs, beta, diff)
+                    coef_rel_change = np.linalg.norm(diff) / np.max([1.,np.linalg.norm(beta)])
+                else:
+                    coef_rel_change = np.linalg.norm(self.composite.coefs - beta) / np.max([1.,np.linalg.norm(beta)])
 
             if self.debug:
                 if coef_stop:
@@ -173,32 +796,68 @@ class FISTA(algorithm):
                     print "%i    obj: %.6e    inv_step: %.2e    rel_obj_change: %.2e    tol: %.1e" % (itercount, current_obj, self.inv_step, obj_rel_change, tol)
 
             if itercount >= min_its:
-                if coef_stop:
+                if gap_stop:
+                    if (np.mod(itercount, gap_every) == 0 and 
+                        self._gap_converged(beta, trial_obj, itercount,
+                                            gap_tol, gap_rel_tol)):
+                        self._accept(beta, workspace)
+                        self.converged = True
+                        if self.debug:
+                            print 'Success: Optimization stopped because duality gap was below tolerance'
+                        break
+                elif coef_stop:
                     if coef_rel_change < tol:
-                        self.composite.coefs = beta
+                        self._accept(beta, workspace)
+                        self.converged = True
                         if self.debug:
                             print "Success: Optimization stopped because change in coefficients was below tolerance"
                         break
                 else:
                     if obj_rel_change < tol or obj_change < tol:
-                        self.composite.coefs = beta
+                        self._accept(beta, workspace)
+                        self.converged = True
                         if self.debug:
                             print 'Success: Optimization stopped because decrease in objective was below tolerance'
                         break
 
+            if gradient_restart and np.dot((r - beta).reshape(-1), 
+                                           (beta - self.composite.coefs).reshape(-1)) > 0:
+                #Adaptive restarting: restart if the step is not
+                #in the direction of the momentum
+                if self.debug:
+                    print "%i Restarting weights" % itercount
+                if record is not None:
+                    record.restarts += 1
+                t_old = 1.
+
             if FISTA:
                 #Use Nesterov weights
                 t_new = 0.5 * (1 + np.sqrt(1+4*(t_old**2)))
-                r = beta + ((t_old-1)/(t_new)) * (beta - self.composite.coefs)
+                if workspace:
+                    np.subtract(beta, self.composite.coefs, r)
+                    r *= (t_old-1)/(t_new)
+                    r += beta
+                else:
+                    r = beta + ((t_old-1)/(t_new)) * (beta - self.composite.coefs)
+                if track_image:
+                    eta_r = eta_beta + ((t_old-1)/(t_new)) * (eta_beta - eta_coefs)
+                r_is_coefs = False
             else:
                 #Just do ISTA
                 t_new = 1.
-                r = beta
+                if workspace:
+                    r[:] = beta
+                else:
+                    r = beta
+                eta_r = eta_beta
+                r_is_coefs = True
 
-            if itercount > 1 and current_obj < trial_obj and obj_rel_change > 1e-10 and monotonicity_restart:
+            if itercount > 1 and current_obj < trial_obj and obj_rel_change > f_rtol and monotonicity_restart:
                 #Adaptive restarting: restart if monotonicity violated
                 if self.debug:
                     print "%i Restarting weights" % itercount
+                if record is not None:
+                    record.restarts += 1
                 attempt_decrease = True
 
                 if t_old == 1.:
@@ -206,6 +865,8 @@ class FISTA(algorithm):
                     if self.debug:
                         print "%i  Badstep: current: %f, proposed %f" % (itercount, current_obj, trial_obj)
                     badstep += 1
+                    if record is not None:
+                        record.badsteps += 1
                     if badstep > 3:
                         warnings.warn('prox is taking bad steps')
                         if self.debug:
@@ -213,17 +874,56 @@ class FISTA(algorithm):
                         break
                 itercount += 1
                 t_old = 1.
-                r = self.composite.coefs
+                if workspace:
+                    r[:] = self.composite.coefs
+                else:
+                    r = self.composite.coefs
+                r_is_coefs = True
+                eta_r = eta_coefs
+                if anderson:
+                    self._anderson_reset()
 
             else:
-                self.composite.coefs = beta
+                self._accept(beta, workspace)
+                coefs_f, coefs_grad = trial_f, trial_grad
+                eta_coefs = eta_beta
                 t_old = t_new
                 itercount += 1
                 current_obj = trial_obj
+                if keep_best and current_obj < best_obj:
+                    best_obj = current_obj
+                    best_coefs[:] = self.composite.coefs
+
+            if checkpoint is not None and np.mod(itercount, checkpoint_every) == 0:
+                self._checkpoint(snapshot(), checkpoint)
+
+            if callback is not None:
+                if record is not None:
+                    record.iterations = itercount
+                callback(self, itercount)
+
+        if self.truncated and keep_best and best_obj < current_obj:
+            self._accept(best_coefs, workspace)
+            current_obj = best_obj
+            r_is_coefs = True
+            if track_image:
+                eta_coefs = eta_r = self.composite.affine_image(self.composite.coefs)
+            coefs_f = self._smooth_objective(self.composite.coefs, eta_coefs, 'func')
+            coefs_grad = None
+        self.state = snapshot()
 
         # Make convergence parameters available from the FISTA class
         # Allows for programatic checking of convergence
-        if coef_stop:
+        if gap_stop:
+            if itercount == max_its or badstep > 3:
+                self.gap, self.dual_point = self.composite.duality_gap(self.composite.coefs)
+            self.convergence_params = (itercount, 
+                current_obj, 
+                self.inv_step, 
+                obj_rel_change, 
+                self.gap,
+                tol)
+        elif coef_stop:
             self.convergence_params = (itercount, 
                 current_obj, 
                 self.inv_step, 
@@ -237,6 +937,9 @@ class FISTA(algorithm):
                 obj_rel_change, 
                 tol)
 
+        if record is not None:
+            record.iterations = itercount
+            record.total_time = time.time() - start_time
 
         if self.debug:
             if itercount == max_its:
@@ -245,4 +948,458 @@ class FISTA(algorithm):
         if return_objective_hist:
             return objective_hist[:itercount]
 
+    def _smooth_objective(self, x, eta, mode):
+        """
+        Evaluate the smooth objective at x, using its
+        affine image eta if images are being tracked.
+        """
+        record = self.record
+        if record is not None:
+            tic = time.time()
+        if eta is None:
+            value = self.composite.smooth_objective(x, mode=mode)
+        else:
+            value = self.composite.smooth_objective_image(eta, mode=mode)
+        if record is not None:
+            record.smooth_time += time.time() - tic
+            if mode in ['func', 'both']:
+                record.func_evals += 1
+            if mode in ['grad', 'both']:
+                record.grad_evals += 1
+        return value
+
+    def _bb_inv_step(self, s, y, step_range):
+        """
+        The Barzilai-Borwein estimate of the curvature of the smooth
+        objective from the change in gradient y over a step s, 
+        kept within a factor of step_range of the current inv_step.
+        """
+        s, y = s.reshape(-1), y.reshape(-1)
+        if self.metric is not None:
+            ss = np.dot(self.metric.reshape(-1) * s, s)
+        else:
+            ss = np.dot(s, s)
+        if ss == 0:
+            return self.inv_step
+        estimate = np.dot(s, y) / ss
+        if not np.isfinite(estimate) or estimate <= 0:
+            return self.inv_step
+        return min(max(estimate, self.inv_step / step_range), 
+                   self.inv_step * step_range)
 
+    def _policy_inv_step(self, step_policy, r, grad, last_point, last_grad,
+                         last_curvature, step_range):
+        """
+        The inv_step that backtracking starts from at r with the 'bb'
+        and 'local' step policies (see `fit`).
+        """
+        if step_policy == 'bb' and last_point is not None:
+            return self._bb_inv_step(r - last_point, grad - last_grad,
+                                     step_range)
+        if step_policy == 'local' and last_curvature is not None:
+            # the curvature along the last accepted step
+            # is at most inv_step
+            return max(last_curvature, self.inv_step / step_range)
+        return self.inv_step
+
+    def _gap_converged(self, beta, objective, itercount, gap_tol, gap_rel_tol):
+        """
+        Is the duality gap at beta below tolerance? If so,
+        it is stored with its dual point as self.gap and self.dual_point.
+        """
+        gap, dual_point = self.composite.duality_gap(beta)
+        if self.debug:
+            print "%i    duality gap: %.2e" % (itercount, gap)
+        if gap <= max(gap_tol, gap_rel_tol * np.fabs(objective)):
+            self.gap, self.dual_point = gap, dual_point
+            return True
+        return False
+
+    def _checkpoint(self, state, checkpoint):
+        """
+        Store state as self.state and save it to the file
+        checkpoint, or pass it to checkpoint if it is callable.
+        """
+        self.state = state
+        if callable(checkpoint):
+            checkpoint(state)
+        else:
+            state.save(checkpoint)
+
+    def _anderson_reset(self):
+        """
+        Clear the history of Anderson acceleration: pairs of 
+        centers of proximal steps and their images under the ISTA map, 
+        for a fixed inv_step.
+        """
+        self._aa_ins, self._aa_outs, self._aa_in = [], [], None
+        self._aa_inv_step = self.inv_step
+
+    def _anderson_center(self, center):
+        """
+        Record the center of the last proximal step, whose image is
+        added to the history by the next call to `_anderson_extrapolate`.
+        """
+        self._aa_in = center.reshape(-1)
+
+    def _anderson_extrapolate(self, coefs_grad, current_obj, anderson, 
+                              metric_diag, track_image, prox_control=None):
+        """
+        Add the image of the last center to the history and take a step
+        from the extrapolated center (see `_anderson_step`). Returns None 
+        if there is not enough history or if the step increases the 
+        objective, in which case the history is cleared.
+        """
+        if self.inv_step != self._aa_inv_step:
+            self._anderson_reset()
+        coefs = self.composite.coefs
+        if self._aa_in is not None:
+            self._aa_ins.append(self._aa_in)
+            self._aa_outs.append((coefs - coefs_grad / (self.inv_step * metric_diag)).reshape(-1))
+            if len(self._aa_ins) > anderson + 1:
+                self._aa_ins.pop(0)
+                self._aa_outs.pop(0)
+        center = self._anderson_point(self._aa_ins, self._aa_outs)
+        if center is None:
+            return None
+        center = center.reshape(coefs.shape).astype(coefs.dtype)
+        step = self._anderson_step(center, current_obj, track_image, 
+                                   prox_control)
+        if step is None:
+            self._aa_ins, self._aa_outs = [], []
+            return None
+        if self.record is not None:
+            self.record.extrapolations += 1
+        self._anderson_center(center)
+        return step
+
+    def _anderson_point(self, points, images):
+        """
+        The Anderson (type-II) extrapolation of a fixed point
+        iteration from the centers of its last steps and their images,
+        i.e. the affine combination of the images whose
+        coefficients minimize the norm of the same combination 
+        of the residuals. Returns None if there is not enough history.
+        """
+        if len(points) < 2:
+            return None
+        G = np.array(images).T
+        F = G - np.array(points).T
+        dG, dF = np.diff(G, axis=1), np.diff(F, axis=1)
+        A = np.dot(dF.T, dF)
+        # a little ridge for the nearly collinear residuals
+        # close to convergence
+        A += 1.e-10 * np.trace(A) * np.identity(A.shape[0])
+        try:
+            gamma = np.linalg.solve(A, np.dot(dF.T, F[:,-1]))
+        except np.linalg.LinAlgError:
+            return None
+        if not np.all(np.isfinite(gamma)):
+            return None
+        return G[:,-1] - np.dot(dG, gamma)
+
+    def _anderson_step(self, center, current_obj, track_image, 
+                       prox_control=None):
+        """
+        The proximal map at an extrapolated center, with its affine
+        image and smooth objective, or None if it increases the objective.
+        """
+        beta = self._proximal_step(sq(self.inv_step, center, 0, 0), 
+                                   prox_control)
+        eta_beta = None
+        if track_image:
+            eta_beta = self.composite.affine_image(beta)
+        trial_f = self._smooth_objective(beta, eta_beta, 'func')
+        trial_obj = trial_f + self.composite.nonsmooth_objective(beta)
+        if np.isfinite(trial_obj) and trial_obj <= current_obj:
+            return beta, eta_beta, trial_f
+        return None
+
+    def _diagonal_metric(self, metric, backtrack=True):
+        """
+        The diagonal of the metric used by fit, scaled to have mean 1.
+        """
+        if not hasattr(self.composite, 'diagonal_proximal'):
+            raise ValueError('a diagonal metric needs a composite with a diagonal_proximal method')
+        if not backtrack:
+            raise ValueError('a diagonal metric needs backtracking')
+        coefs = self.composite.coefs
+        if isinstance(metric, str):
+            if metric != 'columns':
+                raise ValueError("metric should be None, 'columns' or an array")
+            transforms = [transform for transform in 
+                          _affine_transforms(self.composite)
+                          if tuple(transform.input_shape) == coefs.shape]
+            if len(transforms) != 1:
+                raise ValueError('column norms need a smooth part with a single affine transform')
+            diag = column_norms2(transforms[0])
+        else:
+            diag = np.asarray(metric, np.float64)
+        diag = diag.reshape(coefs.shape)
+        if not np.all(np.isfinite(diag)) or diag.max() <= 0:
+            raise ValueError('metric should be finite with some positive entries')
+        # zero columns would have infinite step sizes
+        diag = np.maximum(diag, 1.e-8 * diag.max())
+        return (diag / diag.mean()).astype(float_dtype(coefs))
+
+    def _proximal_step(self, quadratic, prox_control=None):
+        """
+        Take a proximal step, timing it if self.record is not None.
+        The step is taken in the metric self.metric, if not None.
+        """
+        record = self.record
+        if record is not None:
+            tic = time.time()
+        if self.metric is not None:
+            value = self.composite.diagonal_proximal(quadratic, self.metric)
+        elif prox_control is not None:
+            value = self.composite.proximal_step(quadratic, prox_control=prox_control)
+        else:
+            value = self.composite.proximal_step(quadratic)
+        if record is not None:
+            record.prox_time += time.time() - tic
+            record.prox_calls += 1
+        return value
+
+    def _accept(self, beta, workspace=False):
+        """
+        Make beta the current value of self.composite.coefs,
+        copying it in place if a workspace is being used.
+        """
+        if workspace:
+            self.composite.coefs[:] = beta
+        else:
+            self.composite.coefs = beta
+
+
+
+
+class batched_FISTA(object):
+
+    r"""
+    The FISTA generalized gradient algorithm applied
+    to K problems of the form
+
+    .. math::
+
+       \text{minimize}_{\beta_k} f_k(X\beta_k) + h_k(\beta_k)
+
+    that share a single affine transform :math:`X`. 
+    The coefficients are stored as the columns of a
+    (p, K) array so that each iteration applies the linear
+    and adjoint maps of :math:`X` once, as matrix-matrix products.
+
+    Each column keeps its own step size, Nesterov weight and
+    restarts. Columns are frozen once they have converged.
+
+    >>> n, p, K = 100, 20, 5
+    >>> X = np.random.standard_normal((n, p))
+    >>> Y = np.random.standard_normal((n, K))
+    >>> losses = [rr.quadratic.shift(Y[:,k], coef=1./n) for k in range(K)]
+    >>> penalties = [rr.l1norm(p, lagrange=l) for l in np.linspace(0.1,0.5,K)]
+    >>> solver = rr.batched_FISTA(X, losses, penalties)
+    >>> coefs = solver.fit(tol=1.e-10)
+    >>> coefs.shape
+    (20, 5)
+
+    """
+
+    def __init__(self, transform, losses, penalties, initial=None):
+        """
+        Parameters
+        ----------
+        transform : affine_transform
+            The transform :math:`X` shared by all problems. It must
+            accept 2D arrays in affine_map and adjoint_map.
+        losses : [smooth_atom]
+            Smooth functions :math:`f_k` of :math:`X\beta_k`.
+        penalties : [atom]
+            Atoms :math:`h_k` with a proximal method.
+        initial : ndarray
+            Optional (p, K) array of starting coefficients.
+        """
+        self.transform = astransform(transform)
+        if len(losses) != len(penalties):
+            raise ValueError('need one penalty for each loss')
+        self.losses = losses
+        self.penalties = penalties
+        shape = self.transform.input_shape + (len(losses),)
+        if initial is None:
+            self.coefs = np.zeros(shape)
+        else:
+            if initial.shape != shape:
+                raise ValueError('initial should have shape %s' % `shape`)
+            self.coefs = initial.copy()
+        self.debug = False
+        self.inv_step = None
+
+    def objective(self, k, beta, eta):
+        """
+        Objective of the k-th problem at beta, whose image under
+        the transform is eta.
+        """
+        return (self.losses[k].smooth_objective(eta, mode='func') + 
+                self.penalties[k].nonsmooth_objective(beta))
+
+    def fit(self,
+            max_its=10000,
+            min_its=5,
+            tol=1e-5,
+            FISTA=True,
+            alpha=1.1,
+            start_inv_step=1.,
+            monotonicity_restart=True,
+            debug=None):
+
+        """
+        Use the FISTA (or ISTA) algorithm to fit all K problems.
+
+        Parameters
+        ----------
+        max_its : int
+              the maximum number of iterations
+        min_its : int
+              the minimum number of iterations
+        tol : float
+              the tolerance used in the stopping criterion, applied to each column
+        FISTA : bool
+              use Nesterov weights? If False, this is just gradient descent
+        alpha : float
+              used in backtracking. If a column's inv_step is too small, it is increased by a factor of alpha
+        start_inv_step : float
+              used in backtracking. This is the starting value of self.inv_step
+        monotonicity_restart : bool
+              If True, a column's Nesterov weights are restarted every time its objective value increases
+        debug : bool
+              Resets self.debug, which controls whether convergence information is printed
+
+        Returns
+        -------
+
+        coefs : ndarray
+              The (p, K) array of solutions, also available as self.coefs.
+              Per column results are stored in self.objective_values,
+              self.iterations and self.converged.
+
+        """
+
+        if debug is not None:
+            self.debug = debug
+
+        X = self.transform
+        coefs = self.coefs
+        K = coefs.shape[1]
+
+        if self.inv_step is None:
+            #If inv_step is not available from last fit use start_inv_step
+            self.inv_step = np.ones(K) * start_inv_step
+        inv_step = self.inv_step
+
+        eta_coefs = X.affine_map(coefs)
+        r, eta_r = coefs.copy(), eta_coefs.copy()
+        beta, eta_beta = coefs.copy(), eta_coefs.copy()
+        t_old = np.ones(K)
+
+        current_obj = np.array([self.objective(k, coefs[:,k], eta_coefs[:,k]) 
+                                for k in range(K)])
+        current_f = np.zeros(K)
+        trial_f = np.zeros(K)
+        trial_obj = np.zeros(K)
+
+        self.converged = np.zeros(K, np.bool)
+        self.iterations = np.zeros(K, np.int)
+        stopped = np.zeros(K, np.bool)
+        badstep = np.zeros(K, np.int)
+
+        itercount = 0
+        while itercount < max_its:
+
+            active = np.nonzero(~stopped)[0]
+            if active.shape[0] == 0:
+                break
+            self.iterations[active] += 1
+
+            if np.mod(itercount+1,100)==0:
+                inv_step[active] *= 1/alpha
+
+            # Gradients at r for all active columns with one adjoint product
+            smooth_grad = np.zeros(X.output_shape + (active.shape[0],))
+            for i, k in enumerate(active):
+                current_f[k], smooth_grad[:,i] = self.losses[k].smooth_objective(eta_r[:,k], mode='both')
+            grad = X.adjoint_map(smooth_grad)
+
+            # Backtracking loop, one forward product per attempt
+            pending = np.arange(active.shape[0])
+            while pending.shape[0]:
+                cols = active[pending]
+                for i, k in zip(pending, cols):
+                    beta[:,k] = self.penalties[k].proximal(sq(inv_step[k], r[:,k], grad[:,i], 0))
+                eta_beta[:,cols] = X.affine_map(beta[:,cols])
+
+                failing = []
+                for i, k in zip(pending, cols):
+                    trial_f[k] = self.losses[k].smooth_objective(eta_beta[:,k], mode='func')
+                    step = beta[:,k] - r[:,k]
+                    if not np.isfinite(trial_f[k]):
+                        stop = False
+                    elif np.fabs(trial_f[k] - current_f[k])/np.max([1.,trial_f[k]]) > 1e-10:
+                        stop = trial_f[k] <= current_f[k] + np.dot(step, grad[:,i]) + 0.5*inv_step[k]*np.linalg.norm(step)**2
+                    else:
+                        trial_grad = X.adjoint_map(self.losses[k].smooth_objective(eta_beta[:,k], mode='grad'))
+                        stop = np.fabs(np.dot(step, grad[:,i] - trial_grad)) <= 0.5*inv_step[k]*np.linalg.norm(step)**2
+                    if not stop:
+                        inv_step[k] *= alpha
+                        if not np.isfinite(inv_step[k]):
+                            raise ValueError("inv_step overflowed for column %d" % k)
+                        failing.append(i)
+                pending = np.array(failing, np.int)
+
+            for k in active:
+                trial_obj[k] = trial_f[k] + self.penalties[k].nonsmooth_objective(beta[:,k])
+                obj_change = np.fabs(trial_obj[k] - current_obj[k])
+                obj_rel_change = obj_change/np.max([np.fabs(current_obj[k]),1.])
+
+                if itercount >= min_its and (obj_rel_change < tol or obj_change < tol):
+                    coefs[:,k] = beta[:,k]
+                    eta_coefs[:,k] = eta_beta[:,k]
+                    current_obj[k] = trial_obj[k]
+                    self.converged[k] = stopped[k] = True
+                    continue
+
+                if FISTA:
+                    #Use Nesterov weights
+                    t_new = 0.5 * (1 + np.sqrt(1+4*(t_old[k]**2)))
+                    w = (t_old[k]-1)/(t_new)
+                    r[:,k] = beta[:,k] + w * (beta[:,k] - coefs[:,k])
+                    eta_r[:,k] = eta_beta[:,k] + w * (eta_beta[:,k] - eta_coefs[:,k])
+                else:
+                    #Just do ISTA
+                    t_new = 1.
+                    r[:,k] = beta[:,k]
+                    eta_r[:,k] = eta_beta[:,k]
+
+                if (itercount > 1 and current_obj[k] < trial_obj[k] and 
+                    obj_rel_change > 1e-10 and monotonicity_restart):
+                    #Adaptive restarting: restart if monotonicity violated
+                    if t_old[k] == 1.:
+                        badstep[k] += 1
+                        if badstep[k] > 3:
+                            warnings.warn('prox is taking bad steps for column %d' % k)
+                            stopped[k] = True
+                    t_old[k] = 1.
+                    r[:,k] = coefs[:,k]
+                    eta_r[:,k] = eta_coefs[:,k]
+                else:
+                    coefs[:,k] = beta[:,k]
+                    eta_coefs[:,k] = eta_beta[:,k]
+                    t_old[k] = t_new
+                    current_obj[k] = trial_obj[k]
+
+            if self.debug:
+                print "%i    active: %d    max obj: %.6e    max inv_step: %.2e" % (itercount, active.shape[0], current_obj[active].max(), inv_step[active].max())
+            itercount += 1
+
+        self.objective_values = current_obj
+        if self.debug:
+            print "batched FISTA converged for", self.converged.sum(), "of", K, "problems in", itercount, "iterations"
+        return self.coefs
@@ -38,9 +38,12 @@ from smooth.quadratic import quadratic, cholesky, signal_approximator, squared_e
 # Problem imports
 
 from problems.separable import separable, separable_problem
-from problems.simple import simple_problem, gengrad, nesta, tfocs
+from problems.simple import simple_problem, gengrad, nesta, tfocs, proximal_newton
+from problems.coordinate_descent import coordinate_descent
+from problems.working_set import working_set
+from problems.frank_wolfe import frank_wolfe
 from problems.container import container
-from algorithms import FISTA
+from algorithms import FISTA, batched_FISTA, fit_budget, fista_state
 
 from problems.conjugate import conjugate
 from problems.composite import (composite, nonsmooth as nonsmooth_composite,
@@ -50,5 +53,5 @@ from problems.dual_problem import dual_problem
 
 from identity_quadratic import identity_quadratic
 
-from paths import lasso, nesta as nesta_path, UNPENALIZED, L1_PENALTY, POSITIVE_PART, NONNEGATIVE
+from paths import lasso, multiresponse, elastic_net_grid, nesta as nesta_path, path_builder, load_path, UNPENALIZED, L1_PENALTY, POSITIVE_PART, NONNEGATIVE
 
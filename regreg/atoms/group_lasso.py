@@ -4,7 +4,8 @@ import warnings
 import numpy as np
 
 from ..problems.composite import composite, nonsmooth, smooth_conjugate
-from ..affine import linear_transform, identity as identity_transform, selector
+from ..affine import (linear_transform, identity as identity_transform, selector,
+                      float_dtype)
 from ..identity_quadratic import identity_quadratic
 from ..atoms import _work_out_conjugate
 from ..smooth import affine_smooth
@@ -141,7 +142,11 @@ class group_lasso(seminorm):
     @doc_template_user
     def nonsmooth_objective(self, x, check_feasibility=False):
         x_offset = self.apply_offset(x)
-        v = self.seminorm(x_offset, check_feasibility=check_feasibility)
+        if self.lagrange is not None:
+            v = self.seminorm(x_offset, lagrange=self.lagrange,
+                              check_feasibility=check_feasibility)
+        else:
+            v = self.seminorm(x_offset, check_feasibility=check_feasibility)
         v += self.quadratic.objective(x, 'func')
         return v
 
@@ -172,7 +177,7 @@ class group_lasso(seminorm):
     @doc_template_user
     def bound_prox(self, x, bound=None):
         bound = seminorm.bound_prox(self, x, bound)
-        x = np.asarray(x, np.float)
+        x = np.asarray(x, float_dtype(x))
 
         return mixed_lasso_bound_prox(x, float(bound),
                                       np.array([], np.int),
@@ -182,6 +187,18 @@ class group_lasso(seminorm):
                                       self._groups,
                                       self._weight_array)
 
+    @doc_template_user
+    def linear_minimizer(self, grad, bound=None):
+        bound = seminorm.linear_minimizer(self, grad, bound)
+        norms = np.sqrt(np.bincount(self._groups, weights=grad**2,
+                                    minlength=self._weight_array.shape[0]))
+        i = np.argmax(norms / self._weight_array)
+        vertex = np.zeros_like(grad)
+        if norms[i] > 0:
+            group = self._groups == i
+            vertex[group] = -bound * grad[group] / (self._weight_array[i] * norms[i])
+        return vertex
+
 @objective_doc_templater()
 class group_lasso_dual(group_lasso):
 
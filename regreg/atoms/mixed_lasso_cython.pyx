@@ -8,18 +8,22 @@ Implements prox and dual of group LASSO, strong set, seminorm and dual seminorm.
 """
 
 DTYPE_float = np.float
-ctypedef np.float_t DTYPE_float_t
+# the kernels are compiled for float32 and float64 data,
+# the dtype of the data arrays picks the specialization
+ctypedef fused DTYPE_float_t:
+    np.float32_t
+    np.float64_t
 DTYPE_int = np.int
 ctypedef np.int_t DTYPE_int_t
 
 def mixed_lasso_lagrange_prox(np.ndarray[DTYPE_float_t, ndim=1] prox_center, 
-                     DTYPE_float_t lagrange, DTYPE_float_t lipschitz,
+                     double lagrange, double lipschitz,
                      np.ndarray[DTYPE_int_t, ndim=1] l1_penalty, 
                      np.ndarray[DTYPE_int_t, ndim=1] unpenalized,
                      np.ndarray[DTYPE_int_t, ndim=1] positive_part, 
                      np.ndarray[DTYPE_int_t, ndim=1] nonnegative, 
                      np.ndarray[DTYPE_int_t, ndim=1] groups,
-                     np.ndarray[DTYPE_float_t, ndim=1] weights):
+                     np.ndarray[np.float64_t, ndim=1] weights):
     
     cdef np.ndarray norms = np.zeros_like(weights)
     cdef np.ndarray factors = np.zeros_like(weights)
@@ -49,13 +53,13 @@ def mixed_lasso_lagrange_prox(np.ndarray[DTYPE_float_t, ndim=1] prox_center,
     return prox_center - projection
 
 def mixed_lasso_conjugate_bound_prox(np.ndarray[DTYPE_float_t, ndim=1] prox_center, 
-                     DTYPE_float_t bound, 
+                     double bound, 
                      np.ndarray[DTYPE_int_t, ndim=1] l1_penalty, 
                      np.ndarray[DTYPE_int_t, ndim=1] unpenalized,
                      np.ndarray[DTYPE_int_t, ndim=1] positive_part, 
                      np.ndarray[DTYPE_int_t, ndim=1] nonnegative, 
                      np.ndarray[DTYPE_int_t, ndim=1] groups,
-                     np.ndarray[DTYPE_float_t, ndim=1] weights):
+                     np.ndarray[np.float64_t, ndim=1] weights):
     
     cdef np.ndarray norms = np.zeros_like(weights)
     cdef np.ndarray factors = np.zeros_like(weights)
@@ -88,13 +92,13 @@ def seminorm_mixed_lasso(np.ndarray[DTYPE_float_t, ndim=1] x,
                          np.ndarray[DTYPE_int_t, ndim=1] positive_part, 
                          np.ndarray[DTYPE_int_t, ndim=1] nonnegative, 
                          np.ndarray[DTYPE_int_t, ndim=1] groups,
-                         np.ndarray[DTYPE_float_t, ndim=1] weights,
+                         np.ndarray[np.float64_t, ndim=1] weights,
                          DTYPE_int_t check_feasibility,
-			 DTYPE_float_t nntol=1.e-5):
+			 double nntol=1.e-5):
     
     cdef np.ndarray norms = np.zeros_like(weights)
     cdef int i, j
-    cdef DTYPE_float_t value
+    cdef double value
     cdef int p = groups.shape[0]
     
     for i in range(p):
@@ -121,15 +125,15 @@ def seminorm_mixed_lasso(np.ndarray[DTYPE_float_t, ndim=1] x,
 
 
 def strong_set_mixed_lasso(np.ndarray[DTYPE_float_t, ndim=1] x, 
-                           DTYPE_float_t lagrange_new,
-                           DTYPE_float_t lagrange_cur,
-                           DTYPE_float_t slope_estimate,
+                           double lagrange_new,
+                           double lagrange_cur,
+                           double slope_estimate,
                            np.ndarray[DTYPE_int_t, ndim=1] l1_penalty, 
                            np.ndarray[DTYPE_int_t, ndim=1] unpenalized,
                            np.ndarray[DTYPE_int_t, ndim=1] positive_part, 
                            np.ndarray[DTYPE_int_t, ndim=1] nonnegative, 
                            np.ndarray[DTYPE_int_t, ndim=1] groups,
-                           np.ndarray[DTYPE_float_t, ndim=1] weights):
+                           np.ndarray[np.float64_t, ndim=1] weights):
     
     cdef np.ndarray value = np.zeros_like(x)
     cdef np.ndarray norms = np.zeros_like(weights)
@@ -147,7 +151,7 @@ def strong_set_mixed_lasso(np.ndarray[DTYPE_float_t, ndim=1] x,
 
     for j in range(weights.shape[0]):
         norms[j] = np.sqrt(norms[j])
-        mixed_value[j] = norms[j] < weights[j] * (slope_estimate+1) * lagrange_new - slope_estimate*lagrange_cur
+        mixed_value[j] = norms[j] < weights[j] * ((slope_estimate+1) * lagrange_new - slope_estimate*lagrange_cur)
 
     for i in range(p):
         if groups[i] >= 0:
@@ -157,15 +161,15 @@ def strong_set_mixed_lasso(np.ndarray[DTYPE_float_t, ndim=1] x,
 
 def check_KKT_mixed_lasso(np.ndarray[DTYPE_float_t, ndim=1] grad, 
                           np.ndarray[DTYPE_float_t, ndim=1] solution, 
-                          DTYPE_float_t lagrange,
+                          double lagrange,
                           np.ndarray[DTYPE_int_t, ndim=1] l1_penalty, 
                           np.ndarray[DTYPE_int_t, ndim=1] unpenalized,
                           np.ndarray[DTYPE_int_t, ndim=1] positive_part, 
                           np.ndarray[DTYPE_int_t, ndim=1] nonnegative, 
                           np.ndarray[DTYPE_int_t, ndim=1] groups,
-                          np.ndarray[DTYPE_float_t, ndim=1] weights,
-			  DTYPE_float_t tol=1.e-2,
-			  DTYPE_float_t nntol=1.e-2):
+                          np.ndarray[np.float64_t, ndim=1] weights,
+			  double tol=1.e-2,
+			  double nntol=1.e-2):
     
     cdef np.ndarray failing = np.zeros_like(grad)
     cdef np.ndarray norms = np.zeros_like(weights)
@@ -263,13 +267,13 @@ def seminorm_mixed_lasso_conjugate(np.ndarray[DTYPE_float_t, ndim=1] x,
                                    np.ndarray[DTYPE_int_t, ndim=1] positive_part, 
                                    np.ndarray[DTYPE_int_t, ndim=1] nonnegative, 
                                    np.ndarray[DTYPE_int_t, ndim=1] groups,
-                                   np.ndarray[DTYPE_float_t, ndim=1] weights,
-                                   DTYPE_float_t nntol=1.e-5,
+                                   np.ndarray[np.float64_t, ndim=1] weights,
+                                   double nntol=1.e-5,
 				   DTYPE_int_t check_feasibility=0):
     
     cdef np.ndarray norms = np.zeros_like(weights)
     cdef int i
-    cdef DTYPE_float_t value
+    cdef double value
     cdef int p = groups.shape[0]
     
     for i in range(p):
@@ -299,13 +303,13 @@ def seminorm_mixed_lasso_conjugate(np.ndarray[DTYPE_float_t, ndim=1] x,
     return value
 
 def mixed_lasso_bound_prox(np.ndarray[DTYPE_float_t, ndim=1] prox_center,
-                           DTYPE_float_t bound,
+                           double bound,
                            np.ndarray[DTYPE_int_t, ndim=1] l1_penalty,
                            np.ndarray[DTYPE_int_t, ndim=1] unpenalized,
                            np.ndarray[DTYPE_int_t, ndim=1] positive_part,
                            np.ndarray[DTYPE_int_t, ndim=1] nonnegative,
                            np.ndarray[DTYPE_int_t, ndim=1] groups, 
-                           np.ndarray[DTYPE_float_t, ndim=1] weights):
+                           np.ndarray[np.float64_t, ndim=1] weights):
 
     cdef int p = groups.shape[0]
     cdef int stop, i, j
@@ -330,10 +334,11 @@ def mixed_lasso_bound_prox(np.ndarray[DTYPE_float_t, ndim=1] prox_center,
     cdef np.ndarray[DTYPE_float_t, ndim=1] ppterm = prox_center[positive_part]
     ppterm = ppterm[ppterm > 0]
     
-    cdef np.ndarray[DTYPE_float_t, ndim=1] fnorms = np.hstack([norms,
+    # the norms are accumulated in float64
+    cdef np.ndarray[np.float64_t, ndim=1] fnorms = np.hstack([norms,
                                                                l1term,
                                                                ppterm])
-    cdef np.ndarray[DTYPE_float_t, ndim=1] fweights = np.ones_like(fnorms)
+    cdef np.ndarray[np.float64_t, ndim=1] fweights = np.ones_like(fnorms)
     fweights[:q] = weights
 
     cdef double cut = find_solution_piecewise_linear(bound, 0,
@@ -360,7 +365,7 @@ def mixed_lasso_epigraph(np.ndarray[DTYPE_float_t, ndim=1] center,
                          np.ndarray[DTYPE_int_t, ndim=1] positive_part,
                          np.ndarray[DTYPE_int_t, ndim=1] nonnegative,
                          np.ndarray[DTYPE_int_t, ndim=1] groups, 
-                         np.ndarray[DTYPE_float_t, ndim=1] weights):
+                         np.ndarray[np.float64_t, ndim=1] weights):
 
     cdef np.ndarray[DTYPE_float_t, ndim=1] x = center[1:]
     cdef np.ndarray[DTYPE_float_t, ndim=1] result = np.zeros_like(center)
@@ -389,10 +394,11 @@ def mixed_lasso_epigraph(np.ndarray[DTYPE_float_t, ndim=1] center,
     cdef np.ndarray[DTYPE_float_t, ndim=1] ppterm = x[positive_part]
     ppterm = ppterm[ppterm > 0]
     
-    cdef np.ndarray[DTYPE_float_t, ndim=1] fnorms = np.hstack([norms,
+    # the norms are accumulated in float64
+    cdef np.ndarray[np.float64_t, ndim=1] fnorms = np.hstack([norms,
                                                                l1term,
                                                                ppterm])
-    cdef np.ndarray[DTYPE_float_t, ndim=1] fweights = np.ones_like(fnorms)
+    cdef np.ndarray[np.float64_t, ndim=1] fweights = np.ones_like(fnorms)
     fweights[:q] = weights
 
     cdef double cut = find_solution_piecewise_linear(norm, 1,
@@ -3,13 +3,17 @@ cimport numpy as np
 
 
 DTYPE_float = np.float
-ctypedef np.float_t DTYPE_float_t
+# the kernels are compiled for float32 and float64 data,
+# the dtype of the data arrays picks the specialization
+ctypedef fused DTYPE_float_t:
+    np.float32_t
+    np.float64_t
 DTYPE_int = np.int
 ctypedef np.int_t DTYPE_int_t
 
 
-def find_solution_piecewise_linear(DTYPE_float_t b,
-                                   DTYPE_float_t slope,
+def find_solution_piecewise_linear(double b,
+                                   double slope,
                                    np.ndarray[DTYPE_float_t, ndim=1] norms,
                                    np.ndarray[DTYPE_float_t, ndim=1] weights):
     """
@@ -77,8 +81,8 @@ def find_solution_piecewise_linear(DTYPE_float_t b,
         solution = (b - intercept) / slope
     return solution
 
-def find_solution_piecewise_linear_c(DTYPE_float_t b,
-                                   DTYPE_float_t slope,
+def find_solution_piecewise_linear_c(double b,
+                                   double slope,
                                    np.ndarray[DTYPE_float_t, ndim=1] norms):
     """
     Given a piecewise linear function of the form
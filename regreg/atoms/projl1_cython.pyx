@@ -12,12 +12,16 @@ Tushar}
 """
 
 DTYPE_float = np.float
-ctypedef np.float_t DTYPE_float_t
+# the kernels are compiled for float32 and float64 data,
+# the dtype of the data arrays picks the specialization
+ctypedef fused DTYPE_float_t:
+    np.float32_t
+    np.float64_t
 DTYPE_int = np.int
 ctypedef np.int_t DTYPE_int_t
 
 def projl1(np.ndarray[DTYPE_float_t, ndim=1]  x, 
-           DTYPE_float_t bound=1.):
+           double bound=1.):
 
     cdef np.ndarray[DTYPE_float_t, ndim=1] sorted_x = np.sort(np.fabs(x))
     cdef int p = x.shape[0]
@@ -29,10 +33,10 @@ def projl1(np.ndarray[DTYPE_float_t, ndim=1]  x,
         return x
 
 cdef soft_threshold(np.ndarray[DTYPE_float_t, ndim=1] x,
-                    DTYPE_float_t lagrange):
+                    double lagrange):
 
     cdef int p = x.shape[0]
-    cdef np.ndarray[DTYPE_float_t, ndim=1] y = np.empty(p)
+    cdef np.ndarray[DTYPE_float_t, ndim=1] y = np.empty_like(x)
     cdef DTYPE_float_t xi
     cdef int i
     for i in range(p):
@@ -4,7 +4,8 @@ import warnings
 import numpy as np
 
 from ..identity_quadratic import identity_quadratic
-from ..affine import (linear_transform, identity as identity_transform)
+from ..affine import (linear_transform, identity as identity_transform,
+                      float_dtype)
 from ..objdoctemplates import objective_doc_templater
 from ..doctemplates import (doc_template_user, doc_template_provider)
 from ..problems.composite import smooth_conjugate
@@ -296,6 +297,66 @@ class seminorm(atom):
         else:
             return eta - offset
 
+    # Is lagrange_prox (bound_prox) separable across coordinates?
+    # If so, lagrange_prox accepts an array lipschitz and bound_prox
+    # is the same in any diagonal metric.
+    _separable_lagrange = False
+    _separable_bound = False
+
+    def diagonal_proximal(self, proxq, diag, quadratic=None):
+        r"""
+        The proximal operator in a diagonal metric. If the atom is in
+        Lagrange mode, this has the form
+
+        .. math::
+
+           v^{\lambda}(x) = \text{argmin}_{v \in \mathbb{R}^p} \frac{L}{2}
+           \sum_i d_i (x_i-v_i)^2 + \lambda h(v-\alpha) + \langle v, \eta \rangle
+
+        where :math:`L, x, \eta` are the coef, center and linear_term 
+        of proxq and :math:`d` is diag. The quadratic of the atom and
+        quadratic, if not None, are added in the usual metric.
+        In bound mode, the penalty is replaced by the constraint 
+        :math:`h(v-\alpha) \leq \delta`, :math:`\alpha` being the offset.
+
+        Only atoms whose proximal map is separable across
+        coordinates have this method, others raise a ValueError.
+        """
+        if self.bound is not None:
+            separable = self._separable_bound
+        else:
+            separable = self._separable_lagrange
+        if not separable:
+            raise ValueError('%s in this mode does not have a diagonal proximal map' % self.__class__.__name__)
+
+        totalq = self.quadratic
+        if quadratic is not None:
+            totalq = totalq + quadratic
+        totalq = totalq.collapsed()
+        metric = proxq.coef * diag + totalq.coef
+        if np.any(metric <= 0):
+            raise ValueError('lipschitz * diag + quadratic coef must be positive')
+
+        linear_term = totalq.linear_term
+        if proxq.center is not None:
+            linear_term = linear_term - proxq.coef * diag * proxq.center
+        if proxq.linear_term is not None:
+            linear_term = linear_term + proxq.linear_term
+        prox_arg = -linear_term / metric
+        if self.offset is not None:
+            prox_arg = prox_arg - self.offset
+
+        if self.bound is not None:
+            eta = self.bound_prox(prox_arg, bound=self.bound)
+        else:
+            eta = self.lagrange_prox(prox_arg, 
+                                     lipschitz=metric, 
+                                     lagrange=self.lagrange)
+
+        if self.offset is None:
+            return eta
+        return eta + self.offset
+
     @doc_template_provider
     def lagrange_prox(self, arg, lipschitz=1, lagrange=None):
         r"""
@@ -355,6 +416,29 @@ class seminorm(atom):
                              + 'a keyword "bound" argument must be supplied')
         return bound
 
+    @doc_template_provider
+    def linear_minimizer(self, grad, bound=None):
+        r"""
+        Return a minimizer of a linear function over the ball
+
+        .. math::
+
+           %(var)s^{\delta}(g) \in
+           \text{argmin}_{%(var)s \in \mathbb{R}^{%(shape)s}} 
+           \langle g, %(var)s \rangle
+           \text{s.t.} \   %(objective)s \leq \delta
+
+        where :math:`\delta` is the bound parameter and :math:`g` is grad.
+        This is the linear minimization oracle used by `frank_wolfe`.
+
+        If the argument `bound` is None and the atom is in bound mode,
+        ``self.bound`` is used as the bound parameter, else an exception is
+        raised.
+
+        The class atom's linear_minimizer just returns the appropriate bound
+        parameter for use by the subclasses.
+        """
+        return seminorm.bound_prox(self, grad, bound)
 
     def nonsmooth_objective(self, arg, check_feasibility=False):
         """
@@ -418,6 +502,7 @@ class l1norm(seminorm):
     The l1 norm
     """
     prox_tol = 1.0e-10
+    _separable_lagrange = True
 
     objective_template = r"""\|%(var)s\|_1"""
 
@@ -445,13 +530,21 @@ class l1norm(seminorm):
     @doc_template_user
     def bound_prox(self, arg, bound=None):
         bound = seminorm.bound_prox(self, arg, bound)
-        arg = np.asarray(arg, np.float)
+        arg = np.asarray(arg, float_dtype(arg))
         absarg = np.fabs(arg)
         cut = find_solution_piecewise_linear_c(bound, 0, absarg)
         if cut < np.inf:
             return np.sign(arg) * (absarg - cut) * (absarg > cut)
         return arg
 
+    @doc_template_user
+    def linear_minimizer(self, grad, bound=None):
+        bound = seminorm.linear_minimizer(self, grad, bound)
+        vertex = np.zeros_like(grad)
+        idx = np.unravel_index(np.argmax(np.fabs(grad)), grad.shape)
+        vertex[idx] = -bound * np.sign(grad[idx])
+        return vertex
+
 @objective_doc_templater()
 class supnorm(seminorm):
 
@@ -460,6 +553,7 @@ class supnorm(seminorm):
     """
 
     objective_template = r"""\|%(var)s\|_{\infty}"""
+    _separable_bound = True
 
     @doc_template_user
     def seminorm(self, arg, lagrange=None, check_feasibility=False):
@@ -480,7 +574,7 @@ class supnorm(seminorm):
     @doc_template_user
     def lagrange_prox(self, arg,  lipschitz=1, lagrange=None):
         lagrange = seminorm.lagrange_prox(self, arg, lipschitz, lagrange)
-        arg = np.asarray(arg, np.float)
+        arg = np.asarray(arg, float_dtype(arg))
         absarg = np.fabs(arg)
         cut = find_solution_piecewise_linear_c(lagrange / lipschitz, 0, absarg)
         if cut < np.inf:
@@ -494,6 +588,11 @@ class supnorm(seminorm):
         bound = seminorm.bound_prox(self, arg, bound)
         return np.clip(arg, -bound, bound)
 
+    @doc_template_user
+    def linear_minimizer(self, grad, bound=None):
+        bound = seminorm.linear_minimizer(self, grad, bound)
+        return -bound * np.sign(grad)
+
 
 @objective_doc_templater()
 class l2norm(seminorm):
@@ -539,6 +638,14 @@ class l2norm(seminorm):
         else:
             return (bound / n) * arg
 
+    @doc_template_user
+    def linear_minimizer(self, grad, bound=None):
+        bound = seminorm.linear_minimizer(self, grad, bound)
+        n = np.linalg.norm(grad)
+        if n == 0:
+            return np.zeros_like(grad)
+        return -(bound / n) * grad
+
 
 def positive_part_lagrange(shape, lagrange,
                            offset=None, quadratic=None, initial=None):
@@ -597,7 +704,7 @@ class positive_part(seminorm):
     def bound_prox(self, arg, bound=None):
         bound = seminorm.bound_prox(self, arg, bound)
         arg = np.asarray(arg)
-        v = x.copy().astype(np.float)
+        v = x.copy().astype(float_dtype(x))
         v = np.atleast_1d(v)
         pos = v > 0
         if np.any(pos):
@@ -639,7 +746,7 @@ class constrained_max(seminorm):
     def lagrange_prox(self, arg,  lipschitz=1, lagrange=None):
         lagrange = seminorm.lagrange_prox(self, arg, lipschitz, lagrange)
         x = np.asarray(x)
-        v = x.copy().astype(np.float)
+        v = x.copy().astype(float_dtype(x))
         v = np.atleast_1d(v)
         pos = v > 0
         if np.any(pos):
@@ -696,7 +803,7 @@ class constrained_positive_part(seminorm):
     def bound_prox(self, arg, bound=None):
         bound = seminorm.bound_prox(self, arg, bound)
         arg = np.asarray(arg)
-        v = np.zeros(arg.shape, np.float)
+        v = np.zeros(arg.shape, float_dtype(arg))
         v = np.atleast_1d(v)
         pos = arg > 0
         if np.any(pos):
@@ -737,7 +844,7 @@ class max_positive_part(seminorm):
     def lagrange_prox(self, arg,  lipschitz=1, lagrange=None):
         lagrange = seminorm.lagrange_prox(self, arg, lipschitz, lagrange)
         arg = np.asarray(arg)
-        v = np.zeros(arg.shape, np.float)
+        v = np.zeros(arg.shape, float_dtype(arg))
         v = np.atleast_1d(v)
         pos = arg > 0
         if np.any(pos):
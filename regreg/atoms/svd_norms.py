@@ -8,6 +8,7 @@ from md5 import md5
 from copy import copy
 
 import numpy as np
+from scipy.sparse.linalg import svds
 
 from ..atoms import atom, _work_out_conjugate
 from .seminorms import conjugate_seminorm_pairs, seminorm
@@ -132,6 +133,7 @@ class nuclear_norm(svd_atom):
     The nuclear norm
     """
     prox_tol = 1.0e-10
+    svds_tol = 1.0e-10
 
     objective_template = r"""\|%(var)s\|_*"""
     objective_vars = {'var': r'X + A'}
@@ -187,6 +189,34 @@ class nuclear_norm(svd_atom):
         self._X = np.dot(U[:,keepD], D_projected[keepD][:,np.newaxis] * V[keepD])
         return self.X
 
+    @doc_template_user
+    def linear_minimizer(self, G, bound=None):
+        bound = seminorm.linear_minimizer(self, G, bound)
+        u, v = self.top_singular_pair(G)
+        return -bound * np.multiply.outer(u, v)
+
+    def top_singular_pair(self, G):
+        """
+        The leading left and right singular vectors of G, computed
+        by Lanczos iterations (scipy.sparse.linalg.svds) with only
+        products with G and G.T, started from the right singular
+        vector of the last call. At a solution, the leading singular
+        values of the gradient are tied, where power iterations
+        converge very slowly.
+        """
+        v0 = getattr(self, '_top_right', None)
+        if v0 is None or v0.shape != (G.shape[1],):
+            # a fixed start so the oracle is reproducible
+            v0 = np.ones(G.shape[1])
+        if min(G.shape) == 1:
+            u, _, v = np.linalg.svd(G, full_matrices=0)
+            u, v = u[:,0], v[0]
+        else:
+            u, _, v = svds(G, k=1, v0=v0, tol=self.svds_tol)
+            u, v = u[:,0], v[0]
+        self._top_right = v
+        return u, v
+
 
 @objective_doc_templater()
 class operator_norm(svd_atom):
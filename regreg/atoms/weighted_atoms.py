@@ -152,6 +152,7 @@ class l1norm(seminorm):
 
     objective_template = r"""\|%(var)s\|_1"""
     objective_vars = {'var': r'x + \alpha'}
+    _separable_lagrange = True
 
     def seminorm(self, x, lagrange=None, check_feasibility=False):
         lagrange = seminorm.seminorm(self, x, 
@@ -183,6 +184,21 @@ class l1norm(seminorm):
     def bound_prox(self, x, bound=None):
         raise NotImplementedError
 
+    @doc_template_user
+    def linear_minimizer(self, grad, bound=None):
+        bound = seminorm.linear_minimizer(self, grad, bound)
+        unpenalized = (self.weights == 0) * (grad != 0)
+        if np.any(unpenalized):
+            raise ValueError('the ball is unbounded along coordinates with weight 0')
+        ratio = np.zeros(grad.shape)
+        penalized = self.weights != 0
+        ratio[penalized] = np.fabs(grad[penalized]) / self.weights[penalized]
+        vertex = np.zeros_like(grad)
+        idx = np.unravel_index(np.argmax(ratio), grad.shape)
+        if ratio[idx] > 0:
+            vertex[idx] = -bound * np.sign(grad[idx]) / self.weights[idx]
+        return vertex
+
 
 @objective_doc_templater()
 class supnorm(seminorm):
@@ -193,6 +209,7 @@ class supnorm(seminorm):
 
     objective_template = r"""\|%(var)s\|_{\infty}"""
     objective_vars = {'var': r'\beta + \alpha'}
+    _separable_bound = True
 
     @doc_template_user
     def seminorm(self, x, lagrange=None, check_feasibility=False):
@@ -225,6 +242,11 @@ class supnorm(seminorm):
         bound = seminorm.bound_prox(self, x, bound)
         return np.clip(x, -bound/self.weights, bound/self.weights)
 
+    @doc_template_user
+    def linear_minimizer(self, grad, bound=None):
+        bound = seminorm.linear_minimizer(self, grad, bound)
+        return -bound * np.sign(grad) / self.weights
+
 
 conjugate_weighted_pairs = {}
 for n1, n2 in [(l1norm,supnorm)]:
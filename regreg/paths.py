@@ -1,17 +1,24 @@
 from warnings import warn
-import gc
+import multiprocessing
+from copy import copy
+from collections import OrderedDict
 
 import numpy as np
 import scipy.sparse
 
-from .affine import power_L, normalize, selector, identity, adjoint
+from .affine import (power_L, normalize, selector, identity, adjoint, 
+                     column_norms2, astransform)
 from .atoms.seminorms import l1norm, constrained_positive_part
-from .smooth import logistic_loss, sum as smooth_sum, affine_smooth
+from .atoms.block_norms import l1_l2
+from .smooth import (logistic_loss, sum as smooth_sum, affine_smooth,
+                     smooth_atom)
 from .smooth.quadratic import squared_error
 from .problems.separable import separable_problem, separable
 from .problems.simple import simple_problem
 from .identity_quadratic import identity_quadratic as iq
-from .atoms.mixed_lasso import mixed_lasso, strong_set as strong_set_ml, check_KKT
+from .algorithms import batched_FISTA
+from .atoms.mixed_lasso import (mixed_lasso, strong_set as strong_set_ml, 
+                                check_KKT as check_KKT_ml)
 
 # Constants used below
 
@@ -22,6 +29,10 @@ NONNEGATIVE = -4
 
 class lasso(object):
 
+    # the number of candidate sets whose restricted problems are kept, 
+    # see `restricted_problem`
+    cache_size = 4
+
     def __init__(self, loss_factory, X, penalty_structure=None, 
                  group_weights={},
                  elastic_net=iq(0,0,0,0),
@@ -31,11 +42,17 @@ class lasso(object):
                  lagrange_proportion = 0.05,
                  nstep = 100,
                  scale=True,
-                 center=True):
+                 center=True,
+                 covariance=False):
 
 
         self.loss_factory = loss_factory
 
+        # covariance updates, see `gram_cache`
+        if covariance and not isinstance(loss_factory, squared_error_factory):
+            raise ValueError('covariance mode is only available for squared error loss')
+        self.covariance = covariance
+
         self.scale = scale
         self.center = center
 
@@ -44,8 +61,29 @@ class lasso(object):
 
         # normalize X, adding intercept if needed
         self.intercept = intercept
-        p = X.shape[1]
-        if self.intercept:
+        if isinstance(X, normalize):
+            # already normalized, as for the folds of cross_validate
+            if X.intercept_column not in [None, 0]:
+                raise ValueError('the intercept should be the first column of X')
+            self.intercept = X.intercept_column is not None
+            self.scale, self.center = X.scale, X.center
+            p = X.input_shape[0] - self.intercept
+        else:
+            p = X.shape[1]
+
+        if isinstance(X, normalize):
+            self.penalty_structure = np.ones(p + self.intercept) * L1_PENALTY
+            if self.intercept:
+                self.penalty_structure[0] = UNPENALIZED
+            if penalty_structure is not None:
+                self.penalty_structure[self.intercept:] = penalty_structure
+            self._Xn = X
+            if self.scale:
+                which_0 = self._Xn.col_stds == 0
+            else:
+                which_0 = np.zeros(self._Xn.input_shape, np.bool)
+
+        elif self.intercept:
             self.penalty_structure = np.ones(p+1) * L1_PENALTY
             self.penalty_structure[0] = UNPENALIZED
             if penalty_structure is not None:
@@ -74,14 +112,18 @@ class lasso(object):
                 self._Xn = X
                 which_0 = np.zeros(self._Xn.shape)
 
+        # the design before dropping constant columns, 
+        # from which cross_validate selects its folds
+        self._design = self._Xn
+
         if np.any(which_0):
             self._selector = selector(~which_0, self._Xn.input_shape)
-            if self.scale or self.center:
+            if isinstance(self._Xn, normalize):
                 self._Xn = self._Xn.slice_columns(~which_0)
             else:
                 self._Xn = self._Xn[:,~which_0]
         else:
-            if self.scale or self.center:
+            if isinstance(self._Xn, normalize):
                 self._selector = identity(self._Xn.input_shape)
             else:
                 self._selector = identity(self._Xn.shape)
@@ -98,7 +140,7 @@ class lasso(object):
 
     @property
     def shape(self):
-        if self.scale or self.center:
+        if isinstance(self._Xn, normalize):
             return self.Xn.output_shape[0], self.Xn.input_shape[0]
         else:
             return self.Xn.shape
@@ -110,9 +152,7 @@ class lasso(object):
     @property
     def elastic_net(self):
         q = self._elastic_net
-        q.coef *= self.lagrange
-        q.linear_term *= self.lagrange
-        return q
+        return iq(q.coef * self.lagrange, 0, q.linear_term * self.lagrange, 0)
 
     @property
     def Xn(self):
@@ -121,9 +161,21 @@ class lasso(object):
     @property
     def loss(self):
         if not hasattr(self, '_loss'):
-            self._loss = self.loss_factory(self._Xn)
+            if self.covariance:
+                self._loss = gram_quadratic(self.gram, coef=1./self.shape[0])
+            else:
+                self._loss = self.loss_factory(self._Xn)
         return self._loss
 
+    @property
+    def gram(self):
+        """
+        The cached columns of the Gram matrix of Xn in covariance mode.
+        """
+        if not hasattr(self, '_gram'):
+            self._gram = gram_cache(self._Xn, self.loss_factory.response)
+        return self._gram
+
     @property
     def null_solution(self):
         if not hasattr(self, "_null_soln"):
@@ -159,8 +211,8 @@ class lasso(object):
     def problem(self):
         p = self.shape[1]
         if not hasattr(self, "_problem"):
-            self._problem = self.restricted_problem(np.ones(self.shape[1], np.bool),
-                                                    self.lagrange_max)[0]
+            self._problem = self._restricted_problem(np.ones(self.shape[1], np.bool),
+                                                     self.lagrange_max)[0]
         return self._problem
 
     def get_lagrange(self):
@@ -183,19 +235,104 @@ class lasso(object):
     @property
     def lipschitz(self):
         if not hasattr(self, "_lipschitz"):
-            self._lipschitz = power_L(self.Xn)
+            if self.covariance:
+                # only used for the first step size, so the largest diagonal 
+                # entry of the Gram matrix will do rather than products with X
+                self._lipschitz = column_norms2(self.Xn).max()
+            else:
+                self._lipschitz = power_L(self.Xn)
         return self._lipschitz
 
+    def linear_predictor(self):
+        """
+        The linear predictor, Xn times self.solution. It is maintained
+        by applying the columns of Xn of the coefficients that changed 
+        since it was last computed, so it costs little along the path 
+        where the solution changes on the active set only.
+        """
+        solution = self.solution
+        if not hasattr(self, '_linear_predictor'):
+            changed = np.ones(solution.shape, np.bool)
+        else:
+            changed = solution != self._predictor_solution
+
+        nchanged = changed.sum()
+        if nchanged > solution.shape[0] / 2:
+            self._linear_predictor = astransform(self.Xn).linear_map(solution)
+        elif nchanged > 0:
+            delta = solution[changed] - self._predictor_solution[changed]
+            self._linear_predictor += self._column_transform(changed).linear_map(delta)
+        self._predictor_solution = solution.copy()
+        return self._linear_predictor
+
+    def loss_value(self):
+        """
+        The smooth loss at self.solution.
+        """
+        if self.covariance:
+            return self.loss.smooth_objective(self.solution, 'func')
+        return self.loss.sm_atom.smooth_objective(self.linear_predictor(), 'func')
+
+    def _smooth_grad(self):
+        """
+        The gradient of the smooth loss at self.solution, kept 
+        until the solution changes, e.g. for `safe_set` right after 
+        the KKT conditions were checked.
+        """
+        solution = self.solution
+        if (not hasattr(self, '_grad_solution') or 
+            np.any(self._grad_solution != solution)):
+            if self.covariance:
+                self._smooth_gradient = self.loss.smooth_objective(solution, 'grad')
+            else:
+                self._smooth_gradient = self.loss.smooth_objective_image(self.linear_predictor(), 'grad')
+            self._grad_solution = solution.copy()
+        return self._smooth_gradient.copy()
+
+    def _column_transform(self, columns):
+        """
+        The columns of Xn in the boolean array columns, as a transform.
+        """
+        Xslice = self.slice_columns(columns)
+        if isinstance(Xslice, normalize) and self.Xn.intercept_column == 0 and columns[0]:
+            Xslice.intercept_column = 0
+        return astransform(Xslice)
+
+    def check_KKT(self, lagrange):
+        """
+        Check the KKT conditions at self.solution.
+
+        Parameters
+        ----------
+
+        lagrange : float
+            Value of lagrange for the penalty.
+
+        Returns
+        -------
+
+        grad : ndarray
+            The gradient from `grad`.
+
+        failing : np.bool
+            The coefficients failing the KKT conditions.
+        """
+        grad = self.grad()
+        return grad, check_KKT_ml(self.penalty, grad, self.solution, lagrange)
+
     def grad(self, loss=None):
         '''
         Gradient at current value. This includes the gradient
         of the smooth loss as well as the gradient of the elastic net part.
         This is used for determining whether the KKT conditions are met
         and which coefficients are in the strong set.
+
+        The gradient of the smooth loss is computed from `linear_predictor`
+        with one product with the adjoint of Xn.
         '''
         if loss is None:
             loss = self.loss
-        gsmooth = self.loss.smooth_objective(self.solution, 'grad')
+        gsmooth = self._smooth_grad()
         penalized = self.penalty_structure != UNPENALIZED
         # XXX the elastic net is probably not quite right here if the elastic net has a non-zero center
         gquad = self.elastic_net.objective(self.solution[penalized], 'grad')
@@ -210,14 +347,138 @@ class lasso(object):
 
         return strong_set_ml(self.penalty, lagrange_cur, lagrange_new, grad, slope_estimate)
 
+    def safe_set(self, lagrange, solution=None):
+        """
+        Gap safe screening: the coefficients that may be nonzero 
+        at lagrange, computed from the duality gap at solution,
+        defaulting to self.solution.
+
+        The dual point is the gradient of the loss at solution
+        (as a function of the linear predictor), made feasible by
+        projecting out the columns of the unpenalized and nonnegative 
+        coefficients and then rescaling.
+        The dual objective is strongly concave, so the dual optimum 
+        is in a sphere whose radius is determined by the duality gap, and 
+        a coefficient (or group) whose dual constraint can not be tight
+        anywhere in this sphere is zero at the solution.
+
+        Unpenalized and nonnegative coefficients are never discarded.
+
+        Returns
+        -------
+
+        safe : np.bool or None
+            None if the loss factory does not provide its conjugate,
+            if there is an elastic net term or if the projected dual point
+            is not in the domain of the conjugate, otherwise a boolean 
+            array of the coefficients that may be nonzero.
+        """
+        q = self._elastic_net
+        if q.coef != 0 or np.any(q.linear_term != 0):
+            return None
+        factory = self.loss_factory
+        if getattr(factory, 'smoothness', None) is None:
+            return None
+
+        if solution is None:
+            solution = self.solution
+        penalty = self.penalty
+        old_lagrange, penalty.lagrange = penalty.lagrange, lagrange
+
+        # the unpenalized and nonnegative coefficients, whose dual 
+        # constraints are met once their columns are projected out 
+        # of the dual point
+        fixed = np.zeros(solution.shape, np.bool)
+        fixed[penalty._unpenalized] = True
+        fixed[penalty._nonnegative] = True
+
+        if self.covariance:
+            loss_value, grad = self.loss.smooth_objective(solution, 'both')
+            # the projected dual point is the one at the solution with 
+            # the fixed coefficients optimal given the others
+            dual_solution = solution
+            dual_value = loss_value
+            if np.any(fixed):
+                idx = np.nonzero(fixed)[0]
+                dual_solution = solution.copy()
+                dual_solution[idx] -= self.shape[0] * np.linalg.lstsq(self.gram.block(idx), grad[idx])[0]
+                dual_value, grad = self.loss.smooth_objective(dual_solution, 'both')
+        else:
+            # the loss as a function of the linear predictor
+            X = astransform(self.Xn)
+            if solution is self.solution:
+                eta = self.linear_predictor()
+                grad_eta = factory(X).sm_atom.smooth_objective(eta, 'grad')
+                grad = self._smooth_grad()
+            else:
+                eta = X.linear_map(solution)
+                grad_eta = factory(X).sm_atom.smooth_objective(eta, 'grad')
+                grad = X.adjoint_map(grad_eta)
+            loss_value = np.dot(grad_eta, eta) - factory.conjugate(grad_eta) 
+            if np.any(fixed):
+                k = fixed.sum()
+                X_fixed = np.asarray(self._column_transform(fixed).linear_map(np.identity(k)))
+                grad_eta = grad_eta - np.dot(X_fixed, np.linalg.lstsq(X_fixed, grad_eta)[0])
+                grad = X.adjoint_map(grad_eta)
+
+        # rescale the dual point to be feasible for the penalized coefficients
+        groups = penalty._groups
+        grouped = groups >= 0
+        group_norms = np.sqrt(np.bincount(groups[grouped], 
+                                          weights=grad[grouped]**2,
+                                          minlength=penalty._weight_array.shape[0]))
+        ratios = [np.fabs(grad[penalty._l1_penalty]),
+                  -grad[penalty._positive_part],
+                  group_norms / penalty._weight_array]
+        dual_norm = max([r.max() for r in ratios if r.shape[0]] + [lagrange])
+        scale = lagrange / dual_norm
+
+        if self.covariance:
+            # the dual point is scale * (X dual_solution + Y) / n and its 
+            # conjugate is determined by the loss and inner products with Y
+            n = self.shape[0]
+            dual_Y = (np.dot(dual_solution, self.gram.Xty) + self.gram.yty) / n
+            conjugate = scale**2 * dual_value - scale * dual_Y
+        else:
+            conjugate = factory.conjugate(scale * grad_eta)
+        if not np.isfinite(conjugate):
+            penalty.lagrange = old_lagrange
+            return None
+        gap = loss_value + conjugate + penalty.nonsmooth_objective(solution)
+        penalty.lagrange = old_lagrange
+        radius = np.sqrt(2 * factory.smoothness * max(gap, 0))
+        # coefficients whose dual constraint is tight at an accurate
+        # solution should not be lost to rounding
+        threshold = lagrange * (1 - 1.e-8)
+
+        # the dual constraints are checked in the sphere
+        col_norms = np.sqrt(column_norms2(self.Xn))
+        safe = np.ones(grad.shape, np.bool)
+        l1 = penalty._l1_penalty
+        safe[l1] = scale * np.fabs(grad[l1]) + radius * col_norms[l1] >= threshold
+        pp = penalty._positive_part
+        safe[pp] = -scale * grad[pp] + radius * col_norms[pp] >= threshold
+        if np.any(grouped):
+            # the Frobenius norm bounds the operator norm of a group
+            group_col_norms = np.sqrt(np.bincount(groups[grouped], 
+                                                  weights=col_norms[grouped]**2,
+                                                  minlength=penalty._weight_array.shape[0]))
+            safe_groups = (scale * group_norms + radius * group_col_norms >= 
+                           threshold * penalty._weight_array)
+            safe[grouped] = safe_groups[groups[grouped]]
+        return safe
+
     def slice_columns(self, columns):
-        if self.scale or self.center:
+        if isinstance(self._Xn, normalize):
             Xslice = self.Xn.slice_columns(columns)
         else:
             Xslice = self.Xn[:,columns]
         return Xslice
 
     def construct_loss(self, candidate_set, lagrange):
+        if self.covariance:
+            columns = np.nonzero(candidate_set)[0]
+            return None, gram_quadratic(self.gram, columns, coef=1./self.shape[0])
         Xslice = self.slice_columns(candidate_set)
         loss = self.loss_factory(Xslice)
         if self.intercept:
@@ -227,7 +488,31 @@ class lasso(object):
     def restricted_problem(self, candidate_set, lagrange):
         '''
         Assumes the candidate set includes intercept as first column.
+
+        The sliced design, loss and penalty of the last `cache_size`
+        candidate sets are reused, only changing the penalty's lagrange.
+        Along the path, the subproblem and strong sets change
+        much less often than the subproblems are solved.
         '''
+        if not self.cache_size:
+            return self._restricted_problem(candidate_set, lagrange)
+
+        if not hasattr(self, '_restricted_lookup'):
+            self._restricted_lookup = OrderedDict()
+        lookup = self._restricted_lookup
+
+        key = np.asarray(candidate_set, np.bool).tostring()
+        if key in lookup:
+            value = lookup.pop(key)
+            value[0].proximal_atom.lagrange = lagrange
+        else:
+            value = self._restricted_problem(candidate_set, lagrange)
+            if len(lookup) >= self.cache_size:
+                lookup.popitem(last=False)
+        lookup[key] = value
+        return value
+
+    def _restricted_problem(self, candidate_set, lagrange):
 
         Xslice, loss = self.construct_loss(candidate_set, lagrange)
 
@@ -235,6 +520,12 @@ class lasso(object):
         rps = restricted_penalty_structure # shorthand
 
         sliced_penalty = mixed_lasso(rps, lagrange, weights=self.group_weights)
+        q = self._elastic_net
+        if np.any(q.coef != 0) or np.any(q.linear_term != 0):
+            penalized = self.penalty_structure != UNPENALIZED
+            term = elastic_net_term(q[candidate_set[penalized]], sliced_penalty, 
+                                    rps != UNPENALIZED)
+            loss = smooth_sum([loss, term])
         problem_sliced = simple_problem(loss, sliced_penalty)
         candidate_selector = selector(candidate_set, self.shape[1])
         return problem_sliced, candidate_selector, restricted_penalty_structure
@@ -251,14 +542,69 @@ class lasso(object):
         self.final_inv_step = subproblem.final_inv_step
         return self.final_inv_step, grad, sub_soln, penalty_structure
 
-    def main(self, inner_tol=1.e-5, verbose=False):
-
-        # scaling will be needed to get coefficients on original scale   
+    @property
+    def scalings(self):
+        """
+        Scalings of the columns of X, used to put coefficients
+        back on the original scale.
+        """
         if self.scale:
             scalings = np.asarray(self.Xn.col_stds).reshape(-1)
         else:
             scalings = np.ones(self.shape[1])
-        scalings = self.nonzero.adjoint_map(scalings)
+        return self.nonzero.adjoint_map(scalings)
+
+    def path(self, inner_tol=1.e-5, verbose=False, budget=None,
+             screen=True, warm_start=None):
+        """
+        Compute the solution path, yielding the solution at
+        each value of lagrange as soon as it is computed.
+
+        Parameters
+        ----------
+
+        inner_tol : float
+            Tolerance for each subproblem.
+
+        verbose : bool
+            Print progress along the path?
+
+        budget : fit_budget
+            If not None, it is shared by all subproblems and the path
+            stops at the first value of lagrange at which it is exhausted.
+            The last step yielded then has 'truncated' set to True.
+
+        screen : bool
+            Discard coefficients with `safe_set` before each subproblem,
+            using the previous solution and then each new subproblem solution.
+            The strong set and the subproblems are restricted to the
+            coefficients not discarded. The rule is safe for the
+            duality gap of the solution it is computed from, but the
+            gap is computed in floating point from inexact subproblem
+            solutions, so the KKT conditions are still checked on all
+            coefficients and screening is dropped for a value of
+            lagrange if they fail outside the safe set.
+
+        warm_start : callable
+            If not None, it is called with each value of lagrange after
+            the first, before its subproblems are solved. If it returns
+            an array, it is used as the starting solution at this value of
+            lagrange instead of the previous solution. Its nonzero 
+            coefficients are added to the ever active set, and the gradient
+            and failing coefficients used for the strong set are computed 
+            at it with `check_KKT`.
+
+        Yields
+        ------
+
+        step : dict
+            With keys 'lagrange', 'beta' (a 1 x p scipy.sparse.csr_matrix
+            with the solution at this value of lagrange), 'objective' 
+            (the value of the loss), 'df' and 'truncated'.
+
+        """
+
+        scalings = self.scalings
 
         # take a guess at the inverse step size
         self.final_inv_step = self.lipschitz / 1000
@@ -273,56 +619,90 @@ class lasso(object):
 
         p = self.shape[0]
 
-        rescaled_solutions = scipy.sparse.csr_matrix(self.nonzero.adjoint_map(self.solution) 
-                                                     / scalings)
-
-        objective = [self.loss.smooth_objective(self.solution, 'func')]
+        null_objective = self.loss_value()
         # not quite right -- should check tight constraints
-        dfs = [np.sum(self.initial_active)]
+        yield {'lagrange': lseq[0],
+               'beta': scipy.sparse.csr_matrix(self.nonzero.adjoint_map(self.solution) 
+                                               / scalings),
+               'objective': null_objective,
+               'df': np.sum(self.initial_active),
+               'truncated': False}
+
         retry_counter = 0
+        truncated = False
+        solve_args = {}
+        if budget is not None:
+            solve_args['budget'] = budget
 
         all_failing = np.zeros(grad_solution.shape, np.bool)
 
         for lagrange_new, lagrange_cur in zip(lseq[1:], lseq[:-1]):
             self.lagrange = lagrange_new
+            if warm_start is not None:
+                warm = warm_start(lagrange_new)
+                if warm is not None:
+                    self.solution[:] = warm
+                    self.ever_active += warm != 0
+                    grad_solution, all_failing = self.check_KKT(lagrange_new)
             tol = inner_tol
             active_old = self.active.copy()
             num_tries = 0
             debug = False
             coef_stop = True
+            safe = None
+            if screen:
+                safe = self.safe_set(lagrange_new)
             while True:
                 strong, strong_selector = self.strong_set(lagrange_cur, 
                                                           lagrange_new, grad=grad_solution)
 
                 subproblem_set = self.ever_active + all_failing
+                if safe is not None:
+                    strong = strong * safe
+                    strong_selector = selector(strong, strong.shape)
+                    subproblem_set = subproblem_set * safe + self.initial_active
                 final_inv_step, grad, sub_soln, penalty_structure \
                     = self.solve_subproblem(subproblem_set,
                                             lagrange_new,
                                             tol=tol,
                                             start_inv_step=self.final_inv_step,
                                             debug=debug and verbose,
-                                            coef_stop=coef_stop)
+                                            coef_stop=coef_stop,
+                                            **solve_args)
 
                 p = self.shape[1]
 
+                if budget is not None and budget.exhausted:
+                    truncated = True
+                    break
+
                 self.solution[subproblem_set][:] = sub_soln
                 # this only corrects the gradient on the subproblem_set
                 grad_solution[subproblem_set][:] = grad
 
                 strong_problem = self.restricted_problem(strong, lagrange_new)[0]
                 strong_soln = self.solution[strong]
-                strong_grad = (strong_problem.smooth_objective(strong_soln, mode='grad') + 
-                               self.elastic_net[strong].objective(strong_soln, mode='grad'))
+                # the restricted problems include the elastic net
+                strong_grad = strong_problem.smooth_objective(strong_soln, mode='grad')
                 strong_penalty = strong_problem.proximal_atom
 
-                strong_failing = check_KKT(strong_penalty, strong_grad, strong_soln, lagrange_new) 
+                strong_failing = check_KKT_ml(strong_penalty, strong_grad, strong_soln, lagrange_new) 
 
                 if np.any(strong_failing):
-                    all_failing += strong_selector.adjoint_map(strong_failing)
+                    all_failing += strong_selector.adjoint_map(strong_failing).astype(np.bool)
                 else:
                     self.solution[subproblem_set][:] = sub_soln
-                    grad_solution = self.grad()
-                    all_failing = check_KKT(self.penalty, grad_solution, self.solution, lagrange_new)
+                    grad_solution, all_failing = self.check_KKT(lagrange_new)
+                    if safe is not None:
+                        if np.any(all_failing * ~safe):
+                            # the subproblems were not solved accurately
+                            # enough for screening to be trusted
+                            safe = None
+                        else:
+                            # the duality gap at the new solution is smaller
+                            new_safe = self.safe_set(lagrange_new)
+                            if new_safe is not None:
+                                safe *= new_safe
 
                     if not all_failing.sum():
                         self.ever_active += self.solution != 0
@@ -349,23 +729,663 @@ class lasso(object):
                         break
 
             rescaled_solution = self.nonzero.adjoint_map(self.solution)
-            rescaled_solutions = scipy.sparse.vstack([rescaled_solutions, rescaled_solution])
-            objective.append(self.loss.smooth_objective(self.solution, mode='func'))
-            dfs.append(self.ever_active.shape[0])
-            gc.collect()
+            objective = self.loss_value()
 
             if verbose:
-                print lagrange_cur / self.lagrange_max, lagrange_new, (self.solution != 0).sum(), 1. - objective[-1] / objective[0], list(self.lagrange_sequence).index(lagrange_new), np.fabs(rescaled_solution).sum()
-
-        objective = np.array(objective)
-        output = {'devratio': 1 - objective / objective.max(),
-                  'df': dfs,
-                  'lagrange': self.lagrange_sequence,
-                  'scalings': scalings,
-                  'beta':rescaled_solutions.T}
+                print lagrange_cur / self.lagrange_max, lagrange_new, (self.solution != 0).sum(), 1. - objective / null_objective, list(self.lagrange_sequence).index(lagrange_new), np.fabs(rescaled_solution).sum()
+
+            yield {'lagrange': lagrange_new,
+                   'beta': scipy.sparse.csr_matrix(rescaled_solution),
+                   'objective': objective,
+                   'df': self.ever_active.shape[0],
+                   'truncated': truncated}
+
+            if truncated:
+                if verbose:
+                    print 'path stopped because budget was exhausted'
+                break
+
+    def main(self, inner_tol=1.e-5, verbose=False, budget=None,
+             path_file=None, screen=True):
+        """
+        Compute the solution path.
+
+        Parameters
+        ----------
+
+        inner_tol : float
+            Tolerance for each subproblem.
+
+        verbose : bool
+            Print progress along the path?
+
+        budget : fit_budget
+            If not None, it is shared by all subproblems and the path
+            stops at the first value of lagrange at which it is exhausted.
+            The output then has 'truncated' set to True and only includes 
+            the values of lagrange reached.
+
+        path_file : str or file
+            If not None, each step of the path is written to
+            this file as soon as it is computed. See `load_path`.
+
+        screen : bool
+            Use gap safe screening? See `path`.
+
+        """
+        builder = path_builder(self.shape[1], path_file=path_file)
+        for step in self.path(inner_tol=inner_tol, verbose=verbose,
+                              budget=budget, screen=screen):
+            builder.append(step)
+        output = builder.output()
+        output['scalings'] = self.scalings
+        return output
 
+    def parallel_main(self, nproc=None, nsegment=None, coarse_steps=5,
+                      inner_tol=1.e-5, path_file=None):
+        """
+        Compute the solution path, splitting lagrange_sequence 
+        into contiguous segments that are solved by a pool of processes.
+
+        The workers are forked after X is normalized, so they
+        share the memory of X instead of receiving a copy of it.
+        Each worker warm starts its segment by following a coarse
+        path of coarse_steps values of lagrange from lagrange_max to the
+        start of its segment. The segments are merged in order.
+
+        Parameters
+        ----------
+
+        nproc : int
+            Number of processes, defaults to multiprocessing.cpu_count().
+
+        nsegment : int
+            Number of segments, defaults to nproc.
+
+        coarse_steps : int
+            Number of values of lagrange in the coarse path
+            leading to each segment.
+
+        inner_tol : float
+            Tolerance for each subproblem.
+
+        path_file : str or file
+            If not None, each step of the path is written to
+            this file as the segments are merged. See `load_path`.
+
+        Returns
+        -------
+
+        output : dict
+            In the same format as `main`.
+
+        """
+        global _parallel_lasso
+
+        if nproc is None:
+            nproc = multiprocessing.cpu_count()
+        lseq = np.asarray(self.lagrange_sequence)
+        if nsegment is None:
+            nsegment = nproc
+        # path needs at least two values of lagrange in the first segment
+        nsegment = max(min(nsegment, lseq.shape[0] // 2), 1)
+        segments = [(segment[0], segment[-1] + 1) 
+                    for segment in np.array_split(np.arange(lseq.shape[0]), 
+                                                  nsegment)]
+
+        # compute everything shared by the segments before forking
+        self.lagrange_max
+        self.lipschitz
+        self.problem
+
+        _parallel_lasso = self
+        try:
+            if nproc > 1 and nsegment > 1:
+                pool = multiprocessing.Pool(nproc)
+                try:
+                    results = pool.map(_path_segment, 
+                                       [(start, stop, coarse_steps, inner_tol)
+                                        for start, stop in segments])
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results = [_path_segment((start, stop, coarse_steps, inner_tol))
+                           for start, stop in segments]
+        finally:
+            _parallel_lasso = None
+            self.lagrange_sequence = lseq
+            self.ever_active = self.initial_active.copy()
+
+        builder = path_builder(self.shape[1], path_file=path_file)
+        for steps in results:
+            for step in steps:
+                builder.append(step)
+        output = builder.output()
+        output['scalings'] = self.scalings
         return output
 
+    def cross_validate(self, nfold=10, folds=None, nproc=1, inner_tol=1.e-5):
+        """
+        K-fold cross-validation of the solution path over
+        self.lagrange_sequence, computed once from all of the data
+        and shared by all folds.
+
+        The design of each fold selects rows of the normalized design
+        without copying them (see `normalize.select_rows`). Its column 
+        means and stds are computed by subtracting the sums over the 
+        held-out rows from the column sums of the whole design, which
+        are computed once. The held-out rows are normalized with the
+        statistics of the rest of the fold.
+
+        Parameters
+        ----------
+
+        nfold : int
+            Number of folds, used if folds is None.
+
+        folds : ndarray
+            Fold label of each row. Defaults to a random
+            assignment of the rows to nfold folds of (almost) equal size.
+
+        nproc : int
+            Number of processes solving the folds. As in
+            `parallel_main`, they are forked and share the design.
+
+        inner_tol : float
+            Tolerance for each subproblem.
+
+        Returns
+        -------
+
+        output : dict
+            With keys 'lagrange', 'folds', 'deviance' (the held-out
+            value of the loss for each fold and each value of lagrange),
+            its 'mean' and 'sd' over folds, 'lagrange_min' (the
+            value of lagrange minimizing the mean held-out deviance) 
+            and 'lagrange_1se' (the largest value of lagrange within 
+            one sd of the minimum).
+
+        """
+        global _cv_lasso
+
+        n = self.shape[0]
+        if folds is None:
+            folds = np.arange(n) % nfold
+            np.random.shuffle(folds)
+        folds = np.asarray(folds)
+        labels = np.unique(folds)
+
+        design = self._design
+        if not isinstance(design, normalize):
+            design = normalize(design, center=False, scale=False)
+        lseq = np.asarray(self.lagrange_sequence)
+
+        _cv_lasso = (self, design, folds, lseq, inner_tol)
+        try:
+            if nproc > 1 and labels.shape[0] > 1:
+                pool = multiprocessing.Pool(nproc)
+                try:
+                    deviance = pool.map(_cv_fold, labels)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                deviance = [_cv_fold(label) for label in labels]
+        finally:
+            _cv_lasso = None
+
+        deviance = np.array(deviance)
+        mean = deviance.mean(0)
+        sd = deviance.std(0) / np.sqrt(labels.shape[0])
+        imin = np.argmin(mean)
+        within = np.nonzero(mean <= mean[imin] + sd[imin])[0]
+        return {'lagrange': lseq,
+                'folds': folds,
+                'deviance': deviance,
+                'mean': mean,
+                'sd': sd,
+                'lagrange_min': lseq[imin],
+                'lagrange_1se': lseq[within].max()}
+
+    # Some common loss factories
+
+    @classmethod
+    def logistic(cls, X, Y, *args, **keyword_args):
+        return cls(logistic_factory(Y), X, *args, **keyword_args)
+
+    @classmethod
+    def squared_error(cls, X, Y, *args, **keyword_args):
+        return cls(squared_error_factory(Y), X, *args, **keyword_args)
+
+# the lasso whose path is computed by the workers of parallel_main,
+# inherited by the forked processes rather than pickled
+
+_parallel_lasso = None
+
+def _path_segment(args):
+    """
+    Solve the path of _parallel_lasso over lagrange_sequence[start:stop].
+    """
+    start, stop, coarse_steps, inner_tol = args
+    lasso = _parallel_lasso
+    lseq = np.asarray(lasso.lagrange_sequence)
+    if start > 0:
+        coarse = np.unique(np.linspace(0, start - 1, 
+                                       coarse_steps + 1).astype(np.int))
+        if coarse[-1] != start - 1:
+            coarse = np.hstack([coarse, start - 1])
+    else:
+        coarse = np.zeros(0, np.int)
+    ncoarse = coarse.shape[0]
+
+    # workers of a pool may be used for more than one segment
+    lasso.ever_active = lasso.initial_active.copy()
+    lasso.lagrange_sequence = np.hstack([lseq[coarse], lseq[start:stop]])
+    try:
+        steps = list(lasso.path(inner_tol=inner_tol))[ncoarse:]
+    finally:
+        lasso.lagrange_sequence = lseq
+    return steps
+
+# the lasso, design, folds, lagrange sequence and tolerance
+# of cross_validate, inherited by the forked processes
+
+_cv_lasso = None
+
+def _cv_fold(label):
+    """
+    Solve the path of the fold label of cross_validate and
+    return the held-out deviance at each value of lagrange.
+    """
+    lasso, design, folds, lseq, inner_tol = _cv_lasso
+    train = np.nonzero(folds != label)[0]
+    test = np.nonzero(folds == label)[0]
+
+    train_design = design.select_rows(train)
+    test_design = design.select_rows(test, statistics=train_design)
+    if test_design.scale:
+        # columns constant in the fold have coefficients 0
+        test_design.col_stds = np.where(test_design.col_stds == 0, 1,
+                                        test_design.col_stds).astype(test_design.dtype)
+
+    response = np.asarray(lasso.loss_factory.response)
+    train_factory = copy(lasso.loss_factory)
+    train_factory.response = response[train]
+    test_factory = copy(lasso.loss_factory)
+    test_factory.response = response[test]
+
+    fold = lasso.__class__(train_factory, train_design,
+                           penalty_structure=lasso.penalty_structure[lasso.intercept:],
+                           group_weights=lasso.group_weights,
+                           elastic_net=lasso._elastic_net,
+                           alpha=lasso.alpha,
+                           lagrange_proportion=lasso.lagrange_proportion,
+                           nstep=lasso.nstep,
+                           covariance=lasso.covariance)
+    fold.lagrange_sequence = lseq
+    beta = fold.main(inner_tol=inner_tol)['beta'].tocsc()
+
+    test_loss = test_factory(test_design)
+    deviance = np.zeros(beta.shape[1])
+    for i in range(beta.shape[1]):
+        coefs = np.asarray(beta[:,i].todense()).reshape(-1)
+        deviance[i] = test_loss.smooth_objective(coefs, 'func')
+    return deviance
+
+class multiresponse(object):
+
+    """
+    Lasso paths of each column of a response matrix Y, 
+    all regressed on the same design X.
+
+    The design is normalized, and its Lipschitz constant estimated, 
+    once by a `lasso` of the first column of Y whose keyword arguments 
+    are those of `lasso`. The null solutions of all responses are 
+    fit together and lagrange_max is computed for all responses 
+    from one product of the adjoint of the design with the
+    (n, K) matrix of gradients at the null solutions.
+
+    If joint is False, each response has its own path from its own 
+    lagrange_max and the responses are fit batch_size at a 
+    time with `batched_FISTA`, so that each iteration applies
+    the design to a matrix rather than to K vectors. 
+
+    If joint is True, the responses share one path of the multi-task
+    problem whose penalty is the `l1_l2` norm of the rows of the (p, K)
+    matrix of coefficients. Unpenalized rows, such as the intercept, 
+    are left unpenalized.
+    """
+
+    def __init__(self, loss_factory, X, Y, joint=False, batch_size=100,
+                 **lasso_keywords):
+
+        self.response = np.asarray(Y)
+        if self.response.ndim != 2:
+            raise ValueError('Y should have one column for each response')
+        self.loss_factory = loss_factory
+        self.joint = joint
+        self.batch_size = batch_size
+
+        self.template = lasso(loss_factory(self.response[:,0]), X, **lasso_keywords)
+        q = self.template._elastic_net
+        if np.any(q.coef != 0) or np.any(q.linear_term != 0):
+            raise ValueError('the elastic net is not implemented for multiple responses')
+
+        ps = self.penalty_structure
+        if joint and np.any((ps != UNPENALIZED) * (ps != L1_PENALTY)):
+            raise ValueError('the joint penalty allows only unpenalized and l1 penalized coefficients')
+
+    @property
+    def Xn(self):
+        return self.template.Xn
+
+    @property
+    def penalty_structure(self):
+        return self.template.penalty_structure
+
+    @property
+    def shape(self):
+        return self.template.shape + (self.response.shape[1],)
+
+    @property
+    def losses(self):
+        """
+        The loss of each response, as a function of its linear predictor.
+        """
+        if not hasattr(self, '_losses'):
+            self._losses = [self.loss_factory(self.response[:,k])(self.Xn).sm_atom
+                            for k in range(self.shape[2])]
+        return self._losses
+
+    @property
+    def start_inv_step(self):
+        return self.template.lipschitz * self.template.loss_factory.smoothness
+
+    def grad(self, coefs):
+        """
+        The (p, K) gradients of the losses at the (p, K) coefs.
+        """
+        return stacked_loss(self.Xn, self.losses).smooth_objective(coefs, 'grad')
+
+    @property
+    def null_solution(self):
+        if not hasattr(self, "_null_soln"):
+            n, p, K = self.shape
+            active = self.template.initial_active
+            self._null_soln = np.zeros((p, K))
+            if active.sum():
+                rps = self.penalty_structure[active]
+                penalties = [mixed_lasso(rps, 1., weights=self.template.group_weights)
+                             for k in range(K)]
+                solver = batched_FISTA(self.template._column_transform(active),
+                                       self.losses, penalties)
+                self._null_soln[active] = solver.fit(tol=1.e-10, 
+                                                     start_inv_step=self.start_inv_step)
+        return self._null_soln
+
+    @property
+    def lagrange_max(self):
+        """
+        A float if joint, else an array with the lagrange_max of each response.
+        """
+        if not hasattr(self, "_lagrange_max"):
+            G = self.grad(self.null_solution)
+            ps = self.penalty_structure
+            if self.joint:
+                penalized = ps != UNPENALIZED
+                self._lagrange_max = np.sqrt((G[penalized]**2).sum(1)).max()
+            else:
+                conj = mixed_lasso(ps, 1., weights=self.template.group_weights).conjugate
+                self._lagrange_max = np.array([conj.seminorm(G[:,k]) 
+                                               for k in range(G.shape[1])])
+        return self._lagrange_max
+
+    def get_lagrange_sequence(self):
+        if not hasattr(self, "_lagrange_sequence"):
+            decrease = np.exp(np.linspace(np.log(self.template.lagrange_proportion), 0, 
+                                          self.template.nstep))[::-1]
+            lagrange_max = self.lagrange_max * np.ones(self.shape[2])
+            self._lagrange_sequence = np.multiply.outer(lagrange_max, decrease)
+        return self._lagrange_sequence
+
+    def set_lagrange_sequence(self, lagrange_sequence):
+        lagrange_sequence = np.asarray(lagrange_sequence)
+        if lagrange_sequence.ndim == 1:
+            lagrange_sequence = np.multiply.outer(np.ones(self.shape[2]), lagrange_sequence)
+        if self.joint and np.any(lagrange_sequence != lagrange_sequence[0]):
+            raise ValueError('the responses share one lagrange sequence when joint')
+        self._lagrange_sequence = lagrange_sequence
+    
+    lagrange_sequence = property(get_lagrange_sequence, set_lagrange_sequence)
+
+    def path(self, inner_tol=1.e-5, max_its=10000):
+        """
+        Yield the (p, K) solutions and the (K,) values of the losses 
+        for each column of self.lagrange_sequence, for the responses 
+        in batches of at most batch_size (all responses if joint).
+        The solutions are those of the normalized design.
+
+        Yields
+        ------
+
+        step : dict
+            With keys 'responses', 'step', 'beta' and 'objective'.
+        """
+        n, p, K = self.shape
+        lseq = self.lagrange_sequence
+        ps = self.penalty_structure
+        # as in lasso.path, the first solutions are the null solutions 
+        # if lagrange starts at lagrange_max
+        null_first = np.all(lseq[:,0] >= self.lagrange_max)
+
+        if self.joint:
+            loss = stacked_loss(self.Xn, self.losses)
+            penalized = np.nonzero(ps != UNPENALIZED)[0]
+            block = l1_l2((penalized.shape[0], K), lagrange=lseq[0,0])
+            problem = simple_problem(loss, separable((p, K), [block], [penalized]))
+            problem.coefs[:] = self.null_solution
+            fit = lambda: problem.solve(tol=inner_tol, max_its=max_its,
+                                        start_inv_step=self.start_inv_step)
+            batches = [(np.arange(K), [block], fit)]
+        else:
+            batches = []
+            for start in range(0, K, self.batch_size):
+                responses = np.arange(start, min(start + self.batch_size, K))
+                penalties = [mixed_lasso(ps, lseq[k,0], weights=self.template.group_weights)
+                             for k in responses]
+                solver = batched_FISTA(self.Xn, [self.losses[k] for k in responses],
+                                       penalties, initial=self.null_solution[:,responses])
+                fit = lambda solver=solver: solver.fit(tol=inner_tol, max_its=max_its,
+                                                       start_inv_step=self.start_inv_step)
+                batches.append((responses, penalties, fit))
+
+        for responses, penalties, fit in batches:
+            for j in range(lseq.shape[1]):
+                if j == 0 and null_first:
+                    beta = self.null_solution[:,responses]
+                else:
+                    for i, penalty in enumerate(penalties):
+                        # the joint penalty has the lagrange of the first response
+                        penalty.lagrange = lseq[responses[i],j]
+                    beta = fit()
+                eta = astransform(self.Xn).linear_map(beta)
+                objective = np.array([self.losses[k].smooth_objective(eta[:,i], 'func')
+                                      for i, k in enumerate(responses)])
+                yield {'responses': responses, 'step': j, 
+                       'beta': beta.copy(), 'objective': objective}
+
+    def main(self, inner_tol=1.e-5, max_its=10000):
+        """
+        Compute the paths of all responses.
+
+        Returns
+        -------
+
+        output : dict
+            With keys 'lagrange' and 'devratio', (K, nstep) arrays,
+            'df', the number of nonzero coefficients as a (K, nstep) array,
+            'beta', a (p, K * nstep) scipy.sparse.csc_matrix whose column
+            k * nstep + j is the solution of response k at 
+            lagrange[k,j], and 'scalings'.
+        """
+        n, p, K = self.shape
+        lseq = self.lagrange_sequence
+        nstep = lseq.shape[1]
+        # the row of each coefficient of the normalized design in X
+        rows = np.nonzero(self.template.nonzero.adjoint_map(np.ones(p)))[0]
+
+        objective = np.zeros(lseq.shape)
+        df = np.zeros(lseq.shape, np.int)
+        indices, columns, values = [], [], []
+        for step in self.path(inner_tol=inner_tol, max_its=max_its):
+            responses, j, beta = step['responses'], step['step'], step['beta']
+            objective[responses,j] = step['objective']
+            nonzero_rows, nonzero_cols = np.nonzero(beta)
+            df[responses,j] = (beta != 0).sum(0)
+            indices.append(rows[nonzero_rows])
+            columns.append(responses[nonzero_cols] * nstep + j)
+            values.append(beta[nonzero_rows, nonzero_cols])
+
+        beta = scipy.sparse.coo_matrix((np.hstack(values), 
+                                        (np.hstack(indices), np.hstack(columns))),
+                                       shape=(self.template.scalings.shape[0], 
+                                              K * nstep)).tocsc()
+        return {'lagrange': lseq,
+                'devratio': 1 - objective / objective.max(1)[:,None],
+                'df': df,
+                'beta': beta,
+                'scalings': self.template.scalings}
+
+    # Some common loss factories
+
+    @classmethod
+    def logistic(cls, X, Y, *args, **keyword_args):
+        return cls(logistic_factory, X, Y, *args, **keyword_args)
+
+    @classmethod
+    def squared_error(cls, X, Y, *args, **keyword_args):
+        return cls(squared_error_factory, X, Y, *args, **keyword_args)
+
+class elastic_net_grid(object):
+
+    r"""
+    Solutions over a grid of values of (alpha, lagrange) of the `lasso` 
+    problems
+
+    .. math::
+
+       \ell(\beta) + \lambda \left({\cal P}(\beta) + 
+       \frac{1 - \alpha}{2 \alpha} \|\beta_P\|^2_2 \right)
+
+    where :math:`{\cal P}` is the penalty of the lasso and P are its 
+    penalized coefficients. This is the glmnet parametrization with
+    :math:`\lambda/\alpha` in place of :math:`\lambda`, for which 
+    lagrange_max does not depend on alpha. So all values of alpha 
+    share the lagrange_sequence of a `lasso` whose keyword arguments are
+    lasso_keywords, as well as its normalized design, Lipschitz constant 
+    and null solution.
+
+    The values of alpha are sorted from the largest. Each column of the
+    grid is a path in lagrange, and for all but the first column 
+    solved by a process, each value of lagrange is warm started 
+    (see the warm_start argument of `lasso.path`) from the solution at 
+    the previous alpha, whose nonzero coefficients are added to the ever
+    active set of the path.
+    """
+
+    def __init__(self, loss_factory, X, alphas, **lasso_keywords):
+
+        alphas = np.sort(np.asarray(alphas, np.float).reshape(-1))[::-1]
+        if np.any(alphas <= 0) or np.any(alphas > 1):
+            raise ValueError('alpha should be in (0,1]')
+        self.alphas = alphas
+
+        self.template = lasso(loss_factory, X, **lasso_keywords)
+        q = self.template._elastic_net
+        if np.any(q.coef != 0) or np.any(q.linear_term != 0):
+            raise ValueError('the elastic net of the grid is determined by alpha')
+
+    @property
+    def lagrange_sequence(self):
+        return self.template.lagrange_sequence
+
+    def alpha_lasso(self, alpha):
+        """
+        A lasso with the elastic net of alpha, sharing
+        everything but its solution with self.template.
+        """
+        fit = copy(self.template)
+        # the solution and everything computed from it
+        for attr in ['_problem', '_restricted_lookup', '_linear_predictor',
+                     '_predictor_solution', '_grad_solution', '_smooth_gradient']:
+            fit.__dict__.pop(attr, None)
+        if np.any(fit.penalty_structure == NONNEGATIVE):
+            # the null solution is penalized by the elastic net
+            fit.__dict__.pop('_null_soln', None)
+        fit._elastic_net = iq((1. - alpha) / alpha, 0, 0, 0)
+        fit.penalty = copy(self.template.penalty)
+        fit.ever_active = fit.initial_active.copy()
+        return fit
+
+    def main(self, nproc=1, inner_tol=1.e-5):
+        """
+        Compute the solutions over the grid.
+
+        Parameters
+        ----------
+
+        nproc : int
+            Number of processes. As in `lasso.parallel_main`, 
+            they are forked and share the design. Each process
+            solves a contiguous block of the values of alpha.
+
+        inner_tol : float
+            Tolerance for each subproblem.
+
+        Returns
+        -------
+
+        output : dict
+            With keys 'alpha' (sorted from the largest), 'lagrange', 
+            'devratio' and 'df' (arrays with a row for each alpha), 
+            'beta', a scipy.sparse.csc_matrix whose column i * nstep + j 
+            is the solution at (alpha[i], lagrange[j]) in the format of
+            `lasso.main`, and 'scalings'.
+        """
+        global _elastic_net_grid
+
+        nalpha = self.alphas.shape[0]
+        nblock = max(min(nproc, nalpha), 1)
+        blocks = np.array_split(np.arange(nalpha), nblock)
+
+        # compute everything shared by the columns before forking
+        self.template.lagrange_max
+        self.template.lipschitz
+
+        _elastic_net_grid = self
+        try:
+            if nblock > 1:
+                pool = multiprocessing.Pool(nblock)
+                try:
+                    results = pool.map(_grid_block, [(block, inner_tol) 
+                                                     for block in blocks])
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results = [_grid_block((block, inner_tol)) for block in blocks]
+        finally:
+            _elastic_net_grid = None
+
+        columns = [column for result in results for column in result]
+        return {'alpha': self.alphas,
+                'lagrange': columns[0]['lagrange'],
+                'devratio': np.array([column['devratio'] for column in columns]),
+                'df': np.array([column['df'] for column in columns]),
+                'beta': scipy.sparse.hstack([column['beta'] for column in columns]).tocsc(),
+                'scalings': self.template.scalings}
+
     # Some common loss factories
 
     @classmethod
@@ -376,14 +1396,157 @@ class lasso(object):
     def squared_error(cls, X, Y, *args, **keyword_args):
         return cls(squared_error_factory(Y), X, *args, **keyword_args)
 
+# the elastic_net_grid of main, inherited by the forked processes
+
+_elastic_net_grid = None
+
+def _grid_block(args):
+    """
+    Solve the columns of _elastic_net_grid for the values of alpha 
+    with indices in block, warm starting each column from the previous one.
+    Returns the outputs of `path_builder` of the columns.
+    """
+    block, inner_tol = args
+    grid = _elastic_net_grid
+
+    outputs = []
+    previous = None
+    for i in block:
+        fit = grid.alpha_lasso(grid.alphas[i])
+        builder = path_builder(fit.shape[1])
+        solutions = []
+        warm_start = None
+        if previous is not None:
+            # the solutions at the previous alpha, from the second value of lagrange
+            warm = iter(previous[1:])
+            warm_start = lambda lagrange: next(warm).toarray().reshape(-1)
+        for step in fit.path(inner_tol=inner_tol, warm_start=warm_start):
+            builder.append(step)
+            solutions.append(scipy.sparse.csr_matrix(fit.solution))
+        outputs.append(builder.output())
+        previous = solutions
+    return outputs
+
+class path_builder(object):
+
+    """
+    Collect the steps yielded by `lasso.path` as COO triplets
+    and build the sparse matrix of solutions once, at the end.
+    If path_file is not None, each step is also written to it 
+    as it is appended. See `load_path`.
+    """
+
+    def __init__(self, p, path_file=None):
+        self.p = p
+        self.lagrange = []
+        self.objective = []
+        self.df = []
+        self.truncated = False
+        self._indices = []
+        self._values = []
+
+        self._own_file = isinstance(path_file, basestring)
+        if self._own_file:
+            path_file = open(path_file, 'wb')
+        self.path_file = path_file
+        if self.path_file is not None:
+            np.save(self.path_file, np.array([p]))
+
+    def append(self, step):
+        beta = step['beta']
+        # beta is 1 x p
+        beta = scipy.sparse.csr_matrix(beta)
+        beta.eliminate_zeros()
+        self._indices.append(beta.indices.copy())
+        self._values.append(beta.data.copy())
+        self.lagrange.append(step['lagrange'])
+        self.objective.append(step['objective'])
+        self.df.append(step['df'])
+        self.truncated = step['truncated']
+
+        if self.path_file is not None:
+            np.save(self.path_file, np.array([step['lagrange'], step['objective'], 
+                                              step['df'], step['truncated']], np.float))
+            np.save(self.path_file, self._indices[-1])
+            np.save(self.path_file, self._values[-1])
+            self.path_file.flush()
+
+    @property
+    def beta(self):
+        """
+        The solutions as a p x nstep scipy.sparse.csc_matrix.
+        """
+        nstep = len(self._indices)
+        counts = [idx.shape[0] for idx in self._indices]
+        if nstep:
+            rows = np.hstack(self._indices)
+            data = np.hstack(self._values)
+        else:
+            rows, data = np.zeros(0, np.int), np.zeros(0)
+        cols = np.repeat(np.arange(nstep), counts)
+        return scipy.sparse.coo_matrix((data, (rows, cols)), 
+                                       shape=(self.p, nstep)).tocsc()
+
+    def output(self):
+        """
+        The path in the format returned by `lasso.main`, without 'scalings'.
+        """
+        if self.path_file is not None and self._own_file:
+            self.path_file.close()
+        objective = np.array(self.objective)
+        return {'devratio': 1 - objective / objective.max(),
+                'df': self.df,
+                'lagrange': np.array(self.lagrange),
+                'beta': self.beta,
+                'truncated': self.truncated}
+
+def load_path(path_file):
+    """
+    Load a path written by `lasso.main` with a path_file,
+    possibly while it is still being written.
+    Returns a dictionary in the format returned by `lasso.main`
+    without 'scalings'.
+    """
+    if isinstance(path_file, basestring):
+        path_file = open(path_file, 'rb')
+    path_file.seek(0, 2)
+    size = path_file.tell()
+    path_file.seek(0)
+    p = int(np.load(path_file)[0])
+    builder = path_builder(p)
+    while path_file.tell() < size:
+        try:
+            lagrange, objective, df, truncated = np.load(path_file)
+            indices = np.load(path_file)
+            values = np.load(path_file)
+        except (IOError, ValueError):
+            # the last step is still being written
+            break
+        beta = scipy.sparse.csr_matrix((values, indices, [0, indices.shape[0]]),
+                                       shape=(1, p))
+        builder.append({'lagrange': lagrange, 'beta': beta, 'objective': objective,
+                        'df': int(df), 'truncated': bool(truncated)})
+    return builder.output()
+
 class loss_factory(object):
 
+    # the Lipschitz constant of the gradient of the loss as a function
+    # of the linear predictor, if the factory implements conjugate
+    smoothness = None
+
     def __init__(self, response):
         self._response = np.asarray(response)
 
     def __call__(self, X):
         raise NotImplementedError
 
+    def conjugate(self, u):
+        """
+        The convex conjugate of the loss as a function of the 
+        linear predictor, up to a constant. Used by `lasso.safe_set`.
+        """
+        raise NotImplementedError
+
     def get_response(self):
         return self._response
 
@@ -396,17 +1559,232 @@ class logistic_factory(loss_factory):
     def __call__(self, X):
         return logistic_loss(X, self.response, coef=0.5)
 
+    @property
+    def smoothness(self):
+        # the loss is sum(log(1 + exp(eta)) - response * eta) / n
+        return 0.25 / self.response.shape[0]
+
+    def conjugate(self, u):
+        n = self.response.shape[0]
+        prob = n * u + self.response
+        if np.any(prob < 0) or np.any(prob > 1):
+            return np.inf
+        entropy = np.zeros(prob.shape)
+        inside = (prob > 0) * (prob < 1)
+        entropy[inside] = (prob[inside] * np.log(prob[inside]) + 
+                           (1 - prob[inside]) * np.log(1 - prob[inside]))
+        return entropy.sum() / n
+
 class squared_error_factory(loss_factory):
 
     def __call__(self, X):
         n = self.response.shape[0]
         return squared_error(X, self.response, coef=1./n)
 
+    @property
+    def smoothness(self):
+        return 1. / self.response.shape[0]
+
+    def conjugate(self, u):
+        # the loss is ||eta + response||^2 / (2 * n)
+        n = self.response.shape[0]
+        return n * (u**2).sum() / 2. - (u * self.response).sum()
+
+
+class gram_cache(object):
+
+    """
+    Columns of the Gram matrix :math:`X^TX` of a design, 
+    computed as they are needed, and :math:`X^TY`. Centering
+    and scaling of a normalize design are implicit.
+
+    This is the covariance update of glmnet: once the columns
+    of the coefficients in a subproblem are cached, the squared 
+    error loss and its gradient are computed without products 
+    with X, i.e. in time independent of the number of rows.
+    """
+
+    def __init__(self, X, response):
+        self.X = astransform(X)
+        response = np.asarray(response, np.float)
+        self.n = response.shape[0]
+        self.Xty = self.X.adjoint_map(response)
+        self.yty = (response**2).sum()
+        p = self.Xty.shape[0]
+        # the position of each cached column in self._columns
+        self._slot = -np.ones(p, np.int)
+        self._columns = np.zeros((p, 0))
+        self.ncached = 0
+
+    def columns(self, idx):
+        """
+        The columns idx of the Gram matrix, computing 
+        those not yet cached.
+        """
+        idx = np.asarray(idx, np.int)
+        missing = np.unique(idx[self._slot[idx] < 0])
+        if missing.shape[0]:
+            p, k = self.Xty.shape[0], missing.shape[0]
+            basis = np.zeros((p, k))
+            basis[missing, np.arange(k)] = 1
+            new = self.X.adjoint_map(self.X.linear_map(basis))
+            if self.ncached + k > self._columns.shape[1]:
+                capacity = max(2 * self._columns.shape[1], self.ncached + k)
+                columns = np.zeros((p, capacity))
+                columns[:,:self.ncached] = self._columns[:,:self.ncached]
+                self._columns = columns
+            self._columns[:,self.ncached:self.ncached+k] = new
+            self._slot[missing] = np.arange(self.ncached, self.ncached + k)
+            self.ncached += k
+        return self._columns[:,self._slot[idx]]
+
+    def block(self, idx):
+        """
+        The submatrix of the Gram matrix with rows and columns idx.
+        """
+        return self.columns(idx)[idx]
+
+class gram_quadratic(smooth_atom):
+
+    r"""
+    The loss of `squared_error_factory` for the columns S of a design,
+    :math:`\frac{C}{2}\|X_S\beta + Y\|^2_2` as for `squared_error`,
+    computed from a gram_cache. 
+
+    If S is None, it is the loss of all the columns, computed 
+    from the Gram columns of the nonzero coefficients of :math:`\beta`.
+    Otherwise, the block of the Gram matrix for S is formed the first
+    time the loss is evaluated.
+    """
+
+    def __init__(self, cache, columns=None, coef=1., offset=None,
+                 quadratic=None, initial=None):
+        self.cache = cache
+        self.columns = columns
+        if columns is None:
+            shape = cache.Xty.shape
+            self.linear_term = cache.Xty
+        else:
+            shape = columns.shape
+            self.linear_term = cache.Xty[columns]
+        self._Q = None
+        smooth_atom.__init__(self, shape, coef=coef, offset=offset,
+                             quadratic=quadratic, initial=initial)
+
+    @property
+    def Q(self):
+        if self._Q is None and self.columns is not None:
+            self._Q = self.cache.block(self.columns)
+        return self._Q
+
+    def smooth_objective(self, x, mode='both', check_feasibility=False):
+        x = self.apply_offset(x)
+        if self.columns is None:
+            support = np.nonzero(x)[0]
+            Qx = np.dot(self.cache.columns(support), x[support])
+        else:
+            Qx = np.dot(self.Q, x)
+
+        if mode in ['both', 'func']:
+            f = self.scale((np.dot(x, Qx) + self.cache.yty) / 2. 
+                           + np.dot(x, self.linear_term))
+        if mode in ['both', 'grad']:
+            g = self.scale(Qx + self.linear_term)
+
+        if mode == 'both':
+            return f, g
+        elif mode == 'grad':
+            return g
+        elif mode == 'func':
+            return f
+        else:
+            raise ValueError("mode incorrectly specified")
+
+    def hessian_weights(self, x):
+        diag = column_norms2(self.cache.X)
+        if self.columns is not None:
+            diag = diag[self.columns]
+        return self.coef * diag
+
+class elastic_net_term(smooth_atom):
+
+    r"""
+    The elastic net of `lasso` in a restricted problem,
+    :math:`\lambda(\frac{\kappa}{2}\|\beta_P\|^2_2 + \eta^T\beta_P)` 
+    for the penalized coefficients P. Here :math:`\lambda` is
+    the lagrange of penalty when the term is evaluated, so cached 
+    restricted problems follow the path.
+    """
+
+    def __init__(self, elastic_net, penalty, penalized, coef=1., offset=None,
+                 quadratic=None, initial=None):
+        self.elastic_net = elastic_net
+        self.penalty = penalty
+        self.penalized = penalized
+        smooth_atom.__init__(self, penalized.shape, coef=coef, offset=offset,
+                             quadratic=quadratic, initial=initial)
+
+    def smooth_objective(self, x, mode='both', check_feasibility=False):
+        x = self.apply_offset(x)
+        lagrange = self.penalty.lagrange
+        f, g_penalized = self.elastic_net.objective(x[self.penalized], 'both')
+        g = np.zeros(x.shape)
+        g[self.penalized] = g_penalized
+
+        if mode == 'both':
+            return self.scale(lagrange * f), self.scale(lagrange * g)
+        elif mode == 'grad':
+            return self.scale(lagrange * g)
+        elif mode == 'func':
+            return self.scale(lagrange * f)
+        else:
+            raise ValueError("mode incorrectly specified")
+
+class stacked_loss(smooth_atom):
+
+    r"""
+    The loss :math:`\sum_k f_k(X\beta_k)` of the columns of a (p, K)
+    matrix :math:`\beta`, used by `multiresponse` for the joint penalty.
+    The transform and its adjoint are applied once to all
+    K columns.
+    """
+
+    def __init__(self, transform, losses, coef=1., offset=None,
+                 quadratic=None, initial=None):
+        self.transform = astransform(transform)
+        self.losses = losses
+        shape = self.transform.input_shape + (len(losses),)
+        smooth_atom.__init__(self, shape, coef=coef, offset=offset,
+                             quadratic=quadratic, initial=initial)
+
+    def smooth_objective(self, x, mode='both', check_feasibility=False):
+        x = self.apply_offset(x)
+        eta = self.transform.linear_map(x)
+
+        if mode in ['both', 'func']:
+            f = self.scale(np.sum([loss.smooth_objective(eta[:,k], 'func')
+                                   for k, loss in enumerate(self.losses)]))
+        if mode in ['both', 'grad']:
+            G = np.array([loss.smooth_objective(eta[:,k], 'grad')
+                          for k, loss in enumerate(self.losses)]).T
+            g = self.scale(self.transform.adjoint_map(G))
+
+        if mode == 'both':
+            return f, g
+        elif mode == 'grad':
+            return g
+        elif mode == 'func':
+            return f
+        else:
+            raise ValueError("mode incorrectly specified")
 
 class nesta(lasso):
 
     # atom_factory takes candidate_set, epsilon
 
+    # the restricted problems depend on epsilon and the dual term
+    cache_size = 0
+
     def __init__(self, loss_factory, X, atom_factory, epsilon=None,
                  **lasso_keywords):
         self.atom_factory = atom_factory 
@@ -69,6 +69,31 @@ class composite(object):
         '''
         raise NotImplementedError
 
+    def affine_image(self, x):
+        """
+        The image of x under the affine map through which the
+        smooth objective depends on x. Used by FISTA when tracking
+        images of its iterates.
+
+        Composites whose smooth part is not of the form
+        :math:`f(X\beta+\alpha)` do not support this.
+        """
+        raise NotImplementedError('%s does not support tracking affine images' % self.__class__.__name__)
+
+    def smooth_objective_image(self, eta, mode='both', check_feasibility=False):
+        """
+        The smooth_objective evaluated at a point whose
+        affine image (see `affine_image`) is eta.
+        """
+        raise NotImplementedError('%s does not support tracking affine images' % self.__class__.__name__)
+
+    def duality_gap(self, x):
+        """
+        The duality gap at x and the feasible dual point it is
+        computed from. Used by FISTA to stop on the duality gap.
+        """
+        raise NotImplementedError('%s does not compute duality gaps' % self.__class__.__name__)
+
     def objective(self, x, check_feasibility=False):
         return self.smooth_objective(x,mode='func', check_feasibility=check_feasibility) + self.nonsmooth_objective(x, check_feasibility=check_feasibility)
 
@@ -166,6 +166,7 @@ class container(composite):
 
         solver = FISTA(self)
         solver.fit(**fit_args)
+        self.truncated = solver.truncated
 
         if return_optimum:
             value = (self.objective(self.coefs), self.coefs)
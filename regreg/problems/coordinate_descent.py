@@ -0,0 +1,407 @@
+r"""
+A cyclic coordinate descent solver for penalized least squares.
+
+The problems handled are simple_problems of the form
+
+.. math::
+
+   \frac{C}{2} \|X\beta - Y\|^2_2 + \frac{\kappa}{2}\|\beta\|^2_2 + \eta^T\beta + {\cal P}(\beta)
+
+where :math:`{\cal P}` is an l1norm, weighted_l1norm, group_lasso or mixed_lasso
+in Lagrange form and :math:`X` is an ndarray, a scipy.sparse matrix
+or a normalize transform. The quadratic terms are picked up from the quadratic
+attributes of the problem, so an elastic net is specified as
+
+>>> import numpy as np, regreg.api as rr
+>>> X = np.random.standard_normal((100,20)); Y = np.random.standard_normal(100)
+>>> penalty = rr.l1norm(20, lagrange=3., quadratic=rr.identity_quadratic(0.5,0,0,0))
+>>> problem = rr.simple_problem(rr.squared_error(X, Y), penalty)
+>>> coefs = problem.solve(solver=rr.coordinate_descent, tol=1.e-10)
+
+"""
+import numpy as np
+from scipy import sparse
+
+from ..algorithms import algorithm
+from ..affine import normalize
+from ..smooth import affine_smooth
+from ..smooth.quadratic import quadratic
+from ..atoms.seminorms import l1norm
+from ..atoms.weighted_atoms import l1norm as weighted_l1norm
+from ..atoms.group_lasso import group_lasso
+from ..atoms.mixed_lasso import (mixed_lasso, UNPENALIZED, L1_PENALTY,
+                                 POSITIVE_PART, NONNEGATIVE)
+
+class columns(object):
+
+    """
+    Column access to a design matrix that is an ndarray,
+    a scipy.sparse matrix or a normalize transform.
+
+    Centering and scaling are never applied to the
+    underlying matrix. Instead, the residual
+    is stored as `resid + shift`, with shift a scalar,
+    so that updates along sparse columns stay sparse.
+    """
+
+    def __init__(self, X):
+        if isinstance(X, affine_smooth):
+            X = X.affine_transform
+        if hasattr(X, 'affineD') and X.affineD:
+            X = X.linear_operator
+        elif hasattr(X, 'linear_operator'):
+            if X.diagD or X.noneD:
+                raise ValueError('coordinate descent needs a linear transform given by a matrix')
+            X = X.linear_operator
+
+        # the intercept column of a normalize transform
+        # is stored as a dense vector
+
+        self.dense_columns = {}
+        if isinstance(X, normalize):
+            M = X.M
+            n, p = M.shape
+            if X.scale:
+                self.stds = np.asarray(X.col_stds, np.float).reshape(-1).copy()
+            else:
+                self.stds = np.ones(p)
+            if X.intercept_column is not None:
+                e = np.zeros(p)
+                e[X.intercept_column] = 1.
+                self.dense_columns[X.intercept_column] = X.linear_map(e)
+            center = X.center
+        else:
+            M = X
+            n, p = M.shape
+            self.stds = np.ones(p)
+            center = False
+
+        self.sparse = sparse.isspmatrix(M)
+        if self.sparse:
+            M = sparse.csc_matrix(M)
+            colsums = np.asarray(M.sum(0)).reshape(-1)
+            M2 = M.copy()
+            M2.data **= 2
+            colnorms2 = np.asarray(M2.sum(0)).reshape(-1)
+        else:
+            M = np.asarray(M)
+            colsums = M.sum(0)
+            colnorms2 = (M**2).sum(0)
+        self.M = M
+        self.shape = (n, p)
+
+        colsums = colsums / self.stds
+        if center:
+            self.means = colsums / n
+        else:
+            self.means = np.zeros(p)
+        self.colsums = colsums
+        self.norms2 = colnorms2 / self.stds**2 - 2 * self.means * colsums + n * self.means**2
+        for j, v in self.dense_columns.items():
+            self.colsums[j] = v.sum()
+            self.means[j] = 0
+            self.norms2[j] = (v**2).sum()
+
+    def raw_column(self, j):
+        """
+        Return the indices and values of column j
+        of the underlying matrix, before centering or scaling.
+        """
+        if self.sparse:
+            start, stop = self.M.indptr[j], self.M.indptr[j+1]
+            return self.M.indices[start:stop], self.M.data[start:stop]
+        return slice(None), self.M[:,j]
+
+    def dot(self, j, resid, resid_sum, shift):
+        """
+        Inner product of column j with the residual `resid + shift`.
+        """
+        if j in self.dense_columns:
+            v = self.dense_columns[j]
+            return (v * resid).sum() + shift * self.colsums[j]
+        idx, val = self.raw_column(j)
+        value = (val * resid[idx]).sum() / self.stds[j] + shift * self.colsums[j]
+        return value - self.means[j] * (resid_sum + self.shape[0] * shift)
+
+    def update(self, j, delta, resid, resid_sum, shift):
+        """
+        Subtract delta times column j from the residual `resid + shift`,
+        modifying resid in place and returning the new resid_sum, shift.
+        """
+        if j in self.dense_columns:
+            v = self.dense_columns[j]
+            resid -= delta * v
+            return resid_sum - delta * self.colsums[j], shift
+        idx, val = self.raw_column(j)
+        resid[idx] -= (delta / self.stds[j]) * val
+        resid_sum -= delta * self.colsums[j]
+        shift += delta * self.means[j]
+        return resid_sum, shift
+
+    def dense(self, index):
+        """
+        The columns in index as a dense 2D array.
+        """
+        cols = np.zeros((self.shape[0], len(index)))
+        for i, j in enumerate(index):
+            if j in self.dense_columns:
+                cols[:,i] = self.dense_columns[j]
+            else:
+                idx, val = self.raw_column(j)
+                cols[idx,i] = val / self.stds[j]
+                cols[:,i] -= self.means[j]
+        return cols
+
+class coordinate_descent(algorithm):
+
+    """
+    Cyclic coordinate descent for a simple_problem
+    with a squared_error loss and an l1norm, weighted_l1norm,
+    group_lasso or mixed_lasso penalty in Lagrange form.
+
+    Coordinates are updated one at a time keeping the residual
+    up to date, groups are updated as blocks.
+    After each full sweep, the sweeps are
+    restricted to the active set until they converge.
+    """
+
+    def __init__(self, composite):
+        algorithm.__init__(self, composite)
+
+        smooth_atom = composite.smooth_atom
+        if not isinstance(smooth_atom, affine_smooth) or \
+                not isinstance(smooth_atom.sm_atom, quadratic):
+            raise ValueError('coordinate descent needs a squared_error loss')
+        loss = smooth_atom.sm_atom
+        if loss.Q is not None or not loss.quadratic.iszero:
+            raise ValueError('coordinate descent needs a squared_error loss')
+        transform = smooth_atom.affine_transform
+
+        self.columns = columns(transform)
+        n, p = self.columns.shape
+
+        # the response: the loss is C/2 * |X\beta - response|^2
+
+        response = np.zeros(n)
+        if loss.offset is not None:
+            response += loss.offset
+        if transform.affine_offset is not None:
+            response -= transform.affine_offset
+        self.response = response
+        self.loss_coef = loss.coef
+
+        self._set_penalty(composite.proximal_atom, p)
+
+    def _set_penalty(self, penalty, p):
+        if penalty.offset is not None and np.any(penalty.offset != 0):
+            raise ValueError('coordinate descent does not handle penalties with an offset')
+        if not hasattr(penalty, 'lagrange') or penalty.lagrange is None:
+            raise ValueError('coordinate descent needs a penalty in Lagrange form')
+
+        lagrange = penalty.lagrange
+        self.structure = L1_PENALTY * np.ones(p, np.int)
+        self.weights = np.zeros(p)
+        self.groups = []
+
+        if isinstance(penalty, weighted_l1norm):
+            self.weights[:] = lagrange * penalty.weights
+        elif isinstance(penalty, l1norm):
+            self.weights[:] = lagrange
+        elif isinstance(penalty, mixed_lasso):
+            self.structure[:] = penalty.penalty_structure
+            self.weights[:] = lagrange
+            self.groups = [(np.nonzero(penalty._groups == g)[0], lagrange * w)
+                           for g, w in enumerate(penalty._weight_array)]
+        elif isinstance(penalty, group_lasso):
+            self.groups = [(np.nonzero(penalty._groups == g)[0], lagrange * w)
+                           for g, w in enumerate(penalty._weight_array)]
+        else:
+            raise ValueError('coordinate descent handles l1norm, weighted_l1norm, group_lasso and mixed_lasso penalties')
+        if self.groups:
+            ingroup = np.zeros(p, np.bool)
+            for group, _ in self.groups:
+                ingroup[group] = True
+            self.coordinates = np.nonzero(~ingroup)[0]
+        else:
+            self.coordinates = np.arange(p)
+        self._group_lipschitz = {}
+
+    def fit(self,
+            max_its=1000,
+            min_its=1,
+            tol=1.e-8,
+            active_its=1000,
+            return_objective_hist=True,
+            debug=None):
+        """
+        Parameters
+        ----------
+        max_its : int
+              the maximum number of sweeps through all the coordinates
+        min_its : int
+              the minimum number of sweeps through all the coordinates
+        tol : float
+              the tolerance used in the stopping criterion. Sweeps stop when
+              the largest decrease in objective from a single coordinate
+              (or group) update is less than tol times the objective
+        active_its : int
+              the maximum number of sweeps through the active set
+              after each full sweep
+        return_objective_hist : bool
+              Return the sequence of objective values after each full sweep?
+        debug : bool
+              Resets self.debug, which controls whether convergence information is printed
+
+        Returns
+        -------
+
+        objective_hist : ndarray
+              A vector of objective values. Only return if return_objective_hist is True.
+
+        """
+        if debug is not None:
+            self.debug = debug
+
+        problem = self.composite
+        columns = self.columns
+        n, p = columns.shape
+
+        q = (problem.quadratic + problem.smooth_atom.quadratic +
+             problem.proximal_atom.quadratic).collapsed()
+        self.ridge = q.coef
+        self.linear_term = np.zeros(p)
+        if q.linear_term is not None:
+            self.linear_term += q.linear_term
+
+        beta = np.asarray(problem.coefs, np.float).copy()
+        self.beta = beta
+        self.resid = self.response - problem.smooth_atom.affine_transform.linear_map(beta)
+        self.resid_sum = self.resid.sum()
+        self.shift = 0.
+
+        current_obj = self.objective()
+        objective_hist = [current_obj]
+
+        itercount = 0
+        while itercount < max_its:
+            thresh = tol * max(np.fabs(current_obj), 1)
+
+            full_change = self.sweep(self.coordinates, self.groups)
+            itercount += 1
+
+            # iterate over the active set
+
+            active_its_done = 0
+            active = self.active_set()
+            while active_its_done < active_its:
+                change = self.sweep(*active)
+                active_its_done += 1
+                if change < thresh:
+                    break
+
+            new_obj = self.objective()
+            obj_rel_change = np.fabs(current_obj - new_obj) / max(np.fabs(current_obj), 1)
+            current_obj = new_obj
+            objective_hist.append(current_obj)
+
+            if self.debug:
+                print "%i    obj: %.6e    max change: %.2e    active sweeps: %i    active: %i" % (itercount, current_obj, full_change, active_its_done, active[0].shape[0] + sum([g.shape[0] for g, _ in active[1]]))
+
+            if itercount >= min_its and full_change < thresh:
+                if self.debug:
+                    print 'Success: Optimization stopped because largest coordinate decrease was below tolerance'
+                break
+
+        problem.coefs[:] = beta
+        self.convergence_params = (itercount, current_obj, obj_rel_change, tol)
+        if return_objective_hist:
+            return np.array(objective_hist)
+
+    def active_set(self):
+        """
+        The coordinates and groups that are nonzero or unpenalized.
+        """
+        beta = self.beta
+        coords = self.coordinates
+        active = coords[(beta[coords] != 0) +
+                        (self.structure[coords] == UNPENALIZED) +
+                        (self.structure[coords] == NONNEGATIVE)]
+        groups = [(g, w) for g, w in self.groups if np.any(beta[g] != 0)]
+        return active, groups
+
+    def sweep(self, coordinates, groups):
+        """
+        Update each of the coordinates, then each of the groups,
+        returning the largest decrease in objective
+        (as measured by the curvature times the squared change).
+        """
+        beta, columns = self.beta, self.columns
+        C, ridge, linear_term = self.loss_coef, self.ridge, self.linear_term
+        max_change = 0
+
+        for j in coordinates:
+            curvature = C * columns.norms2[j] + ridge
+            if curvature <= 0:
+                continue
+            grad = (-C * columns.dot(j, self.resid, self.resid_sum, self.shift)
+                    + ridge * beta[j] + linear_term[j])
+            z = beta[j] - grad / curvature
+            t = self.weights[j] / curvature
+            kind = self.structure[j]
+            if kind == L1_PENALTY:
+                new = np.sign(z) * max(np.fabs(z) - t, 0)
+            elif kind == POSITIVE_PART:
+                new = max(z - t, 0)
+            elif kind == NONNEGATIVE:
+                new = max(z, 0)
+            else:
+                new = z
+            delta = new - beta[j]
+            if delta != 0:
+                beta[j] = new
+                self.resid_sum, self.shift = columns.update(j, delta, self.resid,
+                                                            self.resid_sum, self.shift)
+                max_change = max(max_change, curvature * delta**2)
+
+        for group, weight in groups:
+            L = self.group_lipschitz(group)
+            if L <= 0:
+                continue
+            grad = np.array([-C * columns.dot(j, self.resid, self.resid_sum, self.shift)
+                             for j in group]) + ridge * beta[group] + linear_term[group]
+            z = beta[group] - grad / L
+            norm_z = np.linalg.norm(z)
+            if norm_z > 0:
+                new = z * max(1 - weight / (L * norm_z), 0)
+            else:
+                new = z
+            delta = new - beta[group]
+            if np.any(delta != 0):
+                beta[group] = new
+                for j, d in zip(group, delta):
+                    if d != 0:
+                        self.resid_sum, self.shift = columns.update(j, d, self.resid,
+                                                                    self.resid_sum, self.shift)
+                max_change = max(max_change, L * (delta**2).sum())
+        return max_change
+
+    def group_lipschitz(self, group):
+        """
+        Lipschitz constant of the gradient restricted to a group,
+        computed once for each group.
+        """
+        key = tuple(group)
+        if key not in self._group_lipschitz:
+            X_g = self.columns.dense(group)
+            self._group_lipschitz[key] = np.linalg.norm(X_g, 2)**2
+        return self.loss_coef * self._group_lipschitz[key] + self.ridge
+
+    def objective(self):
+        """
+        The objective at the current coefficients.
+        """
+        problem = self.composite
+        resid = self.resid + self.shift
+        return (self.loss_coef * (resid**2).sum() / 2. +
+                problem.nonsmooth_objective(self.beta))
+
@@ -0,0 +1,233 @@
+r"""
+A Frank-Wolfe (conditional gradient) solver for problems
+constrained to the ball of a seminorm.
+
+The problems handled are simple_problems of the form
+
+.. math::
+
+   \text{minimize}_{\beta} \ell(\beta) \ \text{s.t.} \ h(\beta) \leq \delta
+
+where :math:`\ell` is smooth and :math:`h` is an atom in bound form with
+a linear minimization oracle (see `seminorm.linear_minimizer`), such as
+l1norm, supnorm, l2norm, group_lasso or nuclear_norm. Instead of a
+projection onto the ball, each iteration minimizes a linear function
+over the ball. For the nuclear norm, this only needs the top singular
+pair of the gradient rather than a full SVD.
+
+The away step and pairwise variants keep the iterate as a convex
+combination of the points returned by the oracle (its active set)
+and can move weight away from these points. On polytopes, such as
+the l1 and supnorm balls, they converge linearly for strongly
+convex losses. Each point of the active set is stored and
+searched at every iteration, so for atoms whose extreme points are
+dense and numerous, such as supnorm and nuclear_norm, the vanilla
+variant uses much less memory and time per iteration.
+
+>>> import numpy as np, regreg.api as rr
+>>> X = np.random.standard_normal((100,50)); Y = np.random.standard_normal(100)
+>>> problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(50, bound=1.))
+>>> coefs = problem.solve(solver=rr.frank_wolfe, tol=1.e-8)
+
+"""
+import numpy as np
+
+from ..algorithms import algorithm
+
+class frank_wolfe(algorithm):
+
+    """
+    Frank-Wolfe with away steps or pairwise steps for a simple_problem
+    whose proximal atom is in bound form and has a linear_minimizer.
+    Step sizes are chosen by backtracking on a quadratic upper
+    bound of the smooth part along the step,
+    whose curvature is stored as self.inv_step.
+    """
+
+    variants = ['vanilla', 'away', 'pairwise']
+
+    def __init__(self, composite):
+        algorithm.__init__(self, composite)
+        atom = composite.proximal_atom
+        if getattr(atom, 'bound', None) is None:
+            raise ValueError('Frank-Wolfe needs an atom in bound form')
+        if atom.offset is not None and np.any(atom.offset != 0):
+            raise ValueError('Frank-Wolfe does not handle atoms with an offset')
+        if not hasattr(atom, 'linear_minimizer'):
+            raise ValueError('%s does not have a linear_minimizer' % atom.__class__.__name__)
+        self.gap = np.inf
+
+    def smooth_objective(self, beta, mode='both'):
+        """
+        The smooth part of the problem, including all
+        its quadratic terms.
+        """
+        problem = self.composite
+        smooth_atom = problem.smooth_atom
+        q = (problem.quadratic + smooth_atom.quadratic +
+             problem.proximal_atom.quadratic)
+        value = smooth_atom.smooth_objective(beta, mode)
+        if q.iszero:
+            return value
+        qvalue = q.objective(beta, mode)
+        if mode == 'both':
+            return value[0] + qvalue[0], value[1] + qvalue[1]
+        return value + qvalue
+
+    def fit(self,
+            max_its=10000,
+            min_its=5,
+            tol=1.e-6,
+            variant='away',
+            alpha=1.1,
+            start_inv_step=1.,
+            return_objective_hist=True,
+            debug=None):
+        """
+        Parameters
+        ----------
+        max_its : int
+              the maximum number of iterations
+        min_its : int
+              the minimum number of iterations
+        tol : float
+              stop when the Frank-Wolfe gap, an upper bound on the
+              distance to the minimum of the objective, is below
+              tol times the objective (or tol if the objective is below 1)
+        variant : str
+              One of ['vanilla', 'away', 'pairwise']
+        alpha : float
+              used in backtracking. If self.inv_step is too small,
+              it is increased by a factor of alpha. It is decreased by
+              the same factor at each iteration.
+        start_inv_step : float
+              the starting value of self.inv_step
+        return_objective_hist : bool
+              Return the sequence of objective values?
+        debug : bool
+              Resets self.debug, which controls whether convergence information is printed
+
+        Returns
+        -------
+
+        objective_hist : ndarray
+              A vector of objective values. Only return if return_objective_hist is True.
+
+        """
+        if debug is not None:
+            self.debug = debug
+        if variant not in self.variants:
+            raise ValueError('variant should be one of %s' % `self.variants`)
+        if self.inv_step is None:
+            self.inv_step = start_inv_step
+
+        problem = self.composite
+        atom = problem.proximal_atom
+        beta = problem.coefs.copy()
+        if not np.isfinite(atom.nonsmooth_objective(beta, check_feasibility=True)):
+            # start from a feasible point
+            beta = atom.bound_prox(beta)
+
+        # the active set maps each point to its weight
+        # in the convex combination beta
+        active = {beta.tostring(): [beta.copy(), 1.]}
+
+        current_f = self.smooth_objective(beta, 'func')
+        objective_hist = np.zeros(max_its)
+        self.converged = False
+        itercount = 0
+        while itercount < max_its:
+            objective_hist[itercount] = current_f
+            grad = self.smooth_objective(beta, 'grad')
+
+            vertex = atom.linear_minimizer(grad)
+            self.gap = gap = (grad * (beta - vertex)).sum()
+
+            if self.debug:
+                print "%i    obj: %.6e    gap: %.2e    inv_step: %.2e    active: %i" % (itercount, current_f, gap, self.inv_step, len(active))
+
+            if itercount >= min_its and gap <= tol * max(np.fabs(current_f), 1):
+                self.converged = True
+                if self.debug:
+                    print 'Success: Optimization stopped because Frank-Wolfe gap was below tolerance'
+                break
+
+            if variant != 'vanilla':
+                # the point of the active set with the largest linear term
+                key_away = max(active.keys(),
+                               key=lambda key: (grad * active[key][0]).sum())
+                away, weight_away = active[key_away]
+
+            if variant == 'vanilla':
+                step, max_gamma, kind = vertex - beta, 1., 'fw'
+            elif variant == 'away':
+                if gap >= (grad * (away - beta)).sum():
+                    step, max_gamma, kind = vertex - beta, 1., 'fw'
+                else:
+                    step, kind = beta - away, 'away'
+                    if weight_away < 1:
+                        max_gamma = weight_away / (1 - weight_away)
+                    else:
+                        max_gamma = np.inf
+            else:
+                step, max_gamma, kind = vertex - away, weight_away, 'pairwise'
+
+            slope = (grad * step).sum()
+            step_norm2 = (step**2).sum()
+            if slope >= 0 or step_norm2 == 0:
+                self.converged = True
+                if self.debug:
+                    print 'Optimization stopped because no step decreases the objective'
+                break
+
+            # backtracking on the curvature along the step
+            self.inv_step /= alpha
+            slack = 10 * np.finfo(float).eps * max(np.fabs(current_f), 1)
+            while True:
+                gamma = min(max_gamma, -slope / (self.inv_step * step_norm2))
+                trial = beta + gamma * step
+                trial_f = self.smooth_objective(trial, 'func')
+                if trial_f <= current_f + gamma * slope + 0.5 * self.inv_step * gamma**2 * step_norm2 + slack:
+                    break
+                self.inv_step *= alpha
+                if not np.isfinite(self.inv_step):
+                    raise ValueError("inv_step overflowed")
+
+            # update the weights of the active set
+            if variant != 'vanilla':
+                if kind == 'fw':
+                    if gamma == 1:
+                        active = {}
+                    for value in active.values():
+                        value[1] *= (1 - gamma)
+                    key = vertex.tostring()
+                    if key in active:
+                        active[key][1] += gamma
+                    else:
+                        active[key] = [vertex, gamma]
+                else:
+                    if kind == 'away':
+                        for value in active.values():
+                            value[1] *= (1 + gamma)
+                        active[key_away][1] -= gamma
+                    else:
+                        active[key_away][1] -= gamma
+                        key = vertex.tostring()
+                        if key in active:
+                            active[key][1] += gamma
+                        else:
+                            active[key] = [vertex, gamma]
+                    if gamma == max_gamma:
+                        # drop step
+                        del(active[key_away])
+
+            beta, current_f = trial, trial_f
+            itercount += 1
+
+        problem.coefs[:] = beta
+        if variant != 'vanilla':
+            self.active_set = [value[0] for value in active.values()]
+            self.active_weights = np.array([value[1] for value in active.values()])
+        self.convergence_params = (itercount, current_f, self.gap, tol)
+        if return_objective_hist:
+            return objective_hist[:itercount]
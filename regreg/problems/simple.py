@@ -4,20 +4,28 @@ a smooth function and a single penalty.
 
 """
 import numpy as np
+from scipy import sparse
 
 from ..problems.composite import composite
 from ..affine import identity, scalar_multiply, astransform, adjoint
 from ..atoms import atom
+from ..atoms.seminorms import seminorm
 from ..atoms.cones import zero as zero_cone
 from ..smooth import zero as zero_smooth, sum as smooth_sum, affine_smooth
+from ..smooth.quadratic import quadratic
 from ..identity_quadratic import identity_quadratic
-from ..algorithms import FISTA
+from ..algorithms import FISTA, algorithm
 
 class simple_problem(composite):
+
+    default_solver = FISTA
     
     def __init__(self, smooth_atom, proximal_atom):
         self.smooth_atom = smooth_atom
         self.proximal_atom = proximal_atom
+        # the coefficients are kept in the precision of the smooth atom
+        self.proximal_atom.coefs = np.asarray(self.proximal_atom.coefs,
+                                              self.smooth_atom.coefs.dtype)
         self.coefs = self.smooth_atom.coefs = self.proximal_atom.coefs
 
     def smooth_objective(self, x, mode='both', check_feasibility=False):
@@ -28,6 +36,58 @@ class simple_problem(composite):
         vs = self.smooth_atom.smooth_objective(x, mode, check_feasibility)
         return vs
 
+    def affine_image(self, x):
+        return self.smooth_atom.affine_image(x)
+
+    def smooth_objective_image(self, eta, mode='both', check_feasibility=False):
+        return self.smooth_atom.smooth_objective_image(eta, mode, check_feasibility)
+
+    def duality_gap(self, x):
+        r"""
+        The duality gap at x and a feasible dual point.
+
+        The smooth_atom should be :math:`\ell(X\beta+\alpha)` for a loss
+        :math:`\ell` with a `conjugate_value` and the proximal_atom
+        a seminorm in Lagrange form. The dual point is the gradient
+        :math:`\nabla \ell(X\beta+\alpha)`, scaled so that its image under
+        :math:`X^T` lies in the dual ball of the seminorm.
+
+        Returns
+        -------
+
+        gap : float
+
+        dual_point : ndarray
+        """
+        smooth_atom, penalty = self.smooth_atom, self.proximal_atom
+        if isinstance(smooth_atom, affine_smooth):
+            loss, transform = smooth_atom.sm_atom, smooth_atom.affine_transform
+        else:
+            loss, transform = smooth_atom, identity(smooth_atom.shape)
+
+        if (not isinstance(penalty, seminorm) or penalty.lagrange is None or
+            (penalty.offset is not None and np.any(penalty.offset != 0))):
+            raise NotImplementedError('duality gap needs a seminorm in Lagrange form without offset')
+        for q in [self.quadratic, smooth_atom.quadratic, loss.quadratic, 
+                  penalty.quadratic]:
+            if q is not None and not q.iszero:
+                raise NotImplementedError('duality gap does not handle quadratic terms')
+
+        eta = transform.affine_map(x)
+        f, g = loss.smooth_objective(eta, 'both')
+        dual_norm = penalty.conjugate.seminorm(transform.adjoint_map(g), 
+                                               lagrange=1)
+        if dual_norm > penalty.lagrange:
+            dual_point = g * (penalty.lagrange / dual_norm)
+        else:
+            dual_point = g
+
+        primal = f + penalty.nonsmooth_objective(x)
+        dual = -loss.conjugate_value(dual_point)
+        if transform.affine_offset is not None:
+            dual += (dual_point * transform.affine_offset).sum()
+        return primal - dual, dual_point
+
     def nonsmooth_objective(self, x, check_feasibility=False):
         vn = self.proximal_atom.nonsmooth_objective(x, check_feasibility=check_feasibility)
         vs = self.smooth_atom.nonsmooth_objective(x, check_feasibility=check_feasibility)
@@ -37,6 +97,17 @@ class simple_problem(composite):
         proxq = proxq + self.smooth_atom.quadratic + self.quadratic
         return self.proximal_atom.solve(proxq)
 
+    def diagonal_proximal(self, proxq, diag):
+        """
+        The proximal map of the nonsmooth part in the diagonal metric
+        diag (see `seminorm.diagonal_proximal`). The quadratic terms
+        of the problem are added in the usual metric.
+        """
+        if not hasattr(self.proximal_atom, 'diagonal_proximal'):
+            raise ValueError('%s does not have a diagonal proximal map' % self.proximal_atom.__class__.__name__)
+        return self.proximal_atom.diagonal_proximal(proxq, diag, 
+                   quadratic=self.smooth_atom.quadratic + self.quadratic)
+
     @staticmethod
     def smooth(smooth_atom):
         """
@@ -73,16 +144,40 @@ class simple_problem(composite):
         result = '\n'.join([s.strip() for s in result.split('\n')])
         return result
 
-    def solve(self, quadratic=None, return_optimum=False, **fit_args):
+    def solve(self, quadratic=None, return_optimum=False, solver=None, 
+              **fit_args):
+        """
+        Solve the problem, starting from self.coefs.
+
+        Parameters
+        ----------
+
+        quadratic : identity_quadratic
+            An optional quadratic added to the problem.
+
+        return_optimum : bool
+            Return the optimal value as well as the minimizer?
+
+        solver : class
+            The algorithm used, defaults to self.default_solver (FISTA).
+            For instance, proximal_newton can be used
+            for GLM losses.
+
+        fit_args : dict
+            Keyword arguments passed to the solver's fit method.
+        """
         if quadratic is not None:
             oldq, self.quadratic = self.quadratic, self.quadratic + quadratic
         else:
             oldq = self.quadratic
 
-        solver = FISTA(self)
+        if solver is None:
+            solver = self.default_solver
+        solver = solver(self)
         solver.composite.coefs[:] = self.coefs
         self.solver_results = solver.fit(**fit_args)
         self.final_inv_step = solver.inv_step
+        self.truncated = getattr(solver, 'truncated', False)
 
         if return_optimum:
             value = (self.objective(self.coefs), self.coefs)
@@ -91,7 +186,188 @@ class simple_problem(composite):
         self.quadratic = oldq
         return value
 
-    
+
+class proximal_newton(algorithm):
+
+    r"""
+    A proximal Newton algorithm for a simple_problem whose smooth_atom 
+    is an affine_smooth of a loss with a hessian_weights method,
+    such as logistic_deviance, poisson_deviance or multinomial_deviance.
+
+    At each iteration, with :math:`\eta=X\beta+\alpha` the current linear
+    predictor, the loss is replaced by the quadratic model
+
+    .. math::
+
+       \frac{1}{2} (X(b-\beta))^TW(X(b-\beta)) + \nabla \ell(\eta)^TX(b-\beta)
+
+    with :math:`W` the diagonal of the Hessian of the loss at :math:`\eta`.
+    The model plus the penalty is minimized with FISTA, using the
+    penalty's proximal map, and a backtracking line search on
+    the true objective is done along the resulting direction. 
+
+    >>> n, p = 200, 50
+    >>> X = np.random.standard_normal((n, p))
+    >>> Y = np.random.binomial(1, 0.5, n)
+    >>> problem = rr.simple_problem(rr.logistic_loss(X, Y), rr.l1norm(p, lagrange=0.01))
+    >>> coefs = problem.solve(solver=rr.proximal_newton, tol=1.e-10)
+
+    """
+
+    def fit(self,
+            max_its=100,
+            min_its=1,
+            tol=1.e-8,
+            inner_tol=None,
+            inner_max_its=2000,
+            alpha=0.5,
+            sigma=1.e-4,
+            min_weight=1.e-8,
+            gram=None,
+            return_objective_hist=True,
+            debug=None):
+        """
+        Parameters
+        ----------
+        max_its : int
+              the maximum number of Newton steps
+        min_its : int
+              the minimum number of Newton steps
+        tol : float
+              the tolerance used in the stopping criterion, based
+              on the relative decrease in objective
+        inner_tol : float
+              tolerance for solving each quadratic model with FISTA,
+              defaults to tol / 10.
+        inner_max_its : int
+              the maximum number of FISTA iterations for each model
+        alpha : float
+              the step length is multiplied by alpha in the line search
+        sigma : float
+              sufficient decrease parameter of the line search
+        min_weight : float
+              lower bound for the weights of the quadratic model 
+        gram : bool
+              If True, the model is minimized using the p x p matrix
+              :math:`X^TWX` so the inner iterations do not touch the data.
+              Forming it costs :math:`O(np^2)` at each Newton step and,
+              unless X is a sparse matrix, a dense n x p copy of X. 
+              Defaults to True if the coefficients are 1D, p <= 1000, 
+              n * p <= 1e7 and X is not a sparse matrix.
+        return_objective_hist : bool
+              Return the sequence of objective values?
+        debug : bool
+              Resets self.debug, which controls whether convergence information is printed
+
+        Returns
+        -------
+
+        objective_hist : ndarray
+              A vector of objective values. Only return if return_objective_hist is True.
+
+        """
+
+        if debug is not None:
+            self.debug = debug
+        if inner_tol is None:
+            inner_tol = tol / 10.
+
+        problem = self.composite
+        smooth_atom = problem.smooth_atom
+        if not isinstance(smooth_atom, affine_smooth):
+            raise ValueError('proximal_newton needs an affine_smooth loss')
+        loss, transform = smooth_atom.sm_atom, smooth_atom.affine_transform
+
+        beta = problem.coefs.copy()
+        sparse_design = getattr(transform, 'sparseD', False)
+        if gram is None:
+            n = np.product(transform.output_shape)
+            gram = (beta.ndim == 1 and beta.shape[0] <= 1000 and 
+                    n * beta.shape[0] <= 1.e7 and not sparse_design)
+        if gram:
+            if beta.ndim != 1:
+                raise ValueError('gram option is only available for 1D coefficients')
+            if sparse_design:
+                X = transform.linear_operator
+            else:
+                # the linear part of the transform as a dense matrix
+                X = transform.linear_map(np.identity(beta.shape[0]))
+
+        # the quadratic terms are all passed to the prox
+        problemq = problem.quadratic + smooth_atom.quadratic
+
+        eta = transform.affine_map(beta)
+        current_obj = loss.smooth_objective(eta, 'func') + problem.nonsmooth_objective(beta)
+        objective_hist = [current_obj]
+        inv_step = None
+
+        itercount = 0
+        while itercount < max_its:
+
+            loss_grad = loss.smooth_objective(eta, 'grad')
+            W = np.maximum(loss.hessian_weights(eta), min_weight)
+            grad = transform.adjoint_map(loss_grad).reshape(beta.shape)
+
+            if gram:
+                if sparse_design:
+                    H = X.T.dot(sparse.diags(W).dot(X)).toarray()
+                else:
+                    H = np.dot(X.T, W[:,np.newaxis] * X)
+                model = quadratic(beta.shape, Q=H, offset=beta,
+                                  quadratic=identity_quadratic(0, 0, grad, 0))
+            else:
+                model = affine_smooth(quadratic(eta.shape, Q=W, Qdiag=True,
+                                                offset=eta - loss_grad / W),
+                                      transform)
+            subproblem = simple_problem(model, problem.proximal_atom)
+            subproblem.quadratic = problemq
+            subproblem.coefs = beta.copy()
+            solve_args = {'tol':inner_tol, 'max_its':inner_max_its}
+            if inv_step is not None:
+                solve_args['start_inv_step'] = inv_step
+            direction = subproblem.solve(**solve_args) - beta
+            inv_step = subproblem.final_inv_step
+
+            # backtracking line search on the true objective 
+            eta_direction = transform.linear_map(direction)
+            h_beta = problem.nonsmooth_objective(beta)
+            decrease = ((grad * direction).sum() + 
+                        problem.nonsmooth_objective(beta + direction) - h_beta)
+            step = 1.
+            while True:
+                trial = beta + step * direction
+                trial_eta = eta + step * eta_direction
+                trial_obj = (loss.smooth_objective(trial_eta, 'func') + 
+                             problem.nonsmooth_objective(trial))
+                if trial_obj <= current_obj + sigma * step * min(decrease, 0) or step < 1.e-10:
+                    break
+                step *= alpha
+
+            obj_change = np.fabs(trial_obj - current_obj)
+            obj_rel_change = obj_change / np.max([np.fabs(current_obj), 1.])
+
+            if self.debug:
+                print "%i    obj: %.6e    step: %.2e    rel_obj_change: %.2e    tol: %.1e" % (itercount, trial_obj, step, obj_rel_change, tol)
+
+            itercount += 1
+            if trial_obj <= current_obj:
+                beta, eta, current_obj = trial, trial_eta, trial_obj
+            objective_hist.append(current_obj)
+
+            if itercount >= min_its and (obj_rel_change < tol or obj_change < tol):
+                if self.debug:
+                    print 'Success: Optimization stopped because decrease in objective was below tolerance'
+                break
+
+        problem.coefs[:] = beta
+        self.inv_step = inv_step
+        self.convergence_params = (itercount,
+                                   current_obj,
+                                   obj_rel_change,
+                                   tol)
+        if return_objective_hist:
+            return np.array(objective_hist)
+
 def gengrad(simple_problem, L, tol=1.0e-8, max_its=1000, debug=False,
             coef_stop=False):
     """
@@ -0,0 +1,290 @@
+r"""
+A working set solver for sparse problems at a single value
+of the Lagrange parameter.
+
+The problems handled are simple_problems of the form
+
+.. math::
+
+   \ell(X\beta) + \frac{\kappa}{2}\|\beta\|^2_2 + \eta^T\beta + {\cal P}(\beta)
+
+where :math:`\ell` is any smooth loss, :math:`X` is an ndarray, a
+scipy.sparse matrix, a normalize transform or any other linear transform,
+and :math:`{\cal P}` is an l1norm, weighted_l1norm, group_lasso or mixed_lasso
+in Lagrange form.
+
+The problem is solved restricted to a small working set of
+coordinates (or groups). The KKT conditions are then checked for
+all coordinates outside of the working set with one product with
+:math:`X^T` and the working set is grown geometrically by the
+coordinates that violate them the most. For p large and solutions
+with few nonzero coefficients, most iterations only touch the
+columns of :math:`X` in the working set.
+
+>>> import numpy as np, regreg.api as rr
+>>> X = np.random.standard_normal((100,1000)); Y = np.random.standard_normal(100)
+>>> problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(1000, lagrange=30.))
+>>> coefs = problem.solve(solver=rr.working_set, tol=1.e-10)
+
+"""
+import numpy as np
+from scipy import sparse
+
+from ..algorithms import algorithm, FISTA
+from ..affine import (affine_transform, normalize, selector, adjoint,
+                      composition)
+from ..smooth import affine_smooth
+from ..atoms.seminorms import l1norm
+from ..atoms.weighted_atoms import l1norm as weighted_l1norm
+from ..atoms.group_lasso import group_lasso
+from ..atoms.mixed_lasso import mixed_lasso, UNPENALIZED, NONNEGATIVE
+from .simple import simple_problem
+
+class working_set(algorithm):
+
+    """
+    Working set outer loop for a simple_problem whose smooth
+    atom is an affine_smooth and whose penalty is an l1norm,
+    weighted_l1norm, group_lasso or mixed_lasso in Lagrange form.
+
+    The coefficients are partitioned into units: single coordinates
+    for the l1 penalties and the groups of the group penalties.
+    Units that are unpenalized or constrained to be nonnegative are
+    always in the working set.
+    """
+
+    def __init__(self, composite):
+        algorithm.__init__(self, composite)
+
+        smooth_atom = composite.smooth_atom
+        if not isinstance(smooth_atom, affine_smooth):
+            raise ValueError('working set needs a smooth atom of the form loss(X beta)')
+        self.transform = smooth_atom.affine_transform
+        if isinstance(self.transform, affine_transform) and \
+                sparse.isspmatrix(self.transform.linear_operator):
+            # column slicing is fast in csc format
+            self._csc = sparse.csc_matrix(self.transform.linear_operator)
+
+        self._set_units(composite.proximal_atom)
+        self.working_set = None
+
+    def _set_units(self, penalty):
+        if penalty.offset is not None and np.any(penalty.offset != 0):
+            raise ValueError('working set does not handle penalties with an offset')
+        if not hasattr(penalty, 'lagrange') or penalty.lagrange is None:
+            raise ValueError('working set needs a penalty in Lagrange form')
+
+        p = penalty.shape[0]
+        self.positive_part = np.array([], np.int)
+        if isinstance(penalty, (l1norm, weighted_l1norm)):
+            self.units = np.arange(p)
+            if isinstance(penalty, weighted_l1norm):
+                self.unit_weights = np.asarray(penalty.weights, np.float)
+            else:
+                self.unit_weights = np.ones(p)
+            always = self.unit_weights == 0
+        elif isinstance(penalty, mixed_lasso):
+            ngroups = penalty._weight_array.shape[0]
+            units = penalty._groups.copy()
+            ungrouped = units < 0
+            units[ungrouped] = ngroups + np.arange(ungrouped.sum())
+            self.units = units
+            self.unit_weights = np.hstack([penalty._weight_array,
+                                           np.ones(ungrouped.sum())])
+            structure = np.asarray(penalty.penalty_structure)
+            always = np.zeros(self.unit_weights.shape, np.bool)
+            always[units[(structure == UNPENALIZED) +
+                         (structure == NONNEGATIVE)]] = True
+            self.positive_part = penalty._positive_part
+        elif isinstance(penalty, group_lasso):
+            self.units = penalty._groups
+            self.unit_weights = penalty._weight_array
+            always = np.zeros(self.unit_weights.shape, np.bool)
+        else:
+            raise ValueError('working set handles l1norm, weighted_l1norm, group_lasso and mixed_lasso penalties')
+        self.always = always
+
+    def scores(self, grad):
+        """
+        For each unit, the dual norm of grad restricted
+        to the unit divided by its weight times lagrange.
+        At a solution, units that are zero have scores at most 1.
+        """
+        lagrange = self.composite.proximal_atom.lagrange
+        grad = np.asarray(grad).reshape(-1)
+        norms2 = np.bincount(self.units, weights=grad**2,
+                             minlength=self.unit_weights.shape[0])
+        scores = np.sqrt(norms2) / (self.unit_weights * lagrange)
+        if self.positive_part.shape[0]:
+            # negative coefficients are not penalized
+            gpp = grad[self.positive_part]
+            scores[self.units[self.positive_part]] = np.where(gpp > 0, np.inf,
+                                                              -gpp / lagrange)
+        return scores
+
+    def restricted_transform(self, columns):
+        """
+        The linear part of the smooth atom restricted
+        to the coefficients in columns.
+        """
+        transform = self.transform
+        if isinstance(transform, normalize):
+            restricted = transform.slice_columns(columns)
+            if transform.intercept_column is not None:
+                intercept = np.nonzero(columns == transform.intercept_column)[0]
+                if intercept.shape[0]:
+                    restricted.intercept_column = intercept[0]
+            return restricted
+        elif (isinstance(transform, affine_transform) and
+              not (transform.noneD or transform.affineD or transform.diagD)):
+            if transform.sparseD:
+                X = self._csc[:,columns].tocsr()
+            else:
+                X = transform.linear_operator[:,columns]
+            return affine_transform(X, transform.affine_offset)
+        return composition(transform,
+                           adjoint(selector(columns, transform.input_shape)))
+
+    def restricted_penalty(self, columns, quadratic):
+        """
+        The penalty restricted to the coefficients in columns.
+        """
+        penalty = self.composite.proximal_atom
+        lagrange = penalty.lagrange
+        if isinstance(penalty, weighted_l1norm):
+            return weighted_l1norm(columns.shape, penalty.weights[columns],
+                                   lagrange=lagrange, quadratic=quadratic)
+        elif isinstance(penalty, l1norm):
+            return l1norm(columns.shape, lagrange=lagrange,
+                          quadratic=quadratic)
+        elif isinstance(penalty, mixed_lasso):
+            structure = np.asarray(penalty.penalty_structure)[columns]
+            return mixed_lasso(structure, lagrange, weights=penalty.weights,
+                               quadratic=quadratic)
+        return group_lasso(np.asarray(penalty.groups)[columns],
+                           weights=penalty.weights,
+                           lagrange=lagrange, quadratic=quadratic)
+
+    def restricted_problem(self, columns):
+        """
+        The problem restricted to the coefficients in columns,
+        all other coefficients being fixed at 0. The quadratic
+        terms of the problem are moved to the penalty.
+        """
+        problem = self.composite
+        smooth_atom = problem.smooth_atom
+        q = (problem.quadratic + smooth_atom.quadratic +
+             problem.proximal_atom.quadratic).collapsed()
+        loss = affine_smooth(smooth_atom.sm_atom,
+                             self.restricted_transform(columns))
+        return simple_problem(loss, self.restricted_penalty(columns, q[columns]))
+
+    def fit(self,
+            max_its=50,
+            tol=1.e-8,
+            kkt_tol=1.e-3,
+            start_size=10,
+            growth=2.,
+            return_objective_hist=True,
+            debug=None,
+            **solve_args):
+        """
+        Parameters
+        ----------
+        max_its : int
+              the maximum number of working sets
+        tol : float
+              the tolerance for each restricted problem,
+              passed to its solve method
+        kkt_tol : float
+              the KKT conditions are met by a unit outside of the
+              working set if its score (see `scores`) is at most 1 + kkt_tol
+        start_size : int
+              the number of units with the largest scores added to
+              the nonzero and unpenalized units to form the first working set
+        growth : float
+              each working set is at most growth times as large
+              as the previous one
+        return_objective_hist : bool
+              Return the sequence of objective values after each
+              restricted problem is solved?
+        debug : bool
+              Resets self.debug, which controls whether convergence information is printed
+        solve_args : dict
+              Keyword arguments passed to the solve method of the
+              restricted problems, such as solver.
+
+        Returns
+        -------
+
+        objective_hist : ndarray
+              A vector of objective values. Only return if return_objective_hist is True.
+
+        """
+        if debug is not None:
+            self.debug = debug
+
+        problem = self.composite
+        smooth_atom = problem.smooth_atom
+        q = (problem.quadratic + smooth_atom.quadratic +
+             problem.proximal_atom.quadratic).collapsed()
+        beta = problem.coefs.copy()
+
+        def objective_grad(beta):
+            f, g = smooth_atom.smooth_objective(beta, 'both')
+            if not q.iszero:
+                g = g + q.objective(beta, 'grad')
+            return f + problem.nonsmooth_objective(beta), g
+
+        current_obj, grad = objective_grad(beta)
+        objective_hist = [current_obj]
+        scores = self.scores(grad)
+
+        nunits = self.unit_weights.shape[0]
+        active = np.zeros(nunits, np.bool)
+        active[self.units[beta.reshape(-1) != 0]] = True
+        in_set = self.always + active
+        candidates = np.nonzero(~in_set)[0]
+        candidates = candidates[np.argsort(-scores[candidates])][:start_size]
+        in_set[candidates] = True
+
+        self.converged = False
+        itercount = 0
+        while itercount < max_its:
+            columns = np.nonzero(in_set[self.units])[0]
+            subproblem = self.restricted_problem(columns)
+            subproblem.coefs[:] = beta[columns]
+            if self.inv_step is not None and solve_args.get('solver', FISTA) is FISTA:
+                solve_args.setdefault('start_inv_step', self.inv_step)
+            subproblem.solve(tol=tol, **solve_args)
+            self.inv_step = subproblem.final_inv_step
+            beta[:] = 0
+            beta[columns] = subproblem.coefs
+            itercount += 1
+
+            # check the KKT conditions on the full problem
+
+            current_obj, grad = objective_grad(beta)
+            objective_hist.append(current_obj)
+            scores = self.scores(grad)
+            failing = np.nonzero((~in_set) * (scores > 1 + kkt_tol))[0]
+
+            if self.debug:
+                print "%i    obj: %.6e    working set: %i    failing: %i    max score: %.3f" % (itercount, current_obj, columns.shape[0], failing.shape[0], scores[~in_set].max() if np.any(~in_set) else 0)
+
+            if failing.shape[0] == 0:
+                self.converged = True
+                if self.debug:
+                    print 'Success: Optimization stopped because KKT conditions were met outside of the working set'
+                break
+
+            size = in_set.sum()
+            nadd = max(int(np.ceil((growth - 1) * size)), 1)
+            failing = failing[np.argsort(-scores[failing])][:nadd]
+            in_set[failing] = True
+
+        problem.coefs[:] = beta
+        self.working_set = columns
+        self.convergence_params = (itercount, current_obj, failing.shape[0], kkt_tol)
+        if return_objective_hist:
+            return np.array(objective_hist)
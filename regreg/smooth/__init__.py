@@ -4,7 +4,7 @@ import warnings
 import inspect
 
 from ..problems.composite import smooth as smooth_composite
-from ..affine import affine_transform, linear_transform
+from ..affine import affine_transform, linear_transform, float_dtype
 from ..identity_quadratic import identity_quadratic
 
 class smooth_atom(smooth_composite):
@@ -32,6 +32,13 @@ class smooth_atom(smooth_composite):
 
     def smooth_objective(self, x, mode='both', check_feasibility=False):
         raise NotImplementedError
+
+    def hessian_weights(self, x):
+        """
+        Diagonal of the Hessian of smooth_objective at x. 
+        Used to form local quadratic models, e.g. by proximal_newton.
+        """
+        raise NotImplementedError('%s does not have hessian_weights' % self.__class__.__name__)
     
     @classmethod
     def affine(cls, linear_operator, offset, coef=1, diag=False,
@@ -45,6 +52,9 @@ class smooth_atom(smooth_composite):
             l = linear_operator
         if not acceptable_init_args(cls, kws):
             raise ValueError("Invalid arguments being passed to initialize " + cls.__name__)
+        if offset is not None and not sparse.issparse(offset):
+            # keep the offset in the precision of the linear operator
+            offset = np.asarray(offset, l.dtype)
         
         atom = cls(l.output_shape, coef=coef, offset=offset, quadratic=quadratic, **kws)
         
@@ -87,6 +97,13 @@ class smooth_atom(smooth_composite):
     def get_conjugate(self):
         raise NotImplementedError('each smooth loss should implement its own get_conjugate')
 
+    def conjugate_value(self, u):
+        r"""
+        The convex conjugate of the smooth objective at u,
+        :math:`\sup_x u^Tx - f(x)`. Used by `simple_problem.duality_gap`.
+        """
+        raise NotImplementedError('%s does not compute the value of its conjugate' % self.__class__.__name__)
+
     @property
     def conjugate(self):
         return self.get_conjugate()
@@ -123,7 +140,7 @@ class affine_smooth(smooth_atom):
             atransform = linear_transform(atransform, diag=diag)
         self.affine_transform = atransform
         self.shape = atransform.input_shape
-        self.coefs = np.zeros(self.shape)
+        self.coefs = np.zeros(self.shape, float_dtype(atransform))
 
     def latexify(self, var=None, idx=''):
         if var is None:
@@ -146,6 +163,16 @@ class affine_smooth(smooth_atom):
 
     def smooth_objective(self, x, mode='both', check_feasibility=False):
         eta = self.affine_transform.affine_map(x)
+        return self.smooth_objective_image(eta, mode)
+
+    def affine_image(self, x):
+        return self.affine_transform.affine_map(x)
+
+    def smooth_objective_image(self, eta, mode='both', check_feasibility=False):
+        """
+        Evaluate the smooth objective at a point x
+        with self.affine_image(x) equal to eta.
+        """
         if mode == 'both':
             v, g = self.sm_atom.smooth_objective(eta, mode='both')
             if self.store_grad:
@@ -159,8 +186,9 @@ class affine_smooth(smooth_atom):
             g = self.affine_transform.adjoint_map(g).reshape(self.shape)
             return g 
         elif mode == 'func':
-            v = self.sm_atom.smooth_objective(eta, mode='func')
-            return v 
+            return self.sm_atom.smooth_objective(eta, mode='func')
+        else:
+            raise ValueError("mode incorrectly specified")
 
     @property
     def dual(self):
@@ -251,8 +279,10 @@ class logistic_deviance(smooth_atom):
             overflow = False
             exp_x = np.exp(x)
             
+        # the gradient is kept in the precision of x,
+        # the function value is accumulated in float64
         if mode == 'both':
-            ratio = self.trials * 1.
+            ratio = self.trials.astype(float_dtype(x))
             if overflow:
                 log_exp_x = x * 1.
                 log_exp_x[not_overflow_ind] = np.log(1.+exp_x)
@@ -260,16 +290,18 @@ class logistic_deviance(smooth_atom):
             else:
                 log_exp_x = np.log(1.+exp_x)
                 ratio *= exp_x/(1.+exp_x)
+            ratio -= self.successes
                 
-            f, g = -2 * self.scale((np.dot(self.successes,x) - np.sum(self.trials*log_exp_x))), -2 * self.scale(self.successes-ratio)
+            f, g = -2 * self.scale((np.dot(self.successes,x) - np.sum(self.trials*log_exp_x))), 2 * self.scale(ratio)
             return f, g
         elif mode == 'grad':
-            ratio = self.trials * 1.
+            ratio = self.trials.astype(float_dtype(x))
             if overflow:
                 ratio[not_overflow_ind] *= exp_x/(1.+exp_x)
             else:
                 ratio *= exp_x/(1.+exp_x)
-            f, g = None, - 2 * self.scale(self.successes-ratio)
+            ratio -= self.successes
+            f, g = None, 2 * self.scale(ratio)
             return g
         elif mode == 'func':
             if overflow:
@@ -282,6 +314,15 @@ class logistic_deviance(smooth_atom):
         else:
             raise ValueError("mode incorrectly specified")
 
+    def hessian_weights(self, x):
+        """
+        Diagonal of the Hessian of smooth_objective at x,
+        i.e. the weights of iteratively reweighted least squares.
+        """
+        x = self.apply_offset(x)
+        pi = 1. / (1. + np.exp(-np.clip(x, -1e2, 1e2)))
+        return 2 * self.scale(self.trials * pi * (1 - pi))
+
 
 class poisson_deviance(smooth_atom):
 
@@ -345,6 +386,14 @@ class poisson_deviance(smooth_atom):
         else:
             raise ValueError("mode incorrectly specified")
 
+    def hessian_weights(self, x):
+        """
+        Diagonal of the Hessian of smooth_objective at x,
+        i.e. the weights of iteratively reweighted least squares.
+        """
+        x = self.apply_offset(x)
+        return 2. * self.scale(np.exp(x))
+
 
 class multinomial_deviance(smooth_atom):
 
@@ -421,6 +470,17 @@ class multinomial_deviance(smooth_atom):
         else:
             raise ValueError("mode incorrectly specified")
 
+    def hessian_weights(self, x):
+        """
+        Diagonal of the Hessian of smooth_objective at x. 
+        The Hessian itself is block diagonal with one
+        (J-1)x(J-1) block per observation.
+        """
+        x = self.apply_offset(x)
+        exp_x = np.exp(x)
+        pi = exp_x / (1. + np.sum(exp_x, axis=1))[:,np.newaxis]
+        return 2. * self.scale(self.trials[:,np.newaxis] * pi * (1 - pi))
+
 
 def logistic_loss(X, Y, trials=None, coef=1.):
     '''
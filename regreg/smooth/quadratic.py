@@ -51,14 +51,15 @@ class quadratic(smooth_atom):
 
         x = self.apply_offset(x)
         if self.Q is None:
+            # the function value is accumulated in float64
             if mode == 'both':
-                f, g  = self.scale(np.linalg.norm(x)**2) / 2., self.scale(x)
+                f, g  = self.scale(np.linalg.norm(np.asarray(x, np.float64))**2) / 2., self.scale(x)
                 return f, g
             elif mode == 'grad':
                 f, g = None, self.scale(x)
                 return g
             elif mode == 'func':
-                f, g = self.scale(np.linalg.norm(x)**2) / 2., None
+                f, g = self.scale(np.linalg.norm(np.asarray(x, np.float64))**2) / 2., None
                 return f
             else:
                 raise ValueError("mode incorrectly specified")
@@ -76,10 +77,41 @@ class quadratic(smooth_atom):
                 raise ValueError("mode incorrectly specified")
 
 
+    def hessian_weights(self, x):
+        """
+        Diagonal of the Hessian of smooth_objective at x.
+        """
+        if self.Q is None:
+            return self.coef * np.ones(x.shape)
+        elif self.Q_transform.diagD:
+            return self.coef * self.Q_transform.linear_operator * np.ones(x.shape)
+        return self.coef * np.diag(self.Q)
+
+    def conjugate_value(self, u):
+        r"""
+        The convex conjugate of the smooth objective at u,
+        :math:`\sup_x u^Tx - f(x)`. Unlike self.conjugate, which 
+        follows the sign convention of `dual_problem` for the offset, 
+        this is the conjugate itself.
+        """
+        offset = self.offset
+        if offset is None:
+            offset = 0
+        if self.Q is None:
+            Qinv_u = u
+        elif self.Q_transform.diagD:
+            Qinv_u = u / self.Q_transform.linear_operator
+        else:
+            Qinv_u = np.linalg.solve(self.Q, u)
+        return (u * Qinv_u).sum() / (2. * self.coef) + (u * offset).sum()
+
     def get_conjugate(self, factor=False, as_quadratic=False):
 
         if self.Q is None:
-            q = identity_quadratic(self.coef, -self.offset, 0, 0).collapsed()
+            if self.offset is not None:
+                q = identity_quadratic(self.coef, -self.offset, 0, 0).collapsed()
+            else:
+                q = identity_quadratic(self.coef, 0, 0, 0)
             totalq = q + self.quadratic
             totalq_conj = totalq.conjugate.collapsed()
             if as_quadratic:
@@ -0,0 +1,38 @@
+import numpy as np
+import regreg.api as rr
+import nose.tools as nt
+
+from test_seminorms import ac
+
+def test_batched_lasso():
+    n, p, K = 100, 20, 6
+    X = np.random.standard_normal((n, p))
+    Y = np.random.standard_normal((n, K))
+    Xn = rr.normalize(X)
+    lagrange = np.linspace(0.005, 0.05, K)
+
+    losses = [rr.quadratic.shift(Y[:,k], coef=1./n) for k in range(K)]
+    penalties = [rr.l1norm(p, lagrange=l) for l in lagrange]
+    solver = rr.batched_FISTA(Xn, losses, penalties)
+    coefs = solver.fit(tol=1.e-12)
+
+    yield nt.assert_equal, coefs.shape, (p, K)
+    yield nt.assert_true, np.all(solver.converged)
+    for k in range(K):
+        problem = rr.simple_problem(rr.affine_smooth(losses[k], Xn), 
+                                    rr.l1norm(p, lagrange=lagrange[k]))
+        yield ac, problem.solve(tol=1.e-12), coefs[:,k], 'batched lasso column %d' % k
+
+def test_batched_logistic():
+    n, p, K = 100, 20, 4
+    X = np.random.standard_normal((n, p))
+    Y = np.random.binomial(1, 0.5, (n, K))
+
+    losses = [rr.logistic_deviance(Y[:,k].shape, Y[:,k]) for k in range(K)]
+    penalties = [rr.l1norm(p, lagrange=2.) for k in range(K)]
+    solver = rr.batched_FISTA(X, losses, penalties)
+    coefs = solver.fit(tol=1.e-12)
+
+    for k in range(K):
+        problem = rr.simple_problem(rr.affine_smooth(losses[k], X), penalties[k])
+        yield ac, problem.solve(tol=1.e-12), coefs[:,k], 'batched logistic column %d' % k
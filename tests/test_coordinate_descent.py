@@ -0,0 +1,51 @@
+import numpy as np
+import regreg.api as rr
+import regreg.atoms.mixed_lasso as ml
+import nose.tools as nt
+from scipy import sparse
+
+from test_seminorms import ac
+
+def compare(loss, penalty):
+    problem = rr.simple_problem(loss, penalty)
+    coef_fista = problem.solve(tol=1.e-14, max_its=10000).copy()
+    obj_fista = problem.objective(coef_fista)
+    problem.coefs[:] = 0
+    coef_cd = problem.solve(solver=rr.coordinate_descent, tol=1.e-14)
+    return coef_fista, coef_cd.copy(), obj_fista, problem.objective(coef_cd)
+
+def test_coordinate_descent():
+    n, p = 50, 30
+    X = np.random.standard_normal((n, p))
+    X[X < 0.5] = 0
+    X[:,0] = 1
+    Y = np.random.standard_normal(n)
+
+    penalty_structure = ml.L1_PENALTY * np.ones(p, np.int)
+    penalty_structure[:3] = ml.UNPENALIZED
+    penalty_structure[3:5] = ml.POSITIVE_PART
+    penalty_structure[5:7] = ml.NONNEGATIVE
+    penalty_structure[7:15] = np.arange(8) // 4
+
+    enet = rr.identity_quadratic(0.5, 0, 0, 0)
+
+    for name, loss, penalty in [
+        ('lasso', rr.squared_error(X, Y), rr.l1norm(p, lagrange=1.)),
+        ('elastic net', rr.squared_error(X, Y), rr.l1norm(p, lagrange=1., quadratic=enet)),
+        ('sparse', rr.squared_error(sparse.csr_matrix(X), Y), rr.l1norm(p, lagrange=1.)),
+        ('normalize', rr.squared_error(rr.normalize(X, intercept_column=0), Y), rr.l1norm(p, lagrange=3.)),
+        ('sparse normalize', rr.squared_error(rr.normalize(sparse.csr_matrix(X[:,1:])), Y), rr.l1norm(p-1, lagrange=3.)),
+        ('weighted', rr.squared_error(X, Y), rr.weighted_l1norm(p, np.linspace(0.5, 2, p), lagrange=1.)),
+        ('group lasso', rr.squared_error(X, Y), rr.group_lasso(np.arange(p) // 3, lagrange=2.)),
+        ('mixed lasso', rr.squared_error(X, Y), rr.mixed_lasso(penalty_structure, 1.))]:
+        coef_fista, coef_cd, obj_fista, obj_cd = compare(loss, penalty)
+        yield ac, coef_fista, coef_cd, 'coordinate descent agrees with FISTA: %s' % name
+        yield nt.assert_true, obj_cd <= obj_fista + 1.e-6 * max(1, np.fabs(obj_fista))
+
+def test_coordinate_descent_errors():
+    X = np.random.standard_normal((20, 5))
+    Y = np.random.binomial(1, 0.5, 20)
+    problem = rr.simple_problem(rr.logistic_loss(X, Y), rr.l1norm(5, lagrange=1.))
+    yield nt.assert_raises, ValueError, rr.coordinate_descent, problem
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(5, bound=1.))
+    yield nt.assert_raises, ValueError, rr.coordinate_descent, problem
@@ -0,0 +1,53 @@
+import numpy as np
+import regreg.api as rr
+import nose.tools as nt
+
+from test_seminorms import ac
+
+def test_frank_wolfe():
+    n, p = 50, 20
+    X = np.random.standard_normal((n, p))
+    Y = np.random.standard_normal(n)
+
+    # away and pairwise steps converge linearly on polytopes
+    for name, penalty, variants in [
+        ('l1norm', rr.l1norm(p, bound=0.5), ['vanilla', 'away', 'pairwise']),
+        ('supnorm', rr.supnorm(p, bound=0.05), ['vanilla', 'away', 'pairwise']),
+        ('weighted supnorm', rr.weighted_supnorm(p, np.linspace(0.5, 2, p), bound=0.05), ['vanilla', 'away', 'pairwise']),
+        ('l2norm', rr.l2norm(p, bound=0.3), ['vanilla', 'away']),
+        ('group lasso', rr.group_lasso(np.arange(p) // 4, bound=0.5), ['vanilla'])]:
+        problem = rr.simple_problem(rr.squared_error(X, Y), penalty)
+        coef_fista = problem.solve(tol=1.e-14, max_its=10000).copy()
+        obj_fista = problem.objective(coef_fista)
+        for variant in variants:
+            problem.coefs[:] = 0
+            solver = rr.frank_wolfe(problem)
+            solver.fit(tol=1.e-6, variant=variant, max_its=5000)
+            obj_fw = problem.objective(problem.coefs)
+            # the gap bounds the distance to the minimum
+            yield nt.assert_true, obj_fw - obj_fista <= solver.gap + 1.e-10
+            if variant != 'vanilla':
+                yield nt.assert_true, solver.converged
+                yield nt.assert_true, obj_fw - obj_fista <= 1.e-6 * np.fabs(obj_fista)
+                yield nt.assert_true, np.fabs(solver.active_weights.sum() - 1) < 1.e-8
+
+def test_frank_wolfe_nuclear_norm():
+    Y = np.random.standard_normal((10, 8))
+    loss = rr.squared_error(rr.identity((10, 8)), Y)
+    problem = rr.simple_problem(loss, rr.nuclear_norm((10, 8), bound=3.))
+    coef_fista = problem.solve(tol=1.e-14, max_its=10000).copy()
+    for variant in ['vanilla', 'away', 'pairwise']:
+        problem.coefs[:] = 0
+        coef_fw = problem.solve(solver=rr.frank_wolfe, tol=1.e-8, variant=variant)
+        yield ac, coef_fista, coef_fw.copy(), 'Frank-Wolfe agrees with FISTA: nuclear_norm, %s' % variant
+
+def test_frank_wolfe_errors():
+    X = np.random.standard_normal((20, 5))
+    Y = np.random.standard_normal(20)
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(5, lagrange=1.))
+    yield nt.assert_raises, ValueError, rr.frank_wolfe, problem
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(5, bound=1., offset=np.ones(5)))
+    yield nt.assert_raises, ValueError, rr.frank_wolfe, problem
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(5, bound=1.))
+    solver = rr.frank_wolfe(problem)
+    yield nt.assert_raises, ValueError, solver.fit, 100, 5, 1.e-6, 'lazy'
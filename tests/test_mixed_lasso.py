@@ -59,3 +59,22 @@ def test_group_lasso_atom():
 
     np.testing.assert_allclose(z-a2, x2)
 
+
+def test_group_strong_set():
+    """
+    The strong rule keeps a group if the norm of its gradient is at least
+    its weight times 2 * lagrange_new - lagrange_cur.
+    """
+    groups = np.array([0]*5 + [1]*5)
+    weights = np.array([np.sqrt(5), 1.])
+    empty = np.array([], np.int)
+    lagrange_cur, lagrange_new = 1., 0.8
+
+    # the thresholds are sqrt(5) * 0.6 and 0.6
+    grad = np.zeros(10)
+    grad[:5] = 2. / np.sqrt(5)
+    grad[5:] = 0.5 / np.sqrt(5)
+    strong = ml.strong_set_mixed_lasso(grad, lagrange_new, lagrange_cur, 1,
+                                       empty, empty, empty, empty,
+                                       groups, weights)
+    np.testing.assert_equal(strong, [1]*5 + [0]*5)
@@ -524,3 +524,75 @@ def test_centering_fit_inplace(debug=False):
 
     nt.assert_true(np.linalg.norm(coefs - coefs2) / max(np.linalg.norm(coefs),1) < 1.0e-04)
 
+
+def test_select_rows():
+    """
+    This test verifies that selecting rows of a normalize
+    agrees with normalizing the selected rows of the matrix,
+    and that held-out rows are normalized with the statistics
+    of the selected rows.
+    """
+    from scipy import sparse
+    from regreg.affine import column_norms2
+    N, P = 40, 6
+    X = np.random.standard_normal((N,P)) + 3
+    X[:,0] = 1
+    rows = np.sort(np.random.permutation(N)[:30])
+    heldout = np.setdiff1d(np.arange(N), rows)
+
+    for M in [X, sparse.csc_matrix(X)]:
+        for center, scale, intercept_column in [(True, True, 0), 
+                                                (True, False, 0),
+                                                (False, True, None)]:
+            L = rr.normalize(M, center=center, scale=scale, intercept_column=intercept_column)
+            L_rows = L.select_rows(rows)
+            L_direct = rr.normalize(X[rows], center=center, scale=scale, intercept_column=intercept_column)
+
+            beta = np.random.standard_normal(P)
+            y = np.random.standard_normal(rows.shape[0])
+            np.testing.assert_almost_equal(L_rows.linear_map(beta), L_direct.linear_map(beta))
+            np.testing.assert_almost_equal(L_rows.adjoint_map(y), L_direct.adjoint_map(y))
+
+            D = np.array([L_direct.linear_map(e) for e in np.identity(P)]).T
+            np.testing.assert_almost_equal(column_norms2(L_rows), (D**2).sum(0))
+
+            Z = X[heldout].copy()
+            if center:
+                means = X[rows].mean(0)
+                means[0] = 0
+                Z -= means
+            if scale:
+                if center:
+                    stds = X[rows].std(0)
+                    stds[0] = 1
+                else:
+                    stds = np.sqrt((X[rows]**2).mean(0))
+                Z /= stds
+            L_heldout = L.select_rows(heldout, statistics=L_rows)
+            np.testing.assert_almost_equal(L_heldout.linear_map(beta), np.dot(Z, beta))
+
+def test_select_rows_blocks():
+    """
+    This test verifies the products of the selected rows
+    for a run of consecutive rows, a few rows and most of the rows.
+    """
+    from scipy import sparse
+    from regreg.affine import column_norms2
+    N, P = 40, 6
+    X = np.random.standard_normal((N,P)) + 3
+    X[:,0] = 1
+
+    for rows in [np.arange(5, 35),
+                 np.sort(np.random.permutation(N)[:8]),
+                 np.sort(np.random.permutation(N)[:30])]:
+        for M in [X, sparse.csc_matrix(X), sparse.csr_matrix(X)]:
+            L_rows = rr.normalize(M, intercept_column=0).select_rows(rows)
+            L_direct = rr.normalize(X[rows], intercept_column=0)
+
+            beta = np.random.standard_normal((P,2))
+            y = np.random.standard_normal((rows.shape[0],2))
+            np.testing.assert_almost_equal(L_rows.linear_map(beta), L_direct.linear_map(beta))
+            np.testing.assert_almost_equal(L_rows.adjoint_map(y), L_direct.adjoint_map(y))
+
+            D = np.array([L_direct.linear_map(e) for e in np.identity(P)]).T
+            np.testing.assert_almost_equal(column_norms2(L_rows), (D**2).sum(0))
@@ -1,5 +1,8 @@
 import numpy as np, regreg.api as rr
+import scipy.sparse
+import tempfile
 import nose.tools as nt
+from regreg.affine import tensorize
 
 def test_path():
     '''
@@ -218,3 +221,223 @@ def test_path_nonnegative():
     nt.assert_true(np.linalg.norm(beta1-beta2) / np.linalg.norm(beta1) < 1.e-5)
 
 
+
+def test_path_budget():
+    X = np.random.standard_normal((100,20))
+    Y = np.random.standard_normal(100)
+    lasso = rr.lasso.squared_error(X, Y, nstep=20)
+    budget = rr.fit_budget(matvecs=200)
+    sol = lasso.main(inner_tol=1.e-10, budget=budget)
+    nt.assert_true(sol['truncated'])
+    nt.assert_true(budget.exhausted)
+    nt.assert_equal(sol['beta'].shape[1], len(sol['lagrange']))
+    nt.assert_true(len(sol['lagrange']) < 20)
+
+def test_path_stream():
+    X = np.random.standard_normal((100,20))
+    Y = np.random.standard_normal(100) + 2 * X[:,0]
+    lasso = rr.lasso.squared_error(X, Y, nstep=10)
+    sol = lasso.main(inner_tol=1.e-10)
+
+    steps = list(rr.lasso.squared_error(X, Y, nstep=10).path(inner_tol=1.e-10))
+    nt.assert_equal(len(steps), 10)
+    beta = np.array(scipy.sparse.vstack([step['beta'] for step in steps]).todense()).T
+    np.testing.assert_allclose(beta, sol['beta'].todense(), atol=1.e-6)
+    np.testing.assert_allclose([step['lagrange'] for step in steps], sol['lagrange'])
+
+    path_file = tempfile.NamedTemporaryFile()
+    sol_file = rr.lasso.squared_error(X, Y, nstep=10).main(inner_tol=1.e-10, path_file=path_file.name)
+    loaded = rr.load_path(path_file.name)
+    np.testing.assert_allclose(loaded['beta'].todense(), sol_file['beta'].todense())
+    np.testing.assert_allclose(loaded['devratio'], sol_file['devratio'])
+    np.testing.assert_allclose(loaded['lagrange'], sol_file['lagrange'])
+    nt.assert_equal(loaded['df'], sol_file['df'])
+
+def test_parallel_path():
+    X = np.random.standard_normal((100,20))
+    Y = np.random.standard_normal(100) + 2 * X[:,0]
+    sol = rr.lasso.squared_error(X, Y, nstep=10).main(inner_tol=1.e-12)
+    for nproc in [1, 2]:
+        sol_par = rr.lasso.squared_error(X, Y, nstep=10).parallel_main(nproc=nproc, nsegment=3, inner_tol=1.e-12)
+        np.testing.assert_allclose(sol_par['beta'].todense(), sol['beta'].todense(), atol=1.e-6)
+        np.testing.assert_allclose(sol_par['lagrange'], sol['lagrange'])
+
+def test_cross_validate():
+    n = 120
+    X = np.random.standard_normal((n,20))
+    Y = np.random.standard_normal(n) + 2 * X[:,0]
+    folds = np.arange(n) % 3
+    lasso = rr.lasso.squared_error(X, Y, nstep=10)
+    cv = lasso.cross_validate(folds=folds, inner_tol=1.e-12)
+    nt.assert_equal(cv['deviance'].shape, (3, 10))
+    np.testing.assert_allclose(cv['lagrange'], lasso.lagrange_sequence)
+
+    # the first fold by hand
+    train, test = folds != 0, folds == 0
+    lasso_fold = rr.lasso.squared_error(X[train], Y[train], nstep=10)
+    lasso_fold.lagrange_sequence = cv['lagrange']
+    beta = np.array(lasso_fold.main(inner_tol=1.e-12)['beta'].todense())
+    Z = np.hstack([np.ones((test.sum(), 1)), 
+                   (X[test] - X[train].mean(0)) / X[train].std(0)])
+    loss = rr.squared_error(Z, Y[test], coef=1. / test.sum())
+    deviance = [loss.smooth_objective(b, 'func') for b in beta.T]
+    np.testing.assert_allclose(cv['deviance'][0], deviance, rtol=1.e-5)
+
+    cv_par = lasso.cross_validate(folds=folds, inner_tol=1.e-12, nproc=2)
+    np.testing.assert_allclose(cv_par['deviance'], cv['deviance'])
+    nt.assert_true(cv['lagrange_1se'] >= cv['lagrange_min'])
+
+def test_path_screen():
+    np.random.seed(0)
+    n, p = 100, 50
+    X = np.random.standard_normal((n,p))
+    Y = np.random.standard_normal(n) + 2 * X[:,0] - 2 * X[:,1]
+    penalty_structure = [0]*5 + [1]*5 + [rr.L1_PENALTY]*40
+    for lasso_cls, response in [(rr.lasso.squared_error, Y),
+                                (rr.lasso.logistic, (Y > 0).astype(np.float))]:
+        for args in [{}, {'penalty_structure':penalty_structure}]:
+            beta = [np.array(lasso_cls(X, response, nstep=20, **args).main(inner_tol=1.e-10, screen=screen)['beta'].todense())
+                    for screen in [False, True]]
+            yield np.testing.assert_allclose, beta[0], beta[1], 1.e-4, 1.e-6
+
+    # the safe set contains the support of an accurate solution,
+    # with the dual point projected to be feasible for the unpenalized
+    # and nonnegative coefficients
+    for lasso_cls, response, args in [(rr.lasso.squared_error, Y, {}),
+                                      (rr.lasso.squared_error, Y, {'covariance':True}),
+                                      (rr.lasso.squared_error, Y, {'penalty_structure':penalty_structure}),
+                                      (rr.lasso.logistic, (Y > 0).astype(np.float), {})]:
+        lasso = lasso_cls(X, response, nstep=10, **args)
+        for step in lasso.path(inner_tol=1.e-12, screen=False):
+            safe = lasso.safe_set(step['lagrange'])
+            yield nt.assert_true, safe is not None
+            yield nt.assert_true, np.all(safe[lasso.solution != 0])
+        yield nt.assert_true, safe.sum() < lasso.shape[1]
+
+def test_restricted_problem_cache():
+    X = scipy.sparse.csr_matrix(np.random.standard_normal((50,10)))
+    Y = np.random.standard_normal(50)
+    lasso = rr.lasso.squared_error(X, Y, nstep=10, intercept=False)
+    candidate_set = np.zeros(10, np.bool)
+    candidate_set[[0,3,4]] = True
+    problem = lasso.restricted_problem(candidate_set, 1.)[0]
+    nt.assert_true(lasso.restricted_problem(candidate_set.copy(), 0.5)[0] is problem)
+    nt.assert_equal(problem.proximal_atom.lagrange, 0.5)
+    uncached = lasso._restricted_problem(candidate_set, 0.5)[0]
+    beta = np.random.standard_normal(3)
+    np.testing.assert_allclose(problem.smooth_objective(beta, 'grad'),
+                               uncached.smooth_objective(beta, 'grad'))
+
+    sol = lasso.main(inner_tol=1.e-10)
+    nocache = rr.lasso.squared_error(X, Y, nstep=10, intercept=False)
+    nocache.cache_size = 0
+    sol_nocache = nocache.main(inner_tol=1.e-10)
+    np.testing.assert_allclose(sol['beta'].todense(), sol_nocache['beta'].todense(), atol=1.e-6)
+
+def test_path_covariance():
+    n, p = 500, 20
+    X = np.random.standard_normal((n,p))
+    Y = np.random.standard_normal(n) + 2 * X[:,0] - X[:,1]
+    penalty_structure = [0]*4 + [rr.L1_PENALTY]*16
+    for design in [X, scipy.sparse.csr_matrix(X)]:
+        for args in [{}, {'penalty_structure':penalty_structure}, {'intercept':False}]:
+            sol = rr.lasso.squared_error(design, Y, nstep=10, **args).main(inner_tol=1.e-10)
+            lasso = rr.lasso.squared_error(design, Y, nstep=10, covariance=True, **args)
+            sol_cov = lasso.main(inner_tol=1.e-10)
+            # the null solution is only solved to the default tolerance
+            yield np.testing.assert_allclose, sol['beta'].todense(), sol_cov['beta'].todense(), 1.e-4, 1.e-4
+            yield np.testing.assert_allclose, sol['devratio'], sol_cov['devratio'], 1.e-6, 1.e-8
+            # only the Gram columns of the subproblems were computed
+            yield nt.assert_true, lasso.gram.ncached < lasso.shape[1]
+
+    folds = np.arange(n) % 3
+    lasso = rr.lasso.squared_error(X, Y, nstep=10)
+    cv = lasso.cross_validate(folds=folds, inner_tol=1.e-10)
+    lasso_cov = rr.lasso.squared_error(X, Y, nstep=10, covariance=True)
+    cv_cov = lasso_cov.cross_validate(folds=folds, inner_tol=1.e-10)
+    yield np.testing.assert_allclose, cv['deviance'], cv_cov['deviance'], 1.e-4
+
+    nt.assert_raises(ValueError, rr.lasso.logistic, X, Y > 0, covariance=True)
+
+def test_linear_predictor():
+    n, p = 100, 20
+    X = np.random.standard_normal((n,p))
+    Y = np.random.standard_normal(n) + 2 * X[:,0]
+    for design in [X, scipy.sparse.csr_matrix(X)]:
+        lasso = rr.lasso.squared_error(design, Y, nstep=10)
+        for step in lasso.path(inner_tol=1.e-10):
+            eta = lasso.Xn.linear_map(lasso.solution)
+            yield np.testing.assert_allclose, lasso.linear_predictor(), eta, 1.e-10, 1.e-10
+        yield np.testing.assert_allclose, lasso.grad(), lasso.loss.smooth_objective(lasso.solution, 'grad'), 1.e-10, 1.e-10
+
+def test_multiresponse():
+    n, p, K = 100, 20, 4
+    X = np.random.standard_normal((n,p))
+    Y = np.random.standard_normal((n,K)) + 2 * X[:,:1]
+
+    # batch_size=3 splits the responses into two batches
+    for design in [X, scipy.sparse.csr_matrix(X)]:
+        multi = rr.multiresponse.squared_error(design, Y, nstep=10, batch_size=3)
+        sol = multi.main(inner_tol=1.e-12)
+        yield nt.assert_equal, sol['beta'].shape, (p+1, K*10)
+        for k in range(K):
+            lasso = rr.lasso.squared_error(design, Y[:,k], nstep=10)
+            yield np.testing.assert_allclose, sol['lagrange'][k], lasso.lagrange_sequence
+            penalty = rr.mixed_lasso(lasso.penalty_structure, sol['lagrange'][k,-1])
+            problem = rr.simple_problem(rr.squared_error(lasso.Xn, Y[:,k], coef=1./n), penalty)
+            beta = problem.solve(tol=1.e-14, max_its=10000)
+            yield np.testing.assert_allclose, sol['beta'][:,k*10+9].toarray()[:,0], beta, 1.e-4, 1.e-4
+
+    # the joint penalty leaves the intercept unpenalized
+    multi = rr.multiresponse.squared_error(X, Y, joint=True, nstep=10)
+    sol = multi.main(inner_tol=1.e-12)
+    yield np.testing.assert_allclose, sol['lagrange'], sol['lagrange'][:1] * np.ones((K,1))
+    loss = rr.squared_error(tensorize(multi.Xn, K), Y, coef=1./n)
+    penalty = rr.separable((p+1,K), [rr.l1_l2((p,K), lagrange=sol['lagrange'][0,-1])], [np.arange(1,p+1)])
+    beta = rr.simple_problem(loss, penalty).solve(tol=1.e-14, max_its=10000)
+    yield np.testing.assert_allclose, sol['beta'][:,9::10].toarray(), beta, 1.e-4, 1.e-4
+    yield np.testing.assert_equal, sol['df'][:,0], 1
+
+    nt.assert_raises(ValueError, rr.multiresponse.squared_error, X, Y[:,0])
+    nt.assert_raises(ValueError, rr.multiresponse.squared_error, X, Y, joint=True,
+                     penalty_structure=[0]*10 + [1]*10)
+
+def test_elastic_net_grid():
+    n, p = 200, 20
+    X = np.random.standard_normal((n,p))
+    Y = np.random.standard_normal(n) + 2 * X[:,0] + X[:,1]
+    nstep = 10
+
+    grid = rr.elastic_net_grid.squared_error(X, Y, [1., 0.3, 0.6], nstep=nstep)
+    sol = grid.main(inner_tol=1.e-12)
+    yield np.testing.assert_allclose, sol['alpha'], [1., 0.6, 0.3]
+    yield nt.assert_equal, sol['beta'].shape, (p+1, 3*nstep)
+
+    # alpha=1 is the lasso
+    lasso_sol = rr.lasso.squared_error(X, Y, nstep=nstep).main(inner_tol=1.e-12)
+    yield np.testing.assert_allclose, sol['beta'][:,:nstep].toarray(), lasso_sol['beta'].toarray(), 1.e-5, 1.e-5
+
+    # each column solves the elastic net problem of its alpha
+    for i, alpha in enumerate(sol['alpha']):
+        lasso = grid.alpha_lasso(alpha)
+        lagrange = sol['lagrange'][-1]
+        penalty = rr.mixed_lasso(lasso.penalty_structure, lagrange)
+        ridge = rr.quadratic.linear(np.diag(lasso.penalty_structure != rr.UNPENALIZED).astype(np.float),
+                                    coef=lagrange * (1 - alpha) / alpha)
+        problem = rr.simple_problem(rr.smooth_sum([rr.squared_error(lasso.Xn, Y, coef=1./n), ridge]), penalty)
+        beta = problem.solve(tol=1.e-14, max_its=10000)
+        # the path only checks the KKT conditions to within the tolerance
+        # of check_KKT, so the grid is checked with them and its objective
+        beta_grid = sol['beta'][:,(i+1)*nstep-1].toarray()[:,0]
+        lasso.problem
+        lasso.lagrange = lagrange
+        lasso.solution[:] = beta_grid
+        yield nt.assert_false, np.any(lasso.check_KKT(lagrange)[1])
+        yield nt.assert_true, problem.objective(beta_grid) - problem.objective(beta) < 1.e-5
+
+    sol2 = grid.main(nproc=2, inner_tol=1.e-12)
+    yield np.testing.assert_allclose, sol2['beta'].toarray(), sol['beta'].toarray(), 1.e-5, 1.e-5
+
+    nt.assert_raises(ValueError, rr.elastic_net_grid.squared_error, X, Y, [0., 0.5])
+    nt.assert_raises(ValueError, rr.elastic_net_grid.squared_error, X, Y, [0.5],
+                     elastic_net=rr.identity_quadratic(1., 0, 0, 0))
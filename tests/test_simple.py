@@ -1,4 +1,5 @@
 import numpy as np
+from scipy import sparse
 
 import regreg.api as rr
 from regreg.problems.simple import gengrad
@@ -7,6 +8,7 @@ import nose.tools as nt
 from test_seminorms import ac
 
 from copy import copy
+import pickle, tempfile
 
 def test_simple():
     Z = np.random.standard_normal(100) * 4
@@ -56,3 +58,301 @@ def test_simple():
     yield ac, prox_coef, solver2.composite.coefs, 'simple where loss has quadratic 2'
 
 
+
+def test_simple_workspace():
+    X = np.random.standard_normal((100,30))
+    Y = np.random.standard_normal(100)
+
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(30, lagrange=5.))
+    solver = rr.FISTA(problem)
+    hist = solver.fit(tol=1.0e-12, coef_stop=True)
+    coef = solver.composite.coefs.copy()
+
+    problem_ws = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(30, lagrange=5.))
+    coefs_ws = problem_ws.coefs
+    solver_ws = rr.FISTA(problem_ws)
+    hist_ws = solver_ws.fit(tol=1.0e-12, coef_stop=True, workspace=True)
+    workspace = solver_ws.get_workspace(10000)
+
+    # a second fit reuses the same buffers
+    solver_ws.fit(tol=1.0e-12, workspace=True)
+
+    yield ac, coef, problem_ws.coefs, 'workspace fit agrees with default fit'
+    yield nt.assert_equal, hist.shape, hist_ws.shape
+    yield nt.assert_true, problem_ws.coefs is coefs_ws
+    yield nt.assert_true, solver_ws.get_workspace(10000) is workspace
+
+def test_simple_reuse():
+    X = np.random.standard_normal((100,30))
+    Y = np.random.standard_normal(100)
+
+    # ISTA steps start at the accepted coefficients, whose smooth 
+    # objective is known, so each step evaluates it only at its trial points
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(30, lagrange=5.))
+    solver = rr.FISTA(problem)
+    solver.fit(tol=1.0e-12, FISTA=False, instrument=True)
+    record = solver.record
+
+    yield nt.assert_true, record.func_evals <= 2 + record.iterations + record.backtracks
+
+def test_simple_track_image():
+    X = np.random.standard_normal((100,30))
+    Y = np.random.standard_normal(100)
+
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(30, lagrange=5.))
+    coef = problem.solve(tol=1.0e-12).copy()
+
+    problem_tracked = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(30, lagrange=5.))
+    coef_tracked = problem_tracked.solve(tol=1.0e-12, track_image=True, image_refresh=7)
+
+    beta = np.random.standard_normal(30)
+    eta = problem.affine_image(beta)
+    f1, g1 = problem.smooth_objective(beta, 'both')
+    f2, g2 = problem.smooth_objective_image(eta, 'both')
+
+    yield ac, coef, coef_tracked, 'tracking images agrees with default fit'
+    yield ac, f1, f2, 'smooth_objective_image func'
+    yield ac, g1, g2, 'smooth_objective_image grad'
+    yield nt.assert_raises, NotImplementedError, rr.simple_problem.smooth(rr.quadratic(30)).affine_image, beta
+
+def test_simple_proximal_newton():
+    n, p = 300, 40
+    X = np.random.standard_normal((n,p))
+    Y = np.random.binomial(1, 0.5, n)
+
+    problem = rr.simple_problem(rr.logistic_loss(X, Y), rr.l1norm(p, lagrange=0.02))
+    coef = problem.solve(tol=1.0e-14, max_its=5000).copy()
+
+    problem_gram = rr.simple_problem(rr.logistic_loss(X, Y), rr.l1norm(p, lagrange=0.02))
+    coef_gram = problem_gram.solve(solver=rr.proximal_newton, tol=1.0e-12).copy()
+
+    problem_matvec = rr.simple_problem(rr.logistic_loss(X, Y), rr.l1norm(p, lagrange=0.02))
+    coef_matvec = problem_matvec.solve(solver=rr.proximal_newton, tol=1.0e-12, gram=False)
+
+    yield ac, coef, coef_gram, 'proximal_newton with gram matrix agrees with FISTA'
+    yield ac, coef, coef_matvec, 'proximal_newton agrees with FISTA'
+
+    # the Gram matrix of a sparse design is formed without a dense copy
+    problem_sparse = rr.simple_problem(rr.logistic_loss(sparse.csr_matrix(X), Y), rr.l1norm(p, lagrange=0.02))
+    coef_sparse = problem_sparse.solve(solver=rr.proximal_newton, tol=1.0e-12, gram=True)
+    yield ac, coef, coef_sparse, 'proximal_newton with sparse gram matrix agrees with FISTA'
+    yield nt.assert_raises, ValueError, rr.simple_problem(rr.quadratic(p), rr.l1norm(p, lagrange=1)).solve, None, False, rr.proximal_newton
+
+def test_simple_duality_gap():
+    X = np.random.standard_normal((100,30))
+    Y = np.random.standard_normal(100)
+
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(30, lagrange=5.))
+    problem.solve(tol=1.0e-14, max_its=5000)
+    obj = problem.objective(problem.coefs)
+
+    problem.coefs[:] = 0
+    solver = rr.FISTA(problem)
+    solver.fit(gap_tol=1.0e-8, gap_every=5)
+    gap, dual_point = problem.duality_gap(problem.coefs)
+
+    yield nt.assert_true, solver.gap <= 1.0e-8
+    yield ac, gap, solver.gap, 'gap is recorded for final coefficients'
+    yield ac, solver.convergence_params[4], solver.gap, 'gap in convergence_params'
+    yield nt.assert_true, problem.objective(problem.coefs) - obj <= 1.0e-8
+    yield nt.assert_true, np.fabs(np.dot(X.T, dual_point)).max() <= 5. * (1 + 1.0e-10)
+    yield nt.assert_raises, NotImplementedError, rr.simple_problem(rr.logistic_loss(X, Y > 0), rr.l1norm(30, lagrange=1.)).duality_gap, np.zeros(30)
+
+def test_simple_instrument():
+    X = np.random.standard_normal((100,30))
+    Y = np.random.standard_normal(100)
+
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(30, lagrange=5.))
+    solver = rr.FISTA(problem)
+    history = []
+    solver.fit(tol=1.0e-10, instrument=True, 
+               callback=lambda solver, itercount: history.append((itercount, solver.record.prox_calls)))
+    record = solver.record
+    transform = problem.smooth_atom.affine_transform
+
+    yield nt.assert_equal, record.iterations, solver.convergence_params[0]
+    yield nt.assert_equal, [h[0] for h in history], range(1, len(history)+1)
+    yield nt.assert_true, record.prox_calls >= record.iterations
+    yield nt.assert_equal, record.map_calls[transform]['adjoint_map'], record.grad_evals
+    yield nt.assert_true, record.total_time >= record.backtrack_time
+    yield nt.assert_false, 'affine_map' in transform.__dict__
+
+    problem.coefs[:] = 0
+    solver.fit(tol=1.0e-10)
+    yield nt.assert_true, solver.record is None
+
+    def interrupt(solver, itercount):
+        raise KeyboardInterrupt
+    problem.coefs[:] = 0
+    nt.assert_raises(KeyboardInterrupt, solver.fit, instrument=True, callback=interrupt)
+    yield nt.assert_false, 'affine_map' in transform.__dict__
+
+    # a fit inside a callback watches the same transform,
+    # and the outer record keeps counting after it ends
+    inner = rr.FISTA(problem)
+    def nested(solver, itercount):
+        if itercount == 1:
+            inner.fit(max_its=3, min_its=3, instrument=True)
+    problem.coefs[:] = 0
+    solver.fit(max_its=5, min_its=5, instrument=True, callback=nested)
+    yield nt.assert_true, inner.record.map_calls[transform]['adjoint_map'] > 0
+    yield nt.assert_true, (solver.record.map_calls[transform]['adjoint_map'] >=
+                           solver.record.grad_evals + inner.record.grad_evals)
+    yield nt.assert_false, 'affine_map' in transform.__dict__
+
+def test_simple_budget():
+    X = np.random.standard_normal((100,30))
+    Y = np.random.standard_normal(100)
+
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(30, lagrange=5.))
+    obj0 = problem.objective(problem.coefs)
+    budget = rr.fit_budget(evals=30, matvecs=1000)
+    problem.solve(tol=1.0e-14, budget=budget)
+    yield nt.assert_true, problem.truncated
+    yield nt.assert_true, budget.exhausted
+    yield nt.assert_true, problem.objective(problem.coefs) < obj0
+
+    problem.coefs[:] = 0
+    solver = rr.FISTA(problem)
+    solver.fit(tol=1.0e-14, budget=rr.fit_budget(seconds=0))
+    yield nt.assert_true, solver.truncated
+    yield nt.assert_false, solver.converged
+    yield nt.assert_equal, solver.convergence_params[0], 0
+
+    solver.fit(tol=1.0e-8, budget=rr.fit_budget(seconds=1000))
+    yield nt.assert_false, solver.truncated
+    yield nt.assert_true, solver.converged
+
+def test_simple_resume():
+    X = np.random.standard_normal((100,30))
+    Y = np.random.standard_normal(100)
+
+    def problem():
+        return rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(30, lagrange=5.))
+
+    full = problem()
+    history = rr.FISTA(full).fit(tol=1.0e-12)
+
+    partial = problem()
+    solver = rr.FISTA(partial)
+    solver.fit(tol=1.0e-12, max_its=10)
+    state = pickle.loads(pickle.dumps(solver.state))
+    resumed = problem()
+    resumed_history = rr.FISTA(resumed).fit(tol=1.0e-12, state=state)
+
+    state_file = tempfile.NamedTemporaryFile(suffix='.npz')
+    filename = state_file.name
+    checkpoints = []
+    solver = rr.FISTA(problem())
+    solver.fit(tol=1.0e-12, max_its=12, checkpoint=filename, checkpoint_every=4)
+    rr.FISTA(problem()).fit(tol=1.0e-12, max_its=12, checkpoint=checkpoints.append, checkpoint_every=4)
+    loaded = problem()
+    loaded_history = rr.FISTA(loaded).fit(tol=1.0e-12, state=rr.fista_state.load(filename))
+    state_file.close()
+
+    yield nt.assert_equal, [c.itercount for c in checkpoints], [4, 8, 12]
+    yield np.testing.assert_array_equal, full.coefs, resumed.coefs
+    yield np.testing.assert_array_equal, history, resumed_history
+    yield np.testing.assert_array_equal, full.coefs, loaded.coefs
+    yield np.testing.assert_array_equal, history, loaded_history
+
+def test_simple_step_policy():
+    X = np.random.standard_normal((100,30))
+    Y = np.random.binomial(1, 0.5, 100)
+
+    def problem():
+        return rr.simple_problem(rr.logistic_loss(X, Y), rr.l1norm(30, lagrange=2.))
+
+    reference = problem()
+    reference.solve(tol=1.0e-14, max_its=5000)
+
+    for step_policy in ['backtrack', 'bb', 'local']:
+        for restart_policy in ['objective', 'gradient']:
+            P = problem()
+            rr.FISTA(P).fit(tol=1.0e-14, max_its=5000, step_policy=step_policy,
+                            restart_policy=restart_policy)
+            yield ac, P.coefs, reference.coefs, 'step_policy=%s, restart_policy=%s' % (step_policy, restart_policy)
+
+    solver = rr.FISTA(problem())
+    yield nt.assert_raises, ValueError, lambda: solver.fit(step_policy='armijo')
+    yield nt.assert_raises, ValueError, lambda: solver.fit(restart_policy='sometimes')
+
+def test_simple_anderson():
+    X = np.random.standard_normal((100,30))
+    X[:,1:] += X[:,:-1]
+    Y = np.random.standard_normal(100)
+    Yb = np.random.binomial(1, 0.5, 100)
+
+    for name, loss, penalty in [
+        ('lasso', rr.squared_error(X, Y), rr.l1norm(30, lagrange=5.)),
+        ('bound', rr.squared_error(X, Y), rr.l1norm(30, bound=1.)),
+        ('group lasso', rr.squared_error(X, Y), rr.group_lasso(np.arange(30) // 3, lagrange=5.)),
+        ('logistic', rr.logistic_loss(X, Yb), rr.l1norm(30, lagrange=0.05))]:
+        problem = rr.simple_problem(loss, penalty)
+        reference = problem.solve(tol=1.0e-14, max_its=5000).copy()
+        for kwargs in [{}, {'workspace':True}, {'track_image':True}]:
+            problem.coefs[:] = 0
+            solver = rr.FISTA(problem)
+            objective_hist = solver.fit(tol=1.0e-14, max_its=5000, anderson=5, 
+                                        instrument=True, **kwargs)
+            yield ac, problem.coefs, reference, 'anderson: %s %s' % (name, kwargs)
+            # the safeguard keeps the iterates monotone
+            yield nt.assert_true, np.all(np.diff(objective_hist) <= 1.e-10 * np.fabs(objective_hist[:-1]).max())
+            yield nt.assert_true, solver.record.extrapolations > 0
+
+def test_simple_metric():
+    X = np.random.standard_normal((100,30)) * np.exp(np.random.uniform(-2, 2, 30))
+    Y = np.random.standard_normal(100)
+    lagrange = 0.2 * np.fabs(np.dot(X.T, Y)).max()
+    enet = rr.identity_quadratic(0.1, 0, 0, 0)
+
+    for name, loss, penalty in [
+        ('lasso', rr.squared_error(X, Y), rr.l1norm(30, lagrange=lagrange)),
+        ('sparse', rr.squared_error(sparse.csr_matrix(X), Y), rr.l1norm(30, lagrange=lagrange)),
+        ('normalize', rr.squared_error(rr.normalize(X, scale=False), Y), rr.l1norm(30, lagrange=lagrange)),
+        ('elastic net', rr.squared_error(X, Y), rr.l1norm(30, lagrange=lagrange, quadratic=enet)),
+        ('weighted', rr.squared_error(X, Y), rr.weighted_l1norm(30, np.linspace(0.5, 2, 30), lagrange=lagrange)),
+        ('box', rr.squared_error(X, Y), rr.supnorm(30, bound=0.1)),
+        ('weighted box', rr.squared_error(X, Y), rr.weighted_supnorm(30, np.linspace(0.5, 2, 30), bound=0.1))]:
+        problem = rr.simple_problem(loss, penalty)
+        reference = problem.solve(tol=1.0e-14, max_its=20000).copy()
+        for kwargs in [{'metric':'columns'}, 
+                       {'metric':np.ones(30)}, 
+                       {'metric':'columns', 'workspace':True},
+                       {'metric':'columns', 'anderson':5}, 
+                       {'metric':'columns', 'step_policy':'bb'}]:
+            problem.coefs[:] = 0
+            rr.FISTA(problem).fit(tol=1.0e-14, max_its=20000, **kwargs)
+            yield ac, problem.coefs, reference, 'metric: %s %s' % (name, kwargs.keys())
+
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l2norm(30, lagrange=1.))
+    solver = rr.FISTA(problem)
+    yield nt.assert_raises, ValueError, lambda: solver.fit(metric='columns')
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(30, lagrange=1.))
+    solver = rr.FISTA(problem)
+    yield nt.assert_raises, ValueError, lambda: solver.fit(metric='rows')
+    yield nt.assert_raises, ValueError, lambda: solver.fit(metric=np.zeros(30))
+
+def test_simple_float32():
+    X = np.random.standard_normal((100,20))
+    Y = np.random.standard_normal(100)
+    Yb = np.random.binomial(1, 0.5, 100)
+
+    for name, loss, penalty in [
+        ('lasso', lambda X, Y: rr.squared_error(X, Y), rr.l1norm(20, lagrange=5.)),
+        ('bound', lambda X, Y: rr.squared_error(X, Y), rr.l1norm(20, bound=1.)),
+        ('normalize', lambda X, Y: rr.squared_error(rr.normalize(X), Y), rr.l1norm(20, lagrange=5.)),
+        ('group lasso', lambda X, Y: rr.squared_error(X, Y), rr.group_lasso(np.arange(20) // 4, lagrange=5.)),
+        ('mixed lasso', lambda X, Y: rr.squared_error(X, Y), rr.mixed_lasso(np.arange(20) // 4, 5.)),
+        ('logistic', lambda X, Y: rr.logistic_loss(X, Yb), rr.l1norm(20, lagrange=2.))]:
+        solutions = []
+        for dtype in [np.float64, np.float32]:
+            problem = rr.simple_problem(loss(X.astype(dtype), Y.astype(dtype)), penalty)
+            problem.coefs[:] = 0
+            solver = rr.FISTA(problem)
+            solver.fit(tol=1.0e-10, max_its=2000)
+            yield nt.assert_equal, problem.coefs.dtype, dtype
+            yield nt.assert_equal, problem.smooth_objective(problem.coefs, 'grad').dtype, dtype
+            solutions.append(problem.coefs)
+        yield (np.testing.assert_allclose, solutions[1], solutions[0], 1.e-3, 
+               1.e-3 * np.linalg.norm(solutions[0]), 'float32 %s' % name)
@@ -29,3 +29,13 @@ def test_quadratic():
                                    c1.smooth_objective(ww, 'func') + 
                                    c1.nonsmooth_objective(ww))
 
+
+def test_quadratic_conjugate_value():
+    # the Fenchel-Young equality at the gradient
+    x = np.random.standard_normal(5)
+    offset = np.random.standard_normal(5)
+    for l in [rr.quadratic(5, coef=3., offset=offset),
+              rr.quadratic(5, coef=3., offset=offset, Q=np.arange(1,6), Qdiag=True),
+              rr.quadratic(5, coef=3., offset=offset, Q=np.identity(5) + np.ones((5,5)))]:
+        f, g = l.smooth_objective(x, 'both')
+        np.testing.assert_almost_equal(l.conjugate_value(g), (g * x).sum() - f)
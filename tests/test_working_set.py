@@ -0,0 +1,66 @@
+import numpy as np
+import regreg.api as rr
+import regreg.atoms.mixed_lasso as ml
+import nose.tools as nt
+from scipy import sparse
+
+from test_seminorms import ac
+
+def compare(loss, penalty):
+    problem = rr.simple_problem(loss, penalty)
+    coef_fista = problem.solve(tol=1.e-14, max_its=10000).copy()
+    obj_fista = problem.objective(coef_fista)
+    problem.coefs[:] = 0
+    coef_ws = problem.solve(solver=rr.working_set, tol=1.e-14, kkt_tol=1.e-6,
+                            start_size=5, max_its=10000)
+    return coef_fista, coef_ws.copy(), obj_fista, problem.objective(coef_ws)
+
+def test_working_set():
+    n, p = 50, 100
+    X = np.random.standard_normal((n, p))
+    X[:,0] = 1
+    Y = np.random.standard_normal(n)
+
+    penalty_structure = ml.L1_PENALTY * np.ones(p, np.int)
+    penalty_structure[:3] = ml.UNPENALIZED
+    penalty_structure[3:5] = ml.POSITIVE_PART
+    penalty_structure[5:7] = ml.NONNEGATIVE
+    penalty_structure[7:15] = np.arange(8) // 4
+
+    enet = rr.identity_quadratic(0.5, 0, 0, 0)
+
+    for name, loss, penalty in [
+        ('lasso', rr.squared_error(X, Y), rr.l1norm(p, lagrange=5.)),
+        ('elastic net', rr.squared_error(X, Y), rr.l1norm(p, lagrange=5., quadratic=enet)),
+        ('sparse', rr.squared_error(sparse.csr_matrix(X), Y), rr.l1norm(p, lagrange=5.)),
+        ('normalize', rr.squared_error(rr.normalize(X, intercept_column=0), Y), rr.l1norm(p, lagrange=15.)),
+        ('weighted', rr.squared_error(X, Y), rr.weighted_l1norm(p, np.linspace(0.5, 2, p), lagrange=5.)),
+        ('logistic', rr.logistic_loss(X, (Y > 0).astype(np.float)), rr.l1norm(p, lagrange=3.)),
+        ('group lasso', rr.squared_error(X, Y), rr.group_lasso(np.arange(p) // 3, lagrange=10.)),
+        ('mixed lasso', rr.squared_error(X, Y), rr.mixed_lasso(penalty_structure, 5.))]:
+        coef_fista, coef_ws, obj_fista, obj_ws = compare(loss, penalty)
+        yield ac, coef_fista, coef_ws, 'working set agrees with FISTA: %s' % name
+        yield nt.assert_true, obj_ws <= obj_fista + 1.e-6 * max(1, np.fabs(obj_fista))
+
+def test_working_set_size():
+    n, p = 100, 2000
+    X = np.random.standard_normal((n, p))
+    beta = np.zeros(p); beta[:5] = 3
+    Y = np.dot(X, beta) + np.random.standard_normal(n)
+    lagrange = 0.5 * np.fabs(np.dot(X.T, Y)).max()
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(p, lagrange=lagrange))
+    solver = rr.working_set(problem)
+    solver.fit(tol=1.e-12)
+    yield nt.assert_true, solver.converged
+    yield nt.assert_true, solver.working_set.shape[0] < p / 10
+    yield nt.assert_true, set(np.nonzero(problem.coefs)[0]).issubset(solver.working_set)
+
+def test_working_set_errors():
+    X = np.random.standard_normal((20, 5))
+    Y = np.random.standard_normal(20)
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.l1norm(5, bound=1.))
+    yield nt.assert_raises, ValueError, rr.working_set, problem
+    problem = rr.simple_problem(rr.squared_error(X, Y), rr.supnorm(5, lagrange=1.))
+    yield nt.assert_raises, ValueError, rr.working_set, problem
+    problem = rr.simple_problem(rr.quadratic((5,), coef=1.), rr.l1norm(5, lagrange=1.))
+    yield nt.assert_raises, ValueError, rr.working_set, problem